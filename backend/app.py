@@ -1,7 +1,8 @@
 # Import necessary libraries
 import sys
 import os
-from flask import Flask, request, jsonify, send_from_directory
+import json
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 
@@ -15,7 +16,7 @@ print(f"sys.path after append: {sys.path}")
 
 # Import the process_query function from rag_openAI
 try:
-    from rag_openAI import process_query
+    from rag_openAI import process_query, process_query_stream, get_metrics
     print("Successfully imported process_query from rag_openAI")
 except ImportError as e:
     print(f"Failed to import process_query from rag_openAI: {e}")
@@ -23,6 +24,12 @@ except ImportError as e:
 # Load environment variables from .env file
 load_dotenv()
 
+# Optionally route /api/query through the asyncio pipeline (AsyncOpenAI + asyncpg)
+use_async_pipeline = os.environ.get("ASYNC_PIPELINE", "false").lower() in ("1", "true", "yes")
+if use_async_pipeline:
+    from rag_async import run_query_in_background_loop
+    print("Using the async query pipeline")
+
 # Debug prints to show current environment
 print(f"Current working directory: {os.getcwd()}")
 print(f"Contents of current directory: {os.listdir('.')}")
@@ -45,12 +52,46 @@ def handle_query():
     data = request.json
     query = data['query']
     try:
-        result = process_query(query)
+        if use_async_pipeline:
+            result = run_query_in_background_loop(query)
+        else:
+            result = process_query(query)
         return jsonify(result)
     except Exception as e:
         print(f"Error processing query: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def format_sse(event, payload):
+    """
+    Format one Server-Sent Events message
+    """
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+@app.route('/api/query/stream', methods=['GET', 'POST'])
+def handle_query_stream():
+    """
+    Handle requests to /api/query/stream
+    Stream Server-Sent Events as each pipeline stage finishes: intent, sql,
+    results, answer (one event per token fragment) and finally done
+    """
+    query = request.args.get('query') if request.method == 'GET' else request.json['query']
+    if not query:
+        return jsonify({"error": "Missing query"}), 400
+
+    def event_stream():
+        try:
+            for event, payload in process_query_stream(query):
+                yield format_sse(event, payload)
+        except Exception as e:
+            print(f"Error streaming query: {str(e)}")
+            yield format_sse("error", {"error": str(e)})
+
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
@@ -75,6 +116,13 @@ def health_check():
     """
     return jsonify({"status": "healthy"}), 200
 
+@app.route('/api/metrics')
+def metrics():
+    """
+    Metrics endpoint exposing cache and pipeline counters
+    """
+    return jsonify(get_metrics()), 200
+
 if __name__ == '__main__':
     # Run the Flask app
     port = int(os.environ.get('PORT', 5000))
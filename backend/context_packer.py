@@ -0,0 +1,206 @@
+import os
+import re
+import json
+import logging
+import threading
+
+from tabulate import tabulate
+from typing import Dict, Any, List
+from simplified_hockey_stats_schema import simplified_hockey_stats_schema
+
+# tiktoken is optional; without it tokens are estimated from character counts
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding(os.environ.get("TOKEN_ENCODING", "o200k_base"))
+except Exception:
+    _encoding = None
+
+# Token budget per prompt section (configured with PROMPT_BUDGET_* environment variables)
+section_budgets = {
+    "schema": int(os.environ.get("PROMPT_BUDGET_SCHEMA", 800)),
+    "history": int(os.environ.get("PROMPT_BUDGET_HISTORY", 600)),
+    "results": int(os.environ.get("PROMPT_BUDGET_RESULTS", 1500)),
+    "instructions": int(os.environ.get("PROMPT_BUDGET_INSTRUCTIONS", 1000))
+}
+
+# Columns that identify a row and are always kept in the schema section
+KEY_COLUMNS = {
+    "name", "team", "season", "situation", "position", "games_played", "icetime",
+    "player_id", "playerId", "lineId", "gameid", "opposingteam", "gamedate", "playoffgame"
+}
+
+# Query words that map onto column names (or their last "_" segment) used in the database
+QUERY_SYNONYMS = {
+    "point": ["points", "goals", "primaryassists", "secondaryassists"],
+    "goal": ["goals"],
+    "assist": ["primaryassists", "secondaryassists"],
+    "save": ["goals", "ongoal", "xgoals"],
+    "sv": ["goals", "ongoal"],
+    "gaa": ["goals", "icetime"],
+    "pim": ["penalityminutes", "penalties"],
+    "penalty": ["penalityminutes", "penalties", "penaltiesdrawn"],
+    "xg": ["xgoals"],
+    "expected": ["xgoals", "xongoal"],
+    "shot": ["shotsongoal", "shotattempts", "ongoal"],
+    "block": ["shotsblockedbyplayer", "blockedshotattempts"],
+    "faceoff": ["faceoffswon", "faceoffslost"],
+    "toi": ["icetime"],
+    "time": ["icetime"],
+    "win": ["goalsfor", "goalsagainst"],
+    "record": ["goalsfor", "goalsagainst"],
+    "hit": ["hits"],
+    "danger": ["highdangershots", "highdangergoals", "highdangerxgoals"]
+}
+
+# Running totals of tokens before and after packing, per section
+packer_metrics: Dict[str, Dict[str, int]] = {}
+packer_lock = threading.Lock()
+
+
+# Count tokens locally, falling back to a characters-per-token estimate
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return max(1, len(text) // 4)
+
+# Log and accumulate the tokens saved by packing one prompt section
+def record_packing(stage: str, section: str, tokens_before: int, tokens_after: int) -> None:
+    with packer_lock:
+        entry = packer_metrics.setdefault(section, {"calls": 0, "tokens_before": 0, "tokens_after": 0})
+        entry["calls"] += 1
+        entry["tokens_before"] += tokens_before
+        entry["tokens_after"] += tokens_after
+    if tokens_before != tokens_after:
+        logging.debug(f"[{stage}] {section} packed from {tokens_before} to {tokens_after} tokens "
+                      f"(saved {tokens_before - tokens_after})")
+
+# Report token savings per section for the metrics endpoint
+def get_packer_stats() -> Dict[str, Any]:
+    with packer_lock:
+        stats = {
+            section: {**entry, "tokens_saved": entry["tokens_before"] - entry["tokens_after"]}
+            for section, entry in packer_metrics.items()
+        }
+    return {"tokenizer": "tiktoken" if _encoding is not None else "estimate", "budgets": section_budgets, "sections": stats}
+
+# Split a text or identifier into lower-case singular word stems
+def _stems(text: str) -> List[str]:
+    words = re.sub(r'([a-z])([A-Z])', r'\1 \2', text)
+    words = re.split(r'[^A-Za-z0-9%]+', words.lower())
+    return [word[:-1] if len(word) > 3 and word.endswith("s") else word for word in words if word]
+
+# Score how relevant a column is to the query words
+def _column_score(table: str, column: str, query_stems: List[str]) -> int:
+    column_key = column.lower()
+    description = simplified_hockey_stats_schema.get(table, {}).get(column, "")
+    column_stems = set(_stems(column) + _stems(description))
+
+    score = 0
+    for stem in query_stems:
+        if stem in column_stems:
+            score += 2
+        elif len(stem) > 3 and stem in column_key:
+            score += 1
+        for fragment in QUERY_SYNONYMS.get(stem, []):
+            if column_key == fragment or column_key.endswith("_" + fragment):
+                score += 3
+    return score
+
+# Keep the key columns plus the columns most relevant to the query, within the schema budget
+def pack_schema_columns(required_columns: Dict[str, List[str]], query: str, stage: str,
+                        budget: int = None) -> Dict[str, List[str]]:
+    budget = section_budgets["schema"] if budget is None else budget
+    if not required_columns:
+        return required_columns
+
+    tokens_before = count_tokens(json.dumps(required_columns, indent=2))
+    if tokens_before <= budget:
+        record_packing(stage, "schema", tokens_before, tokens_before)
+        return required_columns
+
+    query_stems = _stems(query)
+    table_budget = budget // len(required_columns)
+    packed = {}
+    for table, columns in required_columns.items():
+        keys = [column for column in columns if column in KEY_COLUMNS]
+        ranked = sorted(
+            (column for column in columns if column not in KEY_COLUMNS),
+            key=lambda column: -_column_score(table, column, query_stems)
+        )
+        kept = list(keys)
+        used = count_tokens(json.dumps({table: kept}, indent=2))
+        for column in ranked:
+            cost = count_tokens(column) + 3
+            if used + cost > table_budget:
+                break
+            kept.append(column)
+            used += cost
+        # Preserve the schema order so related columns stay together
+        packed[table] = [column for column in columns if column in kept]
+
+    record_packing(stage, "schema", tokens_before, count_tokens(json.dumps(packed, indent=2)))
+    return packed
+
+# Fit the chat history into the budget, shortening the oldest answers first
+def pack_history(exchanges: List[Dict[str, str]], stage: str, budget: int = None,
+                 min_answer_chars: int = 80) -> List[Dict[str, str]]:
+    budget = section_budgets["history"] if budget is None else budget
+    packed = [dict(exchange) for exchange in exchanges]
+
+    def history_tokens() -> int:
+        return sum(count_tokens(exchange["query"]) + count_tokens(exchange["response"]) for exchange in packed)
+
+    tokens_before = history_tokens()
+    for exchange in packed:
+        if history_tokens() <= budget:
+            break
+        overflow_chars = (history_tokens() - budget) * 4
+        keep_chars = max(min_answer_chars, len(exchange["response"]) - overflow_chars)
+        if keep_chars < len(exchange["response"]):
+            exchange["response"] = exchange["response"][:keep_chars].rstrip() + "..."
+
+    # Drop whole exchanges, oldest first, if shortened answers still do not fit
+    while len(packed) > 1 and history_tokens() > budget:
+        packed.pop(0)
+
+    record_packing(stage, "history", tokens_before, history_tokens())
+    return packed
+
+# Render query results as a table that fits the budget, dropping trailing rows if needed
+def pack_result_table(query_result: List[Dict[str, Any]], stage: str, budget: int = None) -> str:
+    budget = section_budgets["results"] if budget is None else budget
+
+    def render(rows: List[Dict[str, Any]], tablefmt: str) -> str:
+        headers = rows[0].keys()
+        return tabulate([list(row.values()) for row in rows], headers=headers, tablefmt=tablefmt,
+                        numalign="right", stralign="left",
+                        colalign=("left",) + ("right",) * (len(headers) - 1),
+                        maxcolwidths=[None] + [20] * (len(headers) - 1),
+                        floatfmt=".2f")
+
+    table = render(query_result, "fancy_grid")
+    tokens_before = count_tokens(table)
+    if tokens_before <= budget:
+        record_packing(stage, "results", tokens_before, tokens_before)
+        return table
+
+    # A plain pipe table carries the same data with far fewer tokens than box drawing characters
+    table = render(query_result, "pipe")
+    row_count = len(query_result)
+    while count_tokens(table) > budget and row_count > 1:
+        row_count = max(1, int(row_count * budget / count_tokens(table)) - 1)
+        table = render(query_result[:row_count], "pipe")
+    if row_count < len(query_result):
+        table += f"\n({len(query_result) - row_count} more rows omitted)"
+
+    record_packing(stage, "results", tokens_before, count_tokens(table))
+    return table
+
+# Measure the fixed instruction text of a prompt and warn when it exceeds its budget
+def check_instructions(instructions: str, stage: str) -> None:
+    tokens = count_tokens(instructions)
+    record_packing(stage, "instructions", tokens, tokens)
+    if tokens > section_budgets["instructions"]:
+        logging.warning(f"[{stage}] instructions use {tokens} tokens, over the budget of {section_budgets['instructions']}")
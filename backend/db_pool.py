@@ -0,0 +1,314 @@
+import os
+import time
+import logging
+import threading
+
+import psycopg2
+
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, List, Callable, Iterator
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+
+
+# Raised when no connection becomes available within the checkout timeout
+class PoolTimeoutError(psycopg2.OperationalError):
+    pass
+
+
+# Thread-safe psycopg2 connection pool with health checks on checkout and per-connection session settings.
+# With pgbouncer=True (transaction pooling) nothing is set on the session: every checkout runs in one transaction
+# that carries the read-only flag and a SET LOCAL statement_timeout, and ends with a rollback on return.
+class PostgresPool:
+    def __init__(self, db_params: Dict[str, Any], min_size: int = 1, max_size: int = 10, checkout_timeout: float = 5.0,
+                 autocommit: bool = True, read_only: bool = True, statement_timeout_ms: int = 10000,
+                 health_check_seconds: float = 30.0, max_idle_seconds: float = 300.0, pgbouncer: bool = False):
+        self.db_params = db_params
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.checkout_timeout = checkout_timeout
+        # Transaction pooling needs transaction-scoped settings, so it never uses autocommit
+        self.autocommit = autocommit and not pgbouncer
+        self.read_only = read_only
+        self.statement_timeout_ms = statement_timeout_ms
+        self.health_check_seconds = health_check_seconds
+        self.max_idle_seconds = max_idle_seconds
+        self.pgbouncer = pgbouncer
+
+        self._close_listeners: List[Callable[[Any], None]] = []
+        self._reset_state()
+        self._metrics = {"checkouts": 0, "waits": 0, "timeouts": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0,
+                         "created": 0, "closed": 0, "health_checks": 0, "health_failures": 0, "forks": 0}
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset_state(self) -> None:
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._idle: deque = deque()
+        self._size = 0
+        self._in_use = 0
+        self._dirty: set = set()
+        # Autocommit connections switched to a transaction for the current checkout
+        self._transactional: set = set()
+        # Connections inherited from the parent process. They share its sockets, so they are never used or
+        # closed here, and stay referenced so garbage collection never sends a Terminate on the parent's behalf.
+        self._inherited: List[Any] = []
+
+    # After a fork (gunicorn --preload), the child starts with an empty pool of its own
+    def _after_fork(self) -> None:
+        inherited = [conn for conn, _ in self._idle] + getattr(self, "_inherited", [])
+        self._reset_state()
+        self._inherited = inherited
+        self._metrics["forks"] += 1
+
+    def _check_pid(self) -> None:
+        if self._pid != os.getpid():
+            self._after_fork()
+
+    # Call listener(conn) whenever a pooled connection is closed, for caches keyed by connection
+    def add_close_listener(self, listener: Callable[[Any], None]) -> None:
+        self._close_listeners.append(listener)
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.db_params)
+        try:
+            conn.set_session(readonly=self.read_only, autocommit=self.autocommit)
+            if not self.pgbouncer and self.statement_timeout_ms:
+                self._set_session_timeout(conn, self.statement_timeout_ms)
+        except psycopg2.Error:
+            conn.close()
+            raise
+        with self._cond:
+            self._metrics["created"] += 1
+        return conn
+
+    # Set statement_timeout for the session; outside autocommit the SET is committed so a later rollback keeps it
+    # and the connection is not left idle in a transaction
+    def _set_session_timeout(self, conn, timeout_ms: int) -> None:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SET statement_timeout = {int(timeout_ms)}")
+        if not conn.autocommit:
+            conn.commit()
+
+    def _close(self, conn) -> None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        for listener in self._close_listeners:
+            listener(conn)
+        with self._cond:
+            self._size -= 1
+            self._dirty.discard(id(conn))
+            self._transactional.discard(id(conn))
+            self._metrics["closed"] += 1
+            self._cond.notify()
+
+    # Cheap liveness check for a connection that sat idle longer than health_check_seconds
+    def _healthy(self, conn, idle_seconds: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_seconds < self.health_check_seconds:
+            return True
+        with self._cond:
+            self._metrics["health_checks"] += 1
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            if not self.autocommit:
+                conn.rollback()
+            return True
+        except psycopg2.Error:
+            with self._cond:
+                self._metrics["health_failures"] += 1
+            return False
+
+    # Start the transaction of a checkout in transaction pooling mode
+    def _begin(self, conn) -> None:
+        if self.pgbouncer and self.statement_timeout_ms:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SET LOCAL statement_timeout = {int(self.statement_timeout_ms)}")
+
+    # Check out a connection, waiting up to checkout_timeout when the pool is at max_size
+    def getconn(self):
+        self._check_pid()
+        start = time.perf_counter()
+        deadline = start + self.checkout_timeout
+        waited = False
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self._metrics["timeouts"] += 1
+                        raise PoolTimeoutError(f"No database connection available within {self.checkout_timeout}s "
+                                               f"(pool max_size {self.max_size})")
+                    waited = True
+                    self._cond.wait(remaining)
+
+            fresh = conn is None
+            if fresh:
+                try:
+                    conn = self._connect()
+                except psycopg2.Error:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._healthy(conn, time.monotonic() - last_used):
+                self._close(conn)
+                continue
+
+            try:
+                self._begin(conn)
+            except psycopg2.Error:
+                self._close(conn)
+                if fresh:
+                    raise
+                continue
+
+            wait_seconds = time.perf_counter() - start
+            with self._cond:
+                self._in_use += 1
+                self._metrics["checkouts"] += 1
+                self._metrics["total_wait_seconds"] += wait_seconds
+                self._metrics["max_wait_seconds"] = max(self._metrics["max_wait_seconds"], wait_seconds)
+                self._metrics["waits"] += waited
+            return conn
+
+    # Return a connection: open transactions are rolled back, overridden settings restored, broken connections closed
+    def putconn(self, conn, discard: bool = False) -> None:
+        if self._pid != os.getpid():
+            self._inherited.append(conn)
+            return
+        with self._cond:
+            self._in_use -= 1
+            dirty = id(conn) in self._dirty
+            self._dirty.discard(id(conn))
+            transactional = id(conn) in self._transactional
+            self._transactional.discard(id(conn))
+
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if transactional:
+                    conn.autocommit = True
+                if dirty and not self.pgbouncer:
+                    self._set_session_timeout(conn, self.statement_timeout_ms or 0)
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed or conn.info.transaction_status == TRANSACTION_STATUS_UNKNOWN:
+            self._close(conn)
+            return
+
+        now = time.monotonic()
+        stale = []
+        with self._cond:
+            self._idle.append((conn, now))
+            # Connections idle for longer than max_idle_seconds are closed down to min_size
+            while (len(self._idle) > 1 and self._size - len(stale) > self.min_size
+                   and now - self._idle[0][1] > self.max_idle_seconds):
+                stale.append(self._idle.popleft()[0])
+            self._cond.notify()
+        for idle_conn in stale:
+            self._close(idle_conn)
+
+    # Context manager checking a connection out and returning it; the connection is discarded after a connection error
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    # Override statement_timeout for the rest of a checkout (SET LOCAL under transaction pooling)
+    def set_statement_timeout(self, cursor, timeout_ms: int) -> None:
+        if self.pgbouncer:
+            cursor.execute(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+            return
+        cursor.execute(f"SET statement_timeout = {int(timeout_ms)}")
+        with self._cond:
+            self._dirty.add(id(cursor.connection))
+
+    # Run the rest of a checkout in a transaction, which named (server-side) cursors need.
+    # An autocommit connection switches back when it is returned.
+    def use_transaction(self, conn) -> None:
+        if not conn.autocommit:
+            return
+        conn.autocommit = False
+        with self._cond:
+            self._transactional.add(id(conn))
+
+    # Make a connection usable again after a failed statement; outside autocommit this rolls back the transaction
+    # and restores the checkout's transaction settings, which also drops any earlier set_statement_timeout
+    def recover(self, conn) -> None:
+        if conn.autocommit or conn.info.transaction_status == TRANSACTION_STATUS_IDLE:
+            return
+        conn.rollback()
+        self._begin(conn)
+
+    # Connect min_size connections ahead of the first request; failures are left to the first checkout
+    def warm(self) -> None:
+        self._check_pid()
+        connections = []
+        try:
+            for _ in range(max(0, self.min_size - self._size)):
+                connections.append(self.getconn())
+        except psycopg2.Error as e:
+            logging.error(f"Unable to warm the database pool: {str(e)}")
+        for conn in connections:
+            self.putconn(conn)
+
+    # Close every idle connection, for example at shutdown
+    def close_all(self) -> None:
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            checkouts = self._metrics["checkouts"]
+            return {
+                **self._metrics,
+                "avg_wait_ms": round(self._metrics["total_wait_seconds"] * 1000 / checkouts, 3) if checkouts else 0.0,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "autocommit": self.autocommit,
+                "read_only": self.read_only,
+                "pgbouncer": self.pgbouncer
+            }
+
+
+# Build the pool from DB_POOL_* and related environment variables
+def db_pool_from_env(db_params: Dict[str, Any]) -> PostgresPool:
+    return PostgresPool(
+        db_params,
+        min_size=int(os.environ.get("DB_POOL_MIN", 1)),
+        max_size=int(os.environ.get("DB_POOL_MAX", 10)),
+        checkout_timeout=float(os.environ.get("DB_POOL_TIMEOUT", 5)),
+        autocommit=os.environ.get("DB_AUTOCOMMIT", "true").lower() in ("1", "true", "yes"),
+        read_only=os.environ.get("DB_READ_ONLY", "true").lower() in ("1", "true", "yes"),
+        statement_timeout_ms=int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", os.environ.get("SQL_STATEMENT_TIMEOUT_MS", 10000))),
+        health_check_seconds=float(os.environ.get("DB_POOL_HEALTH_CHECK_SECONDS", 30)),
+        max_idle_seconds=float(os.environ.get("DB_POOL_MAX_IDLE_SECONDS", 300)),
+        pgbouncer=os.environ.get("DB_PGBOUNCER", "false").lower() in ("1", "true", "yes")
+    )
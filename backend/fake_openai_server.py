@@ -0,0 +1,141 @@
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any
+
+# Stage-aware canned responses shared with the in-process fake provider
+from llm_providers import fake_completion
+
+
+# Minimal OpenAI-compatible /v1/chat/completions endpoint that injects latency and errors
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings: Dict[str, Any] = {}
+    counters = {"requests": 0, "errors": 0, "rate_limited": 0, "slow": 0}
+    counters_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        if self.settings.get("verbose"):
+            super().log_message(format, *args)
+
+    def _count(self, counter: str) -> None:
+        with self.counters_lock:
+            self.counters[counter] += 1
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Pick a latency: the normal distribution most of the time, a long tail for a fraction of requests
+    def _latency(self) -> float:
+        settings = self.settings
+        if random.random() < settings["tail_rate"]:
+            self._count("slow")
+            return settings["tail_latency_ms"] / 1000
+        return max(0.0, random.gauss(settings["latency_ms"], settings["latency_jitter_ms"])) / 1000
+
+    def _content(self, request: Dict[str, Any]) -> str:
+        return fake_completion(request.get("messages", []), request.get("response_format"))
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with self.counters_lock:
+                self._send_json(200, dict(self.counters))
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self._count("requests")
+
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        time.sleep(self._latency())
+
+        roll = random.random()
+        if roll < self.settings["rate_limit_rate"]:
+            self._count("rate_limited")
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                            {"Retry-After": str(self.settings["retry_after"])})
+            return
+        if roll < self.settings["rate_limit_rate"] + self.settings["error_rate"]:
+            self._count("errors")
+            self._send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+            return
+
+        content = self._content(request)
+        model = request.get("model", "fake-model")
+        if request.get("stream"):
+            self._stream(model, content)
+            return
+
+        self._send_json(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": len(content.split()), "total_tokens": 10 + len(content.split())}
+        })
+
+    # Send the content word by word as server-sent events, like the real streaming API
+    def _stream(self, model: str, content: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for word in content.split(" "):
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server for testing timeouts, retries and hedging. "
+                                                 "Run the backend with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=200, help="Mean latency of a normal response")
+    parser.add_argument("--latency-jitter-ms", type=float, default=50)
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="Fraction of requests that take --tail-latency-ms")
+    parser.add_argument("--tail-latency-ms", type=float, default=5000)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After seconds sent with 429 responses")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    FakeOpenAIHandler.settings = vars(args)
+    server = ThreadingHTTPServer((args.host, args.port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    print(f"Fake OpenAI server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import os
+import re
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import threading
+
+from typing import Dict, Any, List, Optional, Tuple
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+# Hand-written examples the feature weights were tuned on
+TUNING_LABELS_PATH = os.path.join(DATA_DIR, "history_labels.jsonl")
+# Examples written separately and never used for tuning; the classifier is scored on these
+HOLDOUT_LABELS_PATH = os.path.join(DATA_DIR, "history_holdout.jsonl")
+
+_log_lock = threading.Lock()
+
+# Probability above which (or below one minus which) the local decision is trusted
+DEFAULT_THRESHOLD = float(os.environ.get("HISTORY_CLASSIFIER_THRESHOLD", 0.8))
+
+PERSONAL_PRONOUNS = {"he", "him", "his", "she", "her", "hers"}
+
+PRONOUNS = PERSONAL_PRONOUNS | {"they", "them", "their", "it", "its", "that", "those", "these", "this", "there"}
+
+FOLLOW_UP_PHRASES = [
+    "what about", "how about", "and him", "and her", "and them", "same for", "same thing",
+    "the same", "what else", "anything else", "compared to that", "instead", "as well",
+    "the other", "that season", "that year", "those seasons", "the previous", "last one",
+    "more about", "tell me more", "why is that", "how come", "and in", "and for", "what if",
+    "who else", "had more"
+]
+
+LEADING_CONJUNCTIONS = {"and", "also", "or", "but", "so", "then", "plus"}
+
+STAT_WORDS = {"goal", "goals", "point", "points", "assist", "assists", "save", "saves", "stats",
+              "shots", "shot", "pim", "penalties", "hits", "faceoffs", "xg", "corsi", "fenwick",
+              "record", "wins", "games", "toi", "percentage", "playoffs", "season", "career"}
+
+TEAM_ABBREVIATIONS = {
+    "ANA", "ARI", "BOS", "BUF", "CAR", "CBJ", "CGY", "CHI", "COL", "DAL", "DET", "EDM", "FLA",
+    "LAK", "MIN", "MTL", "NJD", "NSH", "NYI", "NYR", "OTT", "PHI", "PIT", "SEA", "SJS", "STL",
+    "TBL", "TOR", "UTA", "VAN", "VGK", "WPG", "WSH", "ATL", "PHX"
+}
+
+TEAM_NAMES = {
+    "ducks", "coyotes", "bruins", "sabres", "hurricanes", "canes", "blue jackets", "flames",
+    "blackhawks", "avalanche", "stars", "red wings", "oilers", "panthers", "kings", "wild",
+    "canadiens", "habs", "devils", "predators", "islanders", "rangers", "senators", "flyers",
+    "penguins", "kraken", "blues", "sharks", "lightning", "maple leafs", "leafs", "canucks",
+    "golden knights", "jets", "capitals", "thrashers", "nhl", "stanley cup"
+}
+
+SEASON_PATTERN = re.compile(r'\b(19|20)\d{2}(\s*[-/]\s*\d{2,4})?\b')
+
+
+# Check whether the query names a player, team or season on its own
+def has_explicit_entity(query: str) -> bool:
+    if SEASON_PATTERN.search(query):
+        return True
+
+    words = re.findall(r"[A-Za-z][A-Za-z'\.-]*", query)
+    if any(word in TEAM_ABBREVIATIONS for word in words):
+        return True
+
+    lowered = query.lower()
+    if any(re.search(rf'\b{re.escape(name)}\b', lowered) for name in TEAM_NAMES):
+        return True
+
+    # Capitalised words after the first one are usually player names
+    return any(word[0].isupper() and word.lower() not in PRONOUNS and word != "I" for word in words[1:])
+
+# Extract the lexical features used by the classifier
+def extract_features(query: str) -> Dict[str, Any]:
+    lowered = query.lower().strip()
+    words = re.findall(r"[a-z0-9']+", lowered)
+
+    return {
+        "word_count": len(words),
+        "pronouns": sorted(set(words) & PRONOUNS),
+        "follow_up_phrases": [phrase for phrase in FOLLOW_UP_PHRASES if re.search(rf'\b{re.escape(phrase)}\b', lowered)],
+        "leading_conjunction": bool(words) and words[0] in LEADING_CONJUNCTIONS,
+        "ellipsis": lowered.startswith("...") or lowered.endswith("...") or lowered.endswith("…"),
+        "stat_words": bool(set(words) & STAT_WORDS),
+        "has_entity": has_explicit_entity(query)
+    }
+
+# Turn the features into a probability that the query depends on earlier conversation
+def history_probability(features: Dict[str, Any]) -> float:
+    score = -1.0
+
+    personal_reference = bool(set(features["pronouns"]) & PERSONAL_PRONOUNS)
+    if personal_reference:
+        score += 2.5
+    elif features["pronouns"]:
+        score += 0.5 if features["has_entity"] else 2.0
+    if features["follow_up_phrases"]:
+        score += 3.0
+    if features["leading_conjunction"]:
+        score += 2.5
+    if features["ellipsis"]:
+        score += 2.0
+    if not features["has_entity"]:
+        if features["word_count"] <= 4:
+            score += 1.5
+        if features["stat_words"]:
+            score += 1.5
+    elif features["follow_up_phrases"] or personal_reference:
+        # A named entity in a follow-up is usually the new subject of the same question
+        score -= 0.5
+    else:
+        score -= 2.0
+    if features["word_count"] >= 8 and not features["pronouns"] and not features["follow_up_phrases"]:
+        score -= 1.0
+
+    return 1 / (1 + math.exp(-score))
+
+# Decide locally whether a query needs history; returns (decision or None if ambiguous, confidence)
+def classify_history_need(query: str, history: List[Dict[str, str]],
+                          threshold: float = DEFAULT_THRESHOLD) -> Tuple[Optional[bool], float]:
+    if not history:
+        return False, 1.0
+
+    probability = history_probability(extract_features(query))
+    confidence = max(probability, 1 - probability)
+    if probability >= threshold:
+        return True, confidence
+    if probability <= 1 - threshold:
+        return False, confidence
+    return None, confidence
+
+# Append one LLM-labelled history check to a JSONL file that evaluate() reads as a labelled set.
+# local_decision is what the classifier decided for the same query (None when it deferred to the LLM).
+def log_history_decision(path: str, query: str, history: List[Dict[str, str]], requires_history: bool,
+                         local_decision: Optional[bool]) -> None:
+    record = {
+        "query": query,
+        "history": history,
+        "requires_history": requires_history,
+        "local_decision": local_decision,
+        "logged_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+    try:
+        with _log_lock, open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        logging.error(f"Unable to write history decision log {path}: {str(e)}")
+
+# Measure coverage and error rates of the classifier on a labelled JSONL file
+def evaluate(path: str, threshold: float = DEFAULT_THRESHOLD) -> Dict[str, Any]:
+    with open(path) as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+
+    counts = {"total": 0, "decided": 0, "true_positive": 0, "true_negative": 0,
+              "false_positive": 0, "false_negative": 0, "ambiguous": 0}
+    for example in examples:
+        decision, _ = classify_history_need(example["query"], example.get("history", []), threshold)
+        label = example["requires_history"]
+        counts["total"] += 1
+        if decision is None:
+            counts["ambiguous"] += 1
+            continue
+        counts["decided"] += 1
+        if decision and label:
+            counts["true_positive"] += 1
+        elif not decision and not label:
+            counts["true_negative"] += 1
+        elif decision and not label:
+            counts["false_positive"] += 1
+        else:
+            counts["false_negative"] += 1
+
+    negatives = sum(1 for example in examples if not example["requires_history"])
+    positives = counts["total"] - negatives
+    return {
+        **counts,
+        "coverage": round(counts["decided"] / counts["total"], 4) if counts["total"] else 0.0,
+        "accuracy_when_decided": round((counts["true_positive"] + counts["true_negative"]) / counts["decided"], 4) if counts["decided"] else 0.0,
+        "error_rate_when_decided": round((counts["false_positive"] + counts["false_negative"]) / counts["decided"], 4) if counts["decided"] else 0.0,
+        "false_positive_rate": round(counts["false_positive"] / negatives, 4) if negatives else 0.0,
+        "false_negative_rate": round(counts["false_negative"] / positives, 4) if positives else 0.0,
+        "threshold": threshold
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the local history classifier on a labelled set.")
+    parser.add_argument("labels", nargs="?", default=HOLDOUT_LABELS_PATH,
+                        help="JSONL file with query, history and requires_history fields, such as the held-out set "
+                             "(default) or a HISTORY_LOG_PATH file of LLM-labelled decisions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    print(json.dumps(evaluate(args.labels, args.threshold), indent=2))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import logging
+import argparse
+import threading
+
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+MODEL_VERSION = 1
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "intent_router.json")
+
+DEFAULT_SEED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "intent_seed.jsonl")
+
+# Tables the router can predict, matching the parse prompt
+ROUTER_TABLES = [
+    "player_stats_regular_season",
+    "player_stats_playoffs",
+    "goalie_stats_regular_season",
+    "goalie_stats_playoffs",
+    "team_stats",
+    "team_stats_playoffs",
+    "team_games",
+    "lines_and_pairings",
+    "lines_and_pairings_playoffs"
+]
+
+_log_lock = threading.Lock()
+
+
+# Split a query into normalized unigram and bigram terms
+def tokenize(text: str) -> List[str]:
+    text = text.lower()
+    text = re.sub(r'\b(19|20)\d{2}(\s*[-/]\s*\d{2,4})?\b', ' _season_ ', text)
+    text = re.sub(r'\d+', ' _num_ ', text)
+    words = re.findall(r"[a-z_%']+", text)
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+# Compute L2-normalized TF-IDF features for one query
+def vectorize(text: str, idf: Dict[str, float]) -> Dict[str, float]:
+    counts = Counter(term for term in tokenize(text) if term in idf)
+    features = {term: (1 + math.log(count)) * idf[term] for term, count in counts.items()}
+    norm = math.sqrt(sum(value * value for value in features.values())) or 1.0
+    return {term: value / norm for term, value in features.items()}
+
+def _sigmoid(value: float) -> float:
+    if value < -30:
+        return 0.0
+    if value > 30:
+        return 1.0
+    return 1 / (1 + math.exp(-value))
+
+# Probability of the positive class for one binary head
+def predict_head(head: Dict[str, Any], features: Dict[str, float]) -> float:
+    weights = head["weights"]
+    return _sigmoid(head["bias"] + sum(weights.get(term, 0.0) * value for term, value in features.items()))
+
+# Train one binary logistic regression head with SGD
+def train_head(samples: List[Tuple[Dict[str, float], int]], epochs: int = 40, learning_rate: float = 0.5,
+               l2: float = 1e-4, seed: int = 13) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    weights: Dict[str, float] = {}
+    bias = 0.0
+    order = list(range(len(samples)))
+
+    for _ in range(epochs):
+        rng.shuffle(order)
+        for index in order:
+            features, label = samples[index]
+            error = _sigmoid(bias + sum(weights.get(term, 0.0) * value for term, value in features.items())) - label
+            bias -= learning_rate * error
+            for term, value in features.items():
+                weight = weights.get(term, 0.0)
+                weights[term] = weight - learning_rate * (error * value + l2 * weight)
+
+    return {"weights": {term: round(weight, 6) for term, weight in weights.items() if abs(weight) > 1e-4},
+            "bias": round(bias, 6)}
+
+# Read labelled examples (query plus parse fields) from JSONL files
+def load_examples(paths: List[str]) -> List[Dict[str, Any]]:
+    examples = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                example = json.loads(line)
+                if "query" in example and "hockey_related" in example:
+                    examples.append(example)
+    return examples
+
+# Fit the TF-IDF vocabulary and all heads on labelled examples
+def train(examples: List[Dict[str, Any]], min_df: int = 1) -> Dict[str, Any]:
+    document_frequency = Counter()
+    for example in examples:
+        document_frequency.update(set(tokenize(example["query"])))
+    document_count = len(examples)
+    idf = {
+        term: round(math.log((1 + document_count) / (1 + count)) + 1, 6)
+        for term, count in document_frequency.items() if count >= min_df
+    }
+
+    vectors = [vectorize(example["query"], idf) for example in examples]
+    hockey_samples = [(vector, int(bool(example["hockey_related"]))) for vector, example in zip(vectors, examples)]
+    hockey_examples = [(vector, example) for vector, example in zip(vectors, examples) if example["hockey_related"]]
+    intent_samples = [(vector, int(example.get("query_intent") == "stats")) for vector, example in hockey_examples]
+
+    tables = {}
+    stats_examples = [(vector, example) for vector, example in hockey_examples if example.get("query_intent") == "stats"]
+    for table in ROUTER_TABLES:
+        labels = [(vector, int(table in example.get("required_tables", []))) for vector, example in stats_examples]
+        if any(label for _, label in labels):
+            tables[table] = train_head(labels)
+
+    return {
+        "version": MODEL_VERSION,
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "example_count": document_count,
+        "idf": idf,
+        "heads": {
+            "hockey_related": train_head(hockey_samples),
+            "query_intent": train_head(intent_samples) if intent_samples else {"weights": {}, "bias": 0.0},
+            "tables": tables
+        }
+    }
+
+# Predict hockey_related, query_intent and required_tables with per-field confidences
+def predict(model: Dict[str, Any], query: str, table_threshold: float = 0.5) -> Dict[str, Any]:
+    features = vectorize(query, model["idf"])
+    heads = model["heads"]
+
+    hockey_probability = predict_head(heads["hockey_related"], features)
+    stats_probability = predict_head(heads["query_intent"], features)
+    table_probabilities = {table: predict_head(head, features) for table, head in heads["tables"].items()}
+    required_tables = [table for table, probability in table_probabilities.items() if probability >= table_threshold]
+
+    table_confidence = min((max(probability, 1 - probability) for probability in table_probabilities.values()), default=0.0)
+    return {
+        "hockey_related": hockey_probability >= 0.5,
+        "hockey_confidence": max(hockey_probability, 1 - hockey_probability),
+        "query_intent": "stats" if stats_probability >= 0.5 else "general",
+        "intent_confidence": max(stats_probability, 1 - stats_probability),
+        "required_tables": required_tables,
+        "tables_confidence": table_confidence if required_tables else 0.0,
+        "table_probabilities": table_probabilities
+    }
+
+# Score a model on held-out examples: per-field accuracy, table F1, coverage and latency
+def evaluate(model: Dict[str, Any], examples: List[Dict[str, Any]], confidence: float = 0.9) -> Dict[str, Any]:
+    hockey_correct = intent_correct = intent_total = 0
+    table_tp = table_fp = table_fn = 0
+    confident = confident_correct = 0
+    started = time.perf_counter()
+
+    for example in examples:
+        prediction = predict(model, example["query"])
+        hockey_ok = prediction["hockey_related"] == bool(example["hockey_related"])
+        hockey_correct += hockey_ok
+
+        intent_ok = True
+        if example["hockey_related"]:
+            intent_total += 1
+            intent_ok = prediction["query_intent"] == example.get("query_intent")
+            intent_correct += intent_ok
+
+        tables_ok = True
+        if example["hockey_related"] and example.get("query_intent") == "stats":
+            predicted = set(prediction["required_tables"])
+            expected = set(example.get("required_tables", []))
+            table_tp += len(predicted & expected)
+            table_fp += len(predicted - expected)
+            table_fn += len(expected - predicted)
+            tables_ok = predicted == expected
+
+        if route_is_confident(prediction, confidence):
+            confident += 1
+            confident_correct += hockey_ok and intent_ok and tables_ok
+
+    elapsed = time.perf_counter() - started
+    total = len(examples)
+    precision = table_tp / (table_tp + table_fp) if table_tp + table_fp else 0.0
+    recall = table_tp / (table_tp + table_fn) if table_tp + table_fn else 0.0
+    return {
+        "examples": total,
+        "hockey_related_accuracy": round(hockey_correct / total, 4) if total else 0.0,
+        "query_intent_accuracy": round(intent_correct / intent_total, 4) if intent_total else 0.0,
+        "required_tables_f1": round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+        "confidence_threshold": confidence,
+        "coverage": round(confident / total, 4) if total else 0.0,
+        "accuracy_when_confident": round(confident_correct / confident, 4) if confident else 0.0,
+        "avg_latency_ms": round(1000 * elapsed / total, 4) if total else 0.0
+    }
+
+# Check whether a prediction is confident enough to skip (or shorten) the LLM parse
+def route_is_confident(prediction: Dict[str, Any], confidence: float) -> bool:
+    if prediction["hockey_confidence"] < confidence:
+        return False
+    if not prediction["hockey_related"]:
+        return True
+    if prediction["intent_confidence"] < confidence:
+        return False
+    return prediction["query_intent"] == "general" or prediction["tables_confidence"] >= confidence
+
+def save_model(model: Dict[str, Any], path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(model, f)
+
+# Load a router artifact, returning None when it is missing or incompatible
+def load_model(path: str) -> Optional[Dict[str, Any]]:
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            model = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.error(f"Unable to load intent router from {path}: {str(e)}")
+        return None
+    if model.get("version") != MODEL_VERSION:
+        logging.error(f"Ignoring intent router at {path}: unsupported version {model.get('version')}")
+        return None
+    return model
+
+# Append one LLM-labelled parse to the query log used as training data
+def log_parsed_query(path: str, query: str, parsed_data: Dict[str, Any]) -> None:
+    record = {
+        "query": query,
+        "hockey_related": bool(parsed_data.get("hockey_related")),
+        "query_intent": parsed_data.get("query_intent"),
+        "required_tables": [table for table in parsed_data.get("required_tables", []) if table in ROUTER_TABLES],
+        "logged_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+    try:
+        with _log_lock, open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        logging.error(f"Unable to write query log {path}: {str(e)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and evaluate the offline intent router.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subparsers.add_parser("train", help="Train a router from logged queries")
+    train_parser.add_argument("logs", nargs="*", help="JSONL query logs (QUERY_LOG_PATH output)")
+    train_parser.add_argument("--seed-data", default=DEFAULT_SEED_PATH, help="Curated labelled examples to include")
+    train_parser.add_argument("--out", default=DEFAULT_MODEL_PATH)
+    train_parser.add_argument("--holdout", type=float, default=0.2, help="Fraction of examples held out for the report")
+    train_parser.add_argument("--confidence", type=float, default=0.9)
+
+    evaluate_parser = subparsers.add_parser("evaluate", help="Report accuracy and latency of a trained router")
+    evaluate_parser.add_argument("examples", nargs="+", help="Labelled JSONL files")
+    evaluate_parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    evaluate_parser.add_argument("--confidence", type=float, default=0.9)
+
+    args = parser.parse_args()
+
+    if args.command == "train":
+        paths = list(args.logs) + ([args.seed_data] if args.seed_data and os.path.exists(args.seed_data) else [])
+        examples = load_examples(paths)
+        if not examples:
+            print("No labelled examples found.")
+            return 1
+
+        random.Random(7).shuffle(examples)
+        holdout_count = int(len(examples) * args.holdout)
+        report = None
+        if holdout_count:
+            report = evaluate(train(examples[holdout_count:]), examples[:holdout_count], args.confidence)
+
+        model = train(examples)
+        model["holdout_report"] = report
+        save_model(model, args.out)
+        print(f"Trained on {len(examples)} examples; saved to {args.out}")
+        print(json.dumps(report, indent=2))
+    else:
+        model = load_model(args.model)
+        if model is None:
+            print(f"No usable model at {args.model}")
+            return 1
+        print(json.dumps(evaluate(model, load_examples(args.examples), args.confidence), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+import os
+import re
+import json
+import asyncio
+import threading
+
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Iterator
+
+from ollama_client import OllamaClient, ollama_client_from_env
+
+# A response whose load_duration exceeds this had to load the model first instead of finding it resident
+MODEL_RELOAD_SECONDS = 0.5
+
+
+# Raised by providers that talk HTTP directly; status_code lets the resilience layer decide on retries
+class ProviderHTTPError(Exception):
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Common interface for chat completion backends: sync, async, streaming, JSON mode, usage and concurrency limits
+class LLMProvider:
+    name = "base"
+
+    def __init__(self, max_concurrency: int = 32):
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._async_slots: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+        self._usage = {"requests": 0, "streams": 0, "prompt_tokens": 0, "completion_tokens": 0, "slot_waits": 0}
+
+    # Map the pipeline's model names onto the ones this provider serves
+    def resolve_model(self, model: str) -> str:
+        return model
+
+    @contextmanager
+    def _slot(self):
+        if not self._slots.acquire(blocking=False):
+            self._count("slot_waits")
+            self._slots.acquire()
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    # asyncio semaphores belong to one event loop, so each loop gets its own
+    def _async_slot(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async_slots:
+                self._async_slots[loop] = asyncio.Semaphore(self.max_concurrency)
+            return self._async_slots[loop]
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            self._usage[counter] += amount
+
+    def record_usage(self, prompt_tokens: int, completion_tokens: int) -> None:
+        with self._lock:
+            self._usage["prompt_tokens"] += prompt_tokens or 0
+            self._usage["completion_tokens"] += completion_tokens or 0
+
+    # Return the completion text; response_format follows the OpenAI shape ({"type": "json_object"} or json_schema)
+    def complete(self, messages: List[Dict[str, str]], model: str, max_tokens: int,
+                 response_format: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> str:
+        with self._slot():
+            self._count("requests")
+            return self._complete(messages, self.resolve_model(model), max_tokens, response_format, timeout)
+
+    async def complete_async(self, messages: List[Dict[str, str]], model: str, max_tokens: int,
+                             response_format: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> str:
+        async with self._async_slot():
+            self._count("requests")
+            return await self._complete_async(messages, self.resolve_model(model), max_tokens, response_format, timeout)
+
+    # Open a streamed completion and return an iterator of content fragments.
+    # The concurrency slot covers opening the stream, not reading it.
+    def stream(self, messages: List[Dict[str, str]], model: str, max_tokens: int,
+               timeout: Optional[float] = None) -> Iterator[str]:
+        with self._slot():
+            self._count("streams")
+            return self._stream(messages, self.resolve_model(model), max_tokens, timeout)
+
+    def _complete(self, messages, model, max_tokens, response_format, timeout) -> str:
+        raise NotImplementedError
+
+    # Providers without a native async client run the sync call in a worker thread
+    async def _complete_async(self, messages, model, max_tokens, response_format, timeout) -> str:
+        return await asyncio.to_thread(self._complete, messages, model, max_tokens, response_format, timeout)
+
+    def _stream(self, messages, model, max_tokens, timeout) -> Iterator[str]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"provider": self.name, "max_concurrency": self.max_concurrency, **self._usage}
+
+
+# OpenAI chat completions (also any OpenAI-compatible server reached through OPENAI_BASE_URL)
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self, api_key: str, max_concurrency: int = 32):
+        super().__init__(max_concurrency)
+        from openai import OpenAI, AsyncOpenAI
+        # Retries are handled by the resilience layer, not the SDK
+        self.client = OpenAI(api_key=api_key, max_retries=0)
+        self.async_client = AsyncOpenAI(api_key=api_key, max_retries=0)
+
+    def _request_options(self, response_format, timeout) -> Dict[str, Any]:
+        options = {"timeout": timeout} if timeout is not None else {}
+        if response_format is not None:
+            options["response_format"] = response_format
+        return options
+
+    def _record_response_usage(self, usage) -> None:
+        if usage is not None:
+            self.record_usage(usage.prompt_tokens, usage.completion_tokens)
+
+    def _complete(self, messages, model, max_tokens, response_format, timeout) -> str:
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            **self._request_options(response_format, timeout)
+        )
+        self._record_response_usage(response.usage)
+        return response.choices[0].message.content
+
+    async def _complete_async(self, messages, model, max_tokens, response_format, timeout) -> str:
+        response = await self.async_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            **self._request_options(response_format, timeout)
+        )
+        self._record_response_usage(response.usage)
+        return response.choices[0].message.content
+
+    def _stream(self, messages, model, max_tokens, timeout) -> Iterator[str]:
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._request_options(None, timeout)
+        )
+
+        def fragments() -> Iterator[str]:
+            for chunk in stream:
+                if chunk.usage is not None:
+                    self._record_response_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        return fragments()
+
+
+# Ollama /api/chat on the shared pooled, keep-alive OllamaClient session
+class OllamaProvider(LLMProvider):
+    name = "ollama"
+
+    def __init__(self, client: OllamaClient, max_concurrency: int = 4):
+        super().__init__(max_concurrency)
+        self.client = client
+        self._timings = {"responses": 0, "reloads": 0, "load_seconds": 0.0, "max_load_seconds": 0.0,
+                         "prompt_eval_seconds": 0.0, "eval_seconds": 0.0, "total_seconds": 0.0}
+
+    # OpenAI model names in the pipeline config fall back to the configured Ollama model
+    def resolve_model(self, model: str) -> str:
+        return self.client.model if not model or model.startswith("gpt-") else model
+
+    def _payload(self, messages, model, max_tokens, response_format, stream) -> Dict[str, Any]:
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": stream,
+            "keep_alive": self.client.keep_alive,
+            "options": {"num_predict": max_tokens}
+        }
+        if response_format is not None:
+            # Ollama takes "json" for free-form JSON mode or the JSON schema itself
+            schema = response_format.get("json_schema", {}).get("schema")
+            payload["format"] = schema if schema is not None else "json"
+        return payload
+
+    def _post(self, payload: Dict[str, Any], timeout: Optional[float], stream: bool = False):
+        request_timeout = (self.client.timeout[0], timeout) if timeout is not None else self.client.timeout
+        response = self.client.session.post(f"{self.client.base_url}/api/chat", json=payload,
+                                            timeout=request_timeout, stream=stream)
+        if response.status_code != 200:
+            raise ProviderHTTPError(f"Ollama returned {response.status_code}: {response.text[:200]}", response.status_code)
+        return response
+
+    # Accumulate the durations (in nanoseconds) of a final /api/chat response; load_duration shows model reload stalls
+    def _record_timings(self, body: Dict[str, Any]) -> None:
+        self.record_usage(body.get("prompt_eval_count", 0), body.get("eval_count", 0))
+        load_seconds = (body.get("load_duration") or 0) / 1e9
+        with self._lock:
+            self._timings["responses"] += 1
+            self._timings["reloads"] += int(load_seconds > MODEL_RELOAD_SECONDS)
+            self._timings["load_seconds"] += load_seconds
+            self._timings["max_load_seconds"] = max(self._timings["max_load_seconds"], load_seconds)
+            self._timings["prompt_eval_seconds"] += (body.get("prompt_eval_duration") or 0) / 1e9
+            self._timings["eval_seconds"] += (body.get("eval_duration") or 0) / 1e9
+            self._timings["total_seconds"] += (body.get("total_duration") or 0) / 1e9
+
+    def _complete(self, messages, model, max_tokens, response_format, timeout) -> str:
+        body = self._post(self._payload(messages, model, max_tokens, response_format, False), timeout).json()
+        self._record_timings(body)
+        return body.get("message", {}).get("content", "")
+
+    def _stream(self, messages, model, max_tokens, timeout) -> Iterator[str]:
+        response = self._post(self._payload(messages, model, max_tokens, None, True), timeout, stream=True)
+
+        def fragments() -> Iterator[str]:
+            with response:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    content = chunk.get("message", {}).get("content")
+                    if content:
+                        yield content
+                    if chunk.get("done"):
+                        self._record_timings(chunk)
+        return fragments()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._lock:
+            timings = {name: round(value, 3) if isinstance(value, float) else value for name, value in self._timings.items()}
+        return {**stats, "model": self.client.model, "keep_alive": self.client.keep_alive, **timings}
+
+
+# Canned completion for a prompt, chosen from the pipeline stage the prompt belongs to
+def fake_completion(messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None) -> str:
+    last_message = messages[-1].get("content", "") if messages else ""
+
+    if "Respond with only True or False" in last_message:
+        return "False\nThe query is self-contained."
+    if "Extract the entities" in last_message:
+        return json.dumps({"expanded_query": "", "player_names": [], "team_abbreviations": [], "situation": "all", "seasons": []})
+    if "PostgreSQL query" in last_message or "corrected SQL query" in last_message:
+        return ("SELECT name, team, season, i_f_points FROM player_stats_regular_season "
+                "WHERE situation = 'all' ORDER BY i_f_points DESC LIMIT 10")
+    if response_format is not None or "JSON" in last_message:
+        query_match = re.search(r"Query: '(.*?)'", last_message, re.DOTALL)
+        query = query_match.group(1) if query_match else last_message
+        hockey_related = bool(re.search(r'\b(hockey|nhl|goals?|points?|assists?|saves?|goalie|playoffs?|stanley)\b', query, re.IGNORECASE))
+        return json.dumps({
+            "requires_history": False,
+            "expanded_query": query,
+            "hockey_related": hockey_related,
+            "query_intent": "stats" if hockey_related else "general",
+            "player_names": [],
+            "team_abbreviations": [],
+            "required_tables": ["player_stats_regular_season"] if hockey_related else [],
+            "situation": "all",
+            "seasons": []
+        })
+    return "This is a deterministic answer from the fake LLM provider."
+
+
+# Deterministic local provider for tests and offline development; never touches the network
+class FakeProvider(LLMProvider):
+    name = "fake"
+
+    def _complete(self, messages, model, max_tokens, response_format, timeout) -> str:
+        content = fake_completion(messages, response_format)
+        self.record_usage(sum(len(message.get("content", "")) for message in messages) // 4, len(content) // 4)
+        return content
+
+    async def _complete_async(self, messages, model, max_tokens, response_format, timeout) -> str:
+        return self._complete(messages, model, max_tokens, response_format, timeout)
+
+    def _stream(self, messages, model, max_tokens, timeout) -> Iterator[str]:
+        content = self._complete(messages, model, max_tokens, None, timeout)
+        return iter(re.findall(r'\S+\s*', content))
+
+
+# Build the provider selected with LLM_PROVIDER (openai, ollama or fake)
+def provider_from_env(api_key: Optional[str] = None) -> LLMProvider:
+    name = os.environ.get("LLM_PROVIDER", "openai").lower()
+    max_concurrency = int(os.environ.get("LLM_MAX_CONCURRENCY", 32))
+    if name == "openai":
+        return OpenAIProvider(api_key, max_concurrency)
+    if name == "ollama":
+        return OllamaProvider(ollama_client_from_env(), int(os.environ.get("LLM_MAX_CONCURRENCY", 4)))
+    if name == "fake":
+        return FakeProvider(max_concurrency)
+    raise ValueError(f"Unknown LLM_PROVIDER '{name}'; expected openai, ollama or fake")
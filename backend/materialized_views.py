@@ -0,0 +1,260 @@
+import os
+import sys
+import time
+import argparse
+
+from typing import Dict, Any, List, Optional
+
+# Season rows of skaters and goalies from the regular season and playoff tables, tagged with their season type
+SKATER_SEASONS = """
+    SELECT 'regular_season' AS season_type, player_id, name, position, team, season, situation, games_played, icetime,
+           i_f_goals, i_f_primaryassists, i_f_secondaryassists, i_f_points, i_f_shotsongoal, i_f_xgoals, i_f_hits,
+           i_f_takeaways, i_f_giveaways, i_f_penalityminutes, shotsblockedbyplayer, faceoffswon, faceoffslost
+    FROM player_stats_regular_season
+    UNION ALL
+    SELECT 'playoffs', player_id, name, position, team, season, situation, games_played, icetime,
+           i_f_goals, i_f_primaryassists, i_f_secondaryassists, i_f_points, i_f_shotsongoal, i_f_xgoals, i_f_hits,
+           i_f_takeaways, i_f_giveaways, i_f_penalityminutes, shotsblockedbyplayer, faceoffswon, faceoffslost
+    FROM player_stats_playoffs"""
+
+GOALIE_SEASONS = """
+    SELECT 'regular_season' AS season_type, playerid AS player_id, name, team, season, situation, games_played, icetime,
+           ongoal, goals, xgoals, highdangershots, highdangergoals
+    FROM goalie_stats_regular_season
+    UNION ALL
+    SELECT 'playoffs', playerid, name, team, season, situation, games_played, icetime,
+           ongoal, goals, xgoals, highdangershots, highdangergoals
+    FROM goalie_stats_playoffs"""
+
+# Every view has one row per key and season type: 'regular_season', 'playoffs' and 'combined' (both added up)
+SEASON_TYPE_GROUPING = "GROUPING SETS ((season_type), ())"
+
+SKATER_TOTALS = """
+       MIN(season) AS first_season, MAX(season) AS last_season, COUNT(DISTINCT season) AS seasons,
+       SUM(games_played) AS games_played,
+       SUM(i_f_goals) AS goals,
+       SUM(i_f_primaryassists + i_f_secondaryassists) AS assists,
+       SUM(i_f_primaryassists) AS primary_assists,
+       SUM(i_f_points) AS points,
+       ROUND(SUM(i_f_points)::numeric / NULLIF(SUM(games_played), 0), 3) AS points_per_game,
+       SUM(i_f_shotsongoal) AS shots_on_goal,
+       ROUND(SUM(i_f_xgoals)::numeric, 2) AS expected_goals,
+       SUM(i_f_hits) AS hits,
+       SUM(i_f_takeaways) AS takeaways,
+       SUM(i_f_giveaways) AS giveaways,
+       SUM(i_f_penalityminutes) AS penalty_minutes,
+       SUM(shotsblockedbyplayer) AS blocked_shots,
+       SUM(faceoffswon) AS faceoffs_won,
+       SUM(faceoffslost) AS faceoffs_lost,
+       ROUND(SUM(icetime)::numeric / 60, 1) AS icetime_minutes"""
+
+GOALIE_TOTALS = """
+       MIN(season) AS first_season, MAX(season) AS last_season, COUNT(DISTINCT season) AS seasons,
+       SUM(games_played) AS games_played,
+       SUM(ongoal) AS shots_against,
+       SUM(goals) AS goals_against,
+       SUM(ongoal - goals) AS saves,
+       ROUND(1 - SUM(goals)::numeric / NULLIF(SUM(ongoal), 0), 4) AS save_percentage,
+       ROUND(SUM(goals)::numeric * 3600 / NULLIF(SUM(icetime), 0), 2) AS goals_against_average,
+       ROUND(SUM(xgoals)::numeric, 2) AS expected_goals_against,
+       ROUND(SUM(xgoals - goals)::numeric, 2) AS goals_saved_above_expected,
+       SUM(highdangershots) AS high_danger_shots_against,
+       SUM(highdangergoals) AS high_danger_goals_against,
+       ROUND(SUM(icetime)::numeric / 60, 1) AS icetime_minutes"""
+
+# Materialized views over every loaded season, in creation order.
+# `unique` is the unique index REFRESH MATERIALIZED VIEW CONCURRENTLY needs, `indexes` the lookup indexes.
+MATERIALIZED_VIEWS: List[Dict[str, Any]] = [
+    {
+        "name": "player_career_totals",
+        "sql": f"""
+WITH seasons AS ({SKATER_SEASONS})
+SELECT player_id,
+       (array_agg(name ORDER BY season DESC))[1] AS name,
+       (array_agg(position ORDER BY season DESC))[1] AS position,
+       (array_agg(team ORDER BY season DESC))[1] AS last_team,
+       situation,
+       COALESCE(season_type, 'combined') AS season_type,{SKATER_TOTALS}
+FROM seasons
+WHERE player_id IS NOT NULL AND situation IS NOT NULL
+GROUP BY player_id, situation, {SEASON_TYPE_GROUPING}""",
+        "unique": ["player_id", "situation", "season_type"],
+        "indexes": [["name", "situation", "season_type"]]
+    },
+    {
+        "name": "goalie_career_totals",
+        "sql": f"""
+WITH seasons AS ({GOALIE_SEASONS})
+SELECT player_id,
+       (array_agg(name ORDER BY season DESC))[1] AS name,
+       (array_agg(team ORDER BY season DESC))[1] AS last_team,
+       situation,
+       COALESCE(season_type, 'combined') AS season_type,{GOALIE_TOTALS}
+FROM seasons
+WHERE player_id IS NOT NULL AND situation IS NOT NULL
+GROUP BY player_id, situation, {SEASON_TYPE_GROUPING}""",
+        "unique": ["player_id", "situation", "season_type"],
+        "indexes": [["name", "situation", "season_type"]]
+    },
+    {
+        "name": "team_career_totals",
+        "sql": f"""
+WITH games AS (
+    SELECT CASE WHEN playoffgame = 1 THEN 'playoffs' ELSE 'regular_season' END AS season_type,
+           team, season, situation, goalsfor, goalsagainst, xgoalsfor, xgoalsagainst, shotsongoalfor, shotsongoalagainst
+    FROM team_games)
+SELECT team,
+       situation,
+       COALESCE(season_type, 'combined') AS season_type,
+       MIN(season) AS first_season, MAX(season) AS last_season, COUNT(DISTINCT season) AS seasons,
+       COUNT(*) AS games_played,
+       SUM(CASE WHEN goalsfor > goalsagainst THEN 1 ELSE 0 END) AS wins,
+       SUM(CASE WHEN goalsfor < goalsagainst THEN 1 ELSE 0 END) AS losses,
+       SUM(goalsfor) AS goals_for,
+       SUM(goalsagainst) AS goals_against,
+       SUM(goalsfor - goalsagainst) AS goal_differential,
+       ROUND(SUM(xgoalsfor)::numeric, 2) AS expected_goals_for,
+       ROUND(SUM(xgoalsagainst)::numeric, 2) AS expected_goals_against,
+       SUM(shotsongoalfor) AS shots_on_goal_for,
+       SUM(shotsongoalagainst) AS shots_on_goal_against
+FROM games
+WHERE team IS NOT NULL AND situation IS NOT NULL
+GROUP BY team, situation, {SEASON_TYPE_GROUPING}""",
+        "unique": ["team", "situation", "season_type"],
+        "indexes": []
+    },
+    {
+        "name": "player_team_tenures",
+        "sql": f"""
+WITH seasons AS ({SKATER_SEASONS})
+SELECT player_id,
+       (array_agg(name ORDER BY season DESC))[1] AS name,
+       (array_agg(position ORDER BY season DESC))[1] AS position,
+       team,
+       situation,
+       COALESCE(season_type, 'combined') AS season_type,{SKATER_TOTALS}
+FROM seasons
+WHERE player_id IS NOT NULL AND team IS NOT NULL AND situation IS NOT NULL
+GROUP BY player_id, team, situation, {SEASON_TYPE_GROUPING}""",
+        "unique": ["player_id", "team", "situation", "season_type"],
+        "indexes": [["name", "situation", "season_type"], ["team", "situation", "season_type"]]
+    },
+    {
+        "name": "goalie_team_tenures",
+        "sql": f"""
+WITH seasons AS ({GOALIE_SEASONS})
+SELECT player_id,
+       (array_agg(name ORDER BY season DESC))[1] AS name,
+       team,
+       situation,
+       COALESCE(season_type, 'combined') AS season_type,{GOALIE_TOTALS}
+FROM seasons
+WHERE player_id IS NOT NULL AND team IS NOT NULL AND situation IS NOT NULL
+GROUP BY player_id, team, situation, {SEASON_TYPE_GROUPING}""",
+        "unique": ["player_id", "team", "situation", "season_type"],
+        "indexes": [["name", "situation", "season_type"], ["team", "situation", "season_type"]]
+    }
+]
+
+VIEW_NAMES = [view["name"] for view in MATERIALIZED_VIEWS]
+
+
+def _index_statement(view: str, columns: List[str], unique: bool = False) -> str:
+    name = f"{view}_{'_'.join(columns)}_{'key' if unique else 'idx'}"
+    return (f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} "
+            f"ON {view} ({', '.join(columns)})")
+
+# Statements that create a view and its indexes; existing views and indexes are left as they are
+def create_statements(view: Dict[str, Any]) -> List[str]:
+    statements = [f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view['name']} AS {view['sql'].strip()} WITH DATA",
+                  _index_statement(view["name"], view["unique"], unique=True)]
+    statements += [_index_statement(view["name"], columns) for columns in view["indexes"]]
+    return statements
+
+def _selected(names: Optional[List[str]]) -> List[Dict[str, Any]]:
+    return [view for view in MATERIALIZED_VIEWS if not names or view["name"] in names]
+
+# Create the views (and their indexes) that do not exist yet; returns the seconds each took
+def create_views(conn, names: Optional[List[str]] = None) -> Dict[str, float]:
+    timings = {}
+    with conn.cursor() as cursor:
+        for view in _selected(names):
+            start = time.perf_counter()
+            for statement in create_statements(view):
+                cursor.execute(statement)
+            timings[view["name"]] = round(time.perf_counter() - start, 3)
+    return timings
+
+# Refresh the views after a data load. CONCURRENTLY keeps them readable while they refresh, using the unique index.
+# Returns the seconds each refresh took.
+def refresh_views(conn, names: Optional[List[str]] = None, concurrently: bool = True,
+                  analyze: bool = True) -> Dict[str, float]:
+    timings = {}
+    with conn.cursor() as cursor:
+        for view in _selected(names):
+            start = time.perf_counter()
+            cursor.execute(f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if concurrently else ''}{view['name']}")
+            if analyze:
+                cursor.execute(f"ANALYZE {view['name']}")
+            timings[view["name"]] = round(time.perf_counter() - start, 3)
+    return timings
+
+# Drop the views, for example before changing their definitions
+def drop_views(conn, names: Optional[List[str]] = None) -> None:
+    with conn.cursor() as cursor:
+        for view in reversed(_selected(names)):
+            cursor.execute(f"DROP MATERIALIZED VIEW IF EXISTS {view['name']}")
+
+
+# Views that exist and are populated in the public schema, in VIEW_NAMES order
+def existing_views(conn) -> List[str]:
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT matviewname FROM pg_matviews "
+                       "WHERE schemaname = 'public' AND ispopulated AND matviewname = ANY(%s)", (VIEW_NAMES,))
+        found = {row[0] for row in cursor.fetchall()}
+    return [name for name in VIEW_NAMES if name in found]
+
+# Management command: create the views once, refresh them after every data load
+def main():
+    parser = argparse.ArgumentParser(description="Create or refresh the career and tenure materialized views")
+    parser.add_argument("command", choices=["create", "refresh", "drop", "show"],
+                        help="create missing views, refresh them after a data load, drop them, or print their SQL")
+    parser.add_argument("--views", nargs="*", choices=VIEW_NAMES, default=None, help="Only these views")
+    parser.add_argument("--no-concurrently", action="store_true",
+                        help="Refresh with an exclusive lock (faster, but queries on the view wait for it)")
+    parser.add_argument("--no-analyze", action="store_true", help="Skip ANALYZE after refreshing")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        for view in _selected(args.views):
+            print(";\n".join(create_statements(view)) + ";\n")
+        return 0
+
+    import psycopg2
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    conn = psycopg2.connect(dbname=os.environ.get("DB_NAME", "hockey_stats"), user=os.environ.get("DB_USER"),
+                            host=os.environ.get("DB_HOST", "localhost"), password=os.environ.get("DB_PASSWORD", ""))
+    # Each view commits on its own, so a failed refresh leaves the others refreshed
+    conn.autocommit = True
+    try:
+        if args.command == "create":
+            timings = create_views(conn, args.views)
+        elif args.command == "refresh":
+            timings = refresh_views(conn, args.views, concurrently=not args.no_concurrently,
+                                    analyze=not args.no_analyze)
+        else:
+            drop_views(conn, args.views)
+            timings = {}
+    except psycopg2.Error as e:
+        print(f"{args.command} failed: {str(e).strip()}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    for name, seconds in timings.items():
+        print(f"{args.command}: {name} in {seconds}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
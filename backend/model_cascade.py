@@ -0,0 +1,100 @@
+import os
+import logging
+import threading
+
+from typing import Dict, Any, List
+
+# Model tiers per stage as "model:max_tokens" entries, cheapest first; later tiers are only used on escalation
+DEFAULT_CASCADES = {
+    "history_check": "gpt-4o-mini:300",
+    "parse": "gpt-4o-mini:300,gpt-4o:300",
+    "entity_parse": "gpt-4o-mini:150",
+    "analysis": "gpt-4o-mini:300,gpt-4o:300",
+    "sql": "gpt-4o-mini:300,gpt-4o:500",
+    "correction": "gpt-4o:500",
+    "answer_non_hockey": "gpt-4o-mini:300",
+    "answer_general": "gpt-4o-mini:300",
+    "answer_with_data": "gpt-4o-mini:1200",
+    "answer_error": "gpt-4o-mini:500"
+}
+
+DEFAULT_TIER = {"model": "gpt-4o-mini", "max_tokens": 300}
+
+
+# Parse "gpt-4o-mini:300,gpt-4o:600" into a list of tiers
+def parse_cascade(spec: str) -> List[Dict[str, Any]]:
+    tiers = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        model, _, max_tokens = entry.partition(":")
+        tiers.append({"model": model.strip(), "max_tokens": int(max_tokens) if max_tokens else DEFAULT_TIER["max_tokens"]})
+    return tiers
+
+# Load every stage's cascade, letting LLM_CASCADE_<STAGE> override the defaults
+def cascades_from_env() -> Dict[str, List[Dict[str, Any]]]:
+    cascades = {}
+    for stage, spec in DEFAULT_CASCADES.items():
+        try:
+            cascades[stage] = parse_cascade(os.environ.get(f"LLM_CASCADE_{stage.upper()}", spec)) or parse_cascade(spec)
+        except ValueError:
+            logging.error(f"Invalid LLM_CASCADE_{stage.upper()}; using the default cascade {spec}")
+            cascades[stage] = parse_cascade(spec)
+    return cascades
+
+
+# Per-stage counters for accepted tiers, escalations and per-tier latency
+class CascadeMetrics:
+    def __init__(self):
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, stage: str) -> Dict[str, Any]:
+        return self._stages.setdefault(stage, {"calls": 0, "escalations": 0, "exhausted": 0,
+                                               "escalation_reasons": {}, "tiers": {}})
+
+    # Record one model call of a cascade and whether its output was accepted
+    def record_tier(self, stage: str, model: str, seconds: float, accepted: bool) -> None:
+        with self._lock:
+            tier = self._entry(stage)["tiers"].setdefault(model, {"calls": 0, "accepted": 0, "total_seconds": 0.0})
+            tier["calls"] += 1
+            tier["accepted"] += int(accepted)
+            tier["total_seconds"] += seconds
+
+    def record_call(self, stage: str) -> None:
+        with self._lock:
+            self._entry(stage)["calls"] += 1
+
+    # Record a move to a stronger tier and why it happened
+    def record_escalation(self, stage: str, reason: str) -> None:
+        with self._lock:
+            entry = self._entry(stage)
+            entry["escalations"] += 1
+            entry["escalation_reasons"][reason] = entry["escalation_reasons"].get(reason, 0) + 1
+
+    # Record a cascade whose every tier was rejected
+    def record_exhausted(self, stage: str) -> None:
+        with self._lock:
+            self._entry(stage)["exhausted"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                stage: {
+                    "calls": entry["calls"],
+                    "escalations": entry["escalations"],
+                    "escalation_rate": round(entry["escalations"] / entry["calls"], 4) if entry["calls"] else 0.0,
+                    "escalation_reasons": dict(entry["escalation_reasons"]),
+                    "exhausted": entry["exhausted"],
+                    "tiers": {
+                        model: {
+                            "calls": tier["calls"],
+                            "accepted": tier["accepted"],
+                            "avg_ms": round(1000 * tier["total_seconds"] / tier["calls"], 1)
+                        }
+                        for model, tier in entry["tiers"].items()
+                    }
+                }
+                for stage, entry in self._stages.items()
+            }
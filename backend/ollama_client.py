@@ -0,0 +1,44 @@
+import os
+import logging
+import requests
+
+from requests.adapters import HTTPAdapter
+from typing import Optional
+
+
+# Ollama connection settings and the pooled keep-alive session used by OllamaProvider's /api/chat requests
+class OllamaClient:
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "llama3", keep_alive: str = "30m",
+                 connect_timeout: float = 3, read_timeout: float = 120, pool_size: int = 10):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    # Load the model into memory ahead of the first query (an empty prompt only loads it)
+    def preload(self, model: Optional[str] = None) -> bool:
+        try:
+            response = self.session.post(f"{self.base_url}/api/generate",
+                                         json={"model": model or self.model, "keep_alive": self.keep_alive},
+                                         timeout=self.timeout)
+            return response.status_code == 200
+        except requests.RequestException as e:
+            logging.error(f"Unable to preload Ollama model {model or self.model}: {str(e)}")
+            return False
+
+
+# Build the shared client from OLLAMA_* environment variables
+def ollama_client_from_env() -> OllamaClient:
+    return OllamaClient(
+        base_url=os.environ.get("OLLAMA_URL", "http://localhost:11434"),
+        model=os.environ.get("OLLAMA_MODEL", "llama3"),
+        keep_alive=os.environ.get("OLLAMA_KEEP_ALIVE", "30m"),
+        connect_timeout=float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", 3)),
+        read_timeout=float(os.environ.get("OLLAMA_READ_TIMEOUT", 120)),
+        pool_size=int(os.environ.get("OLLAMA_POOL_SIZE", 10))
+    )
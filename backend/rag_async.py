@@ -0,0 +1,568 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+import time
+import asyncpg
+import functools
+import concurrent.futures
+
+from typing import Dict, Any, List, Optional, Tuple
+
+from rag_openAI import (
+    llm_provider,
+    llm_resilience,
+    completion_cache_key,
+    db_params,
+    response_cache,
+    build_history_check_messages,
+    local_history_decision,
+    parse_history_decision,
+    log_llm_history_label,
+    format_history_context,
+    build_parse_messages,
+    QUERY_PARSE_RESPONSE_FORMAT,
+    finalize_parsed_data,
+    build_sql_messages,
+    postprocess_sql_response,
+    build_correction_messages,
+    clean_sql_response,
+    build_non_hockey_answer_messages,
+    build_hockey_without_data_answer_messages,
+    build_answer_with_data_messages,
+    build_error_response_messages,
+    update_chat_history,
+    handle_failed_query,
+    speculative_parse_enabled,
+    record_speculation,
+    query_analysis_mode,
+    record_stage_latency,
+    build_analysis_messages,
+    parse_analysis_response,
+    QUERY_ANALYSIS_RESPONSE_FORMAT,
+    confident_route,
+    route_skips_parse,
+    build_entity_parse_messages,
+    parse_entity_response,
+    build_routed_parse,
+    record_intent_route,
+    log_parse_result,
+    coalesce_query,
+    model_cascades,
+    cascade_metrics,
+    accept_response,
+    validate_parsed_query,
+    validate_sql_response,
+    sql_templates_enabled,
+    check_sql_locally,
+    sql_guard,
+    sql_plan_cache,
+    bind_query,
+    query_for_display,
+    find_sql_examples,
+    record_generated_sql,
+    sql_candidates,
+    db_pool,
+    result_streamer,
+    sql_result_cache,
+    CACHED_RESULT_FIELDS,
+    cached_query_result,
+    DEFAULT_TIER
+)
+from sql_guard import QueryRejectedError
+from sql_candidates import SQLRace
+from sql_result_cache import make_result_key
+from sql_templates import build_template_sql, record_template_result, display_sql, to_positional
+
+# asyncpg pool creation task, started lazily on the event loop that first needs it
+_db_pool_task: Optional[asyncio.Task] = None
+_db_pool_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Background event loop used to run the async pipeline from sync (WSGI) code
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_loop_lock = threading.Lock()
+# Longest a WSGI thread waits on the background loop before the question is cancelled
+async_query_timeout = float(os.environ.get("ASYNC_QUERY_TIMEOUT_SECONDS", 120))
+
+# Run blocking work (SQLite, psycopg2, file appends) on the loop's default executor so other questions keep moving
+async def run_blocking(func, *args, **kwargs) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+# Generate a response asynchronously from the configured LLM provider, sharing the sync response cache
+async def generate_response_async(messages: List[Dict[str, str]], model: str = "gpt-4o-mini", max_tokens: int = 300,
+                                  response_format: Optional[Dict[str, Any]] = None, stage: str = "default") -> str:
+    cache_key = None
+    if response_cache is not None:
+        cache_key = completion_cache_key(model, messages, max_tokens, response_format)
+        cached_response = await run_blocking(response_cache.get, cache_key)
+        if cached_response is not None:
+            logging.debug("LLM response served from cache")
+            return cached_response
+
+    content = await llm_resilience.call_async(stage, lambda timeout: llm_provider.complete_async(
+        messages, model, max_tokens, response_format=response_format, timeout=timeout
+    ))
+
+    if cache_key is not None and content:
+        await run_blocking(response_cache.set, cache_key, content)
+    return content
+
+# Call a stage's models cheapest first (from `first_tier` on) until validate() accepts a response;
+# returns (accepted result or None, last response)
+async def run_cascade_async(stage: str, messages: List[Dict[str, str]], validate, reject_reason: str = "rejected",
+                            response_format: Optional[Dict[str, Any]] = None, first_tier: int = 0) -> Tuple[Optional[Any], str]:
+    tiers = model_cascades.get(stage) or [DEFAULT_TIER]
+    cascade_metrics.record_call(stage)
+    response = ""
+    first_tier = min(first_tier, len(tiers) - 1)
+    for index, tier in enumerate(tiers[first_tier:], start=first_tier):
+        tier_start = time.perf_counter()
+        response = await generate_response_async(messages, model=tier["model"], max_tokens=tier["max_tokens"],
+                                                 response_format=response_format, stage=stage)
+        result = validate(response)
+        cascade_metrics.record_tier(stage, tier["model"], time.perf_counter() - tier_start, result is not None)
+        if result is not None:
+            return result, response
+
+        if index + 1 < len(tiers):
+            cascade_metrics.record_escalation(stage, reject_reason)
+            logging.debug(f"[{stage}] {tier['model']} output rejected ({reject_reason}); escalating to {tiers[index + 1]['model']}")
+    cascade_metrics.record_exhausted(stage)
+    return None, response
+
+# Generate a response with the first tier of a stage's cascade
+async def generate_for_stage_async(messages: List[Dict[str, str]], stage: str) -> str:
+    return (await run_cascade_async(stage, messages, accept_response))[0]
+
+# Return the asyncpg pool for the running event loop, creating it on first use
+async def get_db_pool() -> asyncpg.Pool:
+    global _db_pool_task, _db_pool_loop
+    loop = asyncio.get_running_loop()
+    failed = _db_pool_task is not None and _db_pool_task.done() and (_db_pool_task.cancelled() or _db_pool_task.exception() is not None)
+    if _db_pool_task is None or _db_pool_loop is not loop or failed:
+        # Concurrent first requests all await the same creation task
+        # create_pool returns an awaitable Pool rather than a coroutine, so it is wrapped with ensure_future
+        _db_pool_task = asyncio.ensure_future(asyncpg.create_pool(
+            database=db_params["dbname"],
+            user=db_params["user"],
+            host=db_params["host"],
+            password=db_params["password"] or None,
+            min_size=1,
+            max_size=int(os.environ.get("ASYNC_DB_POOL_SIZE", 10)),
+            # pgbouncer transaction pooling cannot keep asyncpg's per-connection statement cache
+            statement_cache_size=0 if db_pool.pgbouncer else 100
+        ))
+        _db_pool_loop = loop
+    return await _db_pool_task
+
+# Ask the LLM asynchronously whether the current query requires context from previous conversation
+async def llm_requires_history_async(current_query: str) -> bool:
+    logging.debug(f"Analyzing query for history requirement: '{current_query}'")
+
+    response = await generate_for_stage_async(build_history_check_messages(current_query), "history_check")
+    logging.debug(f"Model's response for history requirement: {response}")
+
+    requires_history = parse_history_decision(response)
+    await run_blocking(log_llm_history_label, current_query, requires_history)
+    return requires_history
+
+# Determine asynchronously if the current query requires context from previous conversation
+async def query_requires_history_async(current_query: str) -> bool:
+    decision = local_history_decision(current_query)
+    if decision is not None:
+        return decision
+
+    return await llm_requires_history_async(current_query)
+
+# Generate context from chat history if the query requires it
+async def generate_context_from_history_async(query: str) -> str:
+    if not await query_requires_history_async(query):
+        return ""
+
+    return format_history_context()
+
+# Parse and expand the user query into a structured format
+async def parse_and_expand_query_async(query: str) -> Optional[Dict[str, Any]]:
+    logging.debug(f"Entering parse_and_expand_query_async with query: {query}")
+
+    parsed_data, response = await run_cascade_async("parse", build_parse_messages(query), lambda raw: validate_parsed_query(raw, query),
+                                                    "invalid_parse", response_format=QUERY_PARSE_RESPONSE_FORMAT)
+    logging.debug(f"Received parse response: {response}")
+    if parsed_data is None:
+        return None
+
+    return finalize_parsed_data(parsed_data)
+
+# Parse a query without conversation context, letting the intent router skip or shorten the LLM parse
+async def parse_bare_query_async(query: str) -> Optional[Dict[str, Any]]:
+    prediction = confident_route(query)
+    if prediction is not None:
+        if route_skips_parse(prediction):
+            record_intent_route("skipped")
+            return build_routed_parse(query, prediction)
+
+        entities = parse_entity_response(await generate_for_stage_async(build_entity_parse_messages(query), "entity_parse"))
+        if entities is not None:
+            record_intent_route("short_prompt")
+            return build_routed_parse(query, prediction, entities)
+
+    record_intent_route("llm")
+    parsed_data = await parse_and_expand_query_async(query)
+    await run_blocking(log_parse_result, query, parsed_data)
+    return parsed_data
+
+# Decide on history and parse the query in one structured-output call
+async def analyze_query_async(query: str) -> Optional[Dict[str, Any]]:
+    parsed_data, response = await run_cascade_async("analysis", build_analysis_messages(query), lambda raw: parse_analysis_response(raw, query),
+                                                    "invalid_analysis", response_format=QUERY_ANALYSIS_RESPONSE_FORMAT)
+    logging.debug(f"Received combined analysis response: {response}")
+
+    return parsed_data
+
+# Generate a SQL query based on the analyzed data from the user's query, optionally for one candidate variant
+async def generate_sql_query_async(analyzed_data: Dict[str, Any], examples: Optional[List[Dict[str, Any]]] = None,
+                                   variant: Optional[Dict[str, Any]] = None) -> Tuple[str, bool]:
+    variant = variant or {}
+    messages = build_sql_messages(analyzed_data, examples, variant.get("instruction", ""))
+    sql_query, raw_response = await run_cascade_async("sql", messages,
+                                                      lambda response: validate_sql_response(response, analyzed_data),
+                                                      "invalid_sql", first_tier=variant.get("tier", 0))
+    if sql_query is None:
+        sql_query = postprocess_sql_response(raw_response, analyzed_data)
+
+    # The first check loads the validator catalog over psycopg2
+    report = await run_blocking(check_sql_locally, sql_query)
+    if not report["errors"]:
+        return report["sql"], False
+
+    # Only problems the validator cannot fix go to the correction stage, without a failed database round trip
+    cascade_metrics.record_escalation("sql", "validation_error")
+    return await correct_query_async(query_for_display(report["sql"], analyzed_data), "; ".join(report["errors"]), analyzed_data), True
+
+# Attempt to correct a SQL query based on the error message and original requirements
+async def correct_query_async(query: str, error_message: str, analyzed_data: Dict[str, Any]) -> str:
+    response = await generate_for_stage_async(build_correction_messages(query, error_message, analyzed_data), "correction")
+    return (await run_blocking(check_sql_locally, clean_sql_response(response)))["sql"]
+
+# Describe a failed asyncpg query, counting statement_timeout cancellations
+def describe_query_error_async(error: Exception) -> str:
+    if isinstance(error, asyncpg.exceptions.QueryCanceledError) and sql_guard is not None:
+        sql_guard.record_timeout()
+        return f"{str(error).strip()} (statement_timeout is {sql_guard.statement_timeout_ms} ms; the query must be cheaper)"
+    return str(error)
+
+# Execute and test the generated SQL query on asyncpg, attempting to correct it if it fails.
+# A candidate in a race is not corrected and runs with the race's timeout; losing candidates are cancelled as tasks.
+async def test_sql_query_async(query: str, analyzed_data: Dict[str, Any], params: Optional[Dict[str, Any]] = None,
+                               race: Optional[SQLRace] = None) -> Dict[str, Any]:
+    async def execute_query(conn, query: str, bound_query: Tuple[str, Dict[str, Any]]) -> Dict[str, Any]:
+        # asyncpg prepares every statement and caches it per connection, so recurring shapes are planned once
+        sql, args = to_positional(*bound_query)
+        generation = sql_result_cache.generation if sql_result_cache is not None else None
+        plan = None
+        if sql_guard is not None:
+            decision = await sql_guard.check_async(conn, sql, args)
+            sql, plan = decision["sql"], decision["plan"]
+        statement = await conn.prepare(sql)
+        timeout = race.timeout_ms / 1000 if race is not None else None
+        if result_streamer is not None:
+            streamed = await result_streamer.fetch_async(conn, statement, args, timeout=timeout)
+            column_names, records = streamed["column_names"], streamed["rows"]
+            truncated, total_row_count = streamed["truncated"], streamed["total_row_count"]
+        else:
+            records = await statement.fetch(*args, timeout=timeout)
+            column_names = [attribute.name for attribute in statement.get_attributes()]
+            truncated, total_row_count = False, len(records)
+        results_dicts = [dict(zip(column_names, record)) for record in records]
+        result = {
+            "success": True,
+            "column_names": column_names,
+            "results": results_dicts,
+            "row_count": len(records),
+            "truncated": truncated,
+            "total_row_count": total_row_count,
+            "executed_sql": query,
+            "plan": plan
+        }
+        if sql_result_cache is not None:
+            sql_result_cache.set(make_result_key(*bound_query), bound_query[0], bound_query[1],
+                                 {field: result[field] for field in CACHED_RESULT_FIELDS}, generation)
+        return result
+
+    bound_query = bind_query(query, analyzed_data, params)
+    cache_key = make_result_key(*bound_query) if sql_result_cache is not None else None
+    if cache_key is not None and not sql_result_cache.version_due():
+        cached = sql_result_cache.get(cache_key)
+        if cached is not None:
+            return cached_query_result(cached, query)
+
+    try:
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            if cache_key is not None and sql_result_cache.version_due():
+                try:
+                    sql_result_cache.set_version(str(await conn.fetchval(sql_result_cache.version_query)))
+                except asyncpg.PostgresError as e:
+                    logging.error(f"Unable to read the data version for the SQL result cache: {str(e)}")
+                    sql_result_cache.set_version(None)
+                cached = sql_result_cache.get(cache_key)
+                if cached is not None:
+                    return cached_query_result(cached, query)
+            if sql_guard is not None:
+                await conn.execute(sql_guard.timeout_statement())
+            try:
+                return await execute_query(conn, query, bound_query)
+            except (asyncpg.PostgresError, QueryRejectedError, asyncio.TimeoutError) as e:
+                error_message = describe_query_error_async(e)
+                logging.error(f"First attempt failed: {error_message}")
+                if params is not None or race is not None:
+                    return {"success": False, "error_message": error_message}
+
+                # The correction runs on the stronger tier configured for the correction stage
+                cascade_metrics.record_escalation("sql", "sql_error")
+                corrected_query = await correct_query_async(query_for_display(query, analyzed_data), error_message, analyzed_data)
+                if corrected_query != query:
+                    logging.debug("Attempting with corrected query:")
+                    logging.debug(corrected_query)
+                    try:
+                        return {**await execute_query(conn, corrected_query, bind_query(corrected_query, analyzed_data)),
+                                "corrected": True}
+                    except (asyncpg.PostgresError, QueryRejectedError) as e2:
+                        return {
+                            "success": False,
+                            "error_message": f"Corrected query also failed: {describe_query_error_async(e2)}",
+                            "correction_attempted": True
+                        }
+                else:
+                    return {
+                        "success": False,
+                        "error_message": f"Unable to correct query: {error_message}",
+                        "correction_attempted": True
+                    }
+
+    except (asyncpg.PostgresError, OSError) as e:
+        return {
+            "success": False,
+            "error_message": f"Database connection error: {str(e)}",
+            "connection_error": True
+        }
+
+# Run the SQL for a data query: a matching template first, the LLM-generated query otherwise
+async def generate_and_test_sql_async(analyzed_data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    plan = build_template_sql(analyzed_data) if sql_templates_enabled else None
+    if plan is not None:
+        test_result = await test_sql_query_async(plan["sql"], analyzed_data, plan["params"])
+        # An empty result usually means the template read the question too narrowly, so the LLM gets a try
+        empty = test_result["success"] and not test_result.get("results")
+        record_template_result(plan["template"], test_result["success"], empty)
+        if (test_result["success"] and not empty) or test_result.get("connection_error"):
+            return display_sql(plan["sql"], plan["params"]), test_result
+        if empty:
+            logging.warning(f"SQL template {plan['template']} returned no rows, falling back to the LLM")
+        else:
+            logging.error(f"SQL template {plan['template']} failed, falling back to the LLM: {test_result['error_message']}")
+
+    # Recurring intents reuse the SQL that last executed successfully for them
+    cached_sql = sql_plan_cache.get(analyzed_data) if sql_plan_cache is not None else None
+    if cached_sql is not None:
+        test_result = await test_sql_query_async(cached_sql, analyzed_data)
+        if test_result["success"] or test_result.get("connection_error"):
+            sql_plan_cache.record_result(analyzed_data, test_result)
+            return query_for_display(cached_sql, analyzed_data), test_result
+        logging.error(f"Cached SQL plan failed, generating a new query: {test_result['error_message']}")
+        sql_plan_cache.invalidate(analyzed_data)
+
+    examples = find_sql_examples(analyzed_data)
+    if sql_candidates is not None:
+        sql_query, test_result, examples = await race_sql_candidates_async(analyzed_data, examples)
+    else:
+        sql_query, test_result = await generate_and_test_candidate_async(analyzed_data, examples)
+    logging.debug(f"Generated SQL Query: {sql_query}")
+    if sql_plan_cache is not None:
+        sql_plan_cache.record_result(analyzed_data, test_result)
+    await run_blocking(record_generated_sql, analyzed_data, examples, test_result)
+    return query_for_display(sql_query, analyzed_data), test_result
+
+# Generate one SQL query and run it, alone or as a candidate in a race
+async def generate_and_test_candidate_async(analyzed_data: Dict[str, Any], examples: List[Dict[str, Any]],
+                                            variant: Optional[Dict[str, Any]] = None,
+                                            race: Optional[SQLRace] = None) -> Tuple[str, Dict[str, Any]]:
+    if variant is not None and not variant["examples"]:
+        examples = []
+    sql_query, validation_corrected = await generate_sql_query_async(analyzed_data, examples, variant)
+    if race is not None and race.settled:
+        return sql_query, {"success": False, "error_message": "Another SQL candidate already succeeded", "cancelled": True}
+    test_result = await test_sql_query_async(sql_query, analyzed_data, race=race)
+    return sql_query, {**test_result, "validation_corrected": validation_corrected}
+
+# Generate and run SQL candidates concurrently; the first sane result wins and the other tasks are cancelled.
+# Without a sane winner, a successful empty result is used, otherwise one correction of the first variant's failure.
+async def race_sql_candidates_async(analyzed_data: Dict[str, Any],
+                                    examples: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any], List[Dict[str, Any]]]:
+    outcome = await sql_candidates.run_async(
+        lambda variant, race: generate_and_test_candidate_async(analyzed_data, examples, variant, race))
+    if outcome["winner"] is not None:
+        return outcome["sql"], outcome["result"], examples if outcome["winner"]["examples"] else []
+
+    attempts = [attempt for attempt in outcome["attempts"] if not attempt[2].get("cancelled")]
+    if not attempts:
+        sql_query, test_result = await generate_and_test_candidate_async(analyzed_data, examples)
+        return sql_query, test_result, examples
+    for variant, sql_query, test_result in attempts:
+        if test_result["success"] or test_result.get("connection_error"):
+            return sql_query, test_result, examples if variant["examples"] else []
+
+    variant, sql_query, test_result = min(attempts, key=lambda attempt: sql_candidates.variants.index(attempt[0]))
+    cascade_metrics.record_escalation("sql", "sql_error")
+    corrected_query = await correct_query_async(query_for_display(sql_query, analyzed_data), test_result["error_message"], analyzed_data)
+    test_result = await test_sql_query_async(corrected_query, analyzed_data)
+    return corrected_query, {**test_result, "correction_attempted": True}, examples if variant["examples"] else []
+
+# Handle non-hockey related queries
+async def handle_non_hockey_query_async(query: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    nl_answer = await generate_for_stage_async(
+        build_non_hockey_answer_messages(query, result['expanded_query']), "answer_non_hockey"
+    )
+    return {"natural_language_answer": nl_answer, "hockey_related": False}
+
+# Handle hockey-related queries that don't require specific data
+async def handle_hockey_query_without_data_async(query: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    nl_answer = await generate_for_stage_async(
+        build_hockey_without_data_answer_messages(query, result), "answer_general"
+    )
+    return {"natural_language_answer": nl_answer, "hockey_related": True, "requires_data": False}
+
+# Handle hockey-related queries that require specific data
+async def handle_hockey_query_with_data_async(query: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    sql_query, test_result = await generate_and_test_sql_async(result)
+    if test_result["success"]:
+        nl_answer = await generate_for_stage_async(
+            build_answer_with_data_messages(query, result['expanded_query'], sql_query, test_result['results']),
+            "answer_with_data"
+        )
+        return {
+            "natural_language_answer": nl_answer,
+            "sql_query": sql_query,
+            "result_summary": {
+                "row_count": test_result['row_count'],
+                "truncated": test_result.get('truncated', False),
+                "total_row_count": test_result.get('total_row_count'),
+                "columns": test_result['column_names']
+            },
+            "query_plan": test_result.get('plan')
+        }
+
+    logging.debug(f"Query execution failed: {test_result['error_message']}")
+    error_response = await generate_for_stage_async(
+        build_error_response_messages(query, result['expanded_query'], test_result['error_message']),
+        "answer_error"
+    )
+    return {
+        "natural_language_answer": error_response,
+        "sql_query": sql_query,
+        "error": test_result['error_message']
+    }
+
+# Run the history check and a speculative parse of the bare query concurrently
+async def parse_with_speculation_async(query: str) -> Optional[Dict[str, Any]]:
+    # A confident local decision leaves nothing to speculate on
+    decision = local_history_decision(query)
+    if decision is not None:
+        if not decision:
+            return await parse_bare_query_async(query)
+        return await parse_and_expand_query_async(f"{format_history_context()}\n\nCurrent query: {query}")
+
+    speculative_parse = asyncio.create_task(parse_bare_query_async(query))
+
+    try:
+        requires_history = await llm_requires_history_async(query)
+    except BaseException:
+        speculative_parse.cancel()
+        raise
+
+    if not requires_history:
+        record_speculation(wasted=False)
+        return await speculative_parse
+
+    # History is needed, so the in-flight bare-query parse is cancelled
+    speculative_parse.cancel()
+    record_speculation(wasted=True)
+    logging.debug("Speculative parse discarded; re-parsing with conversation context.")
+    return await parse_and_expand_query_async(f"{format_history_context()}\n\nCurrent query: {query}")
+
+# Resolve conversation context and parse the query into structured data
+async def resolve_parsed_query_async(query: str) -> Optional[Dict[str, Any]]:
+    if query_analysis_mode == "combined":
+        return await analyze_query_async(query)
+
+    if speculative_parse_enabled:
+        return await parse_with_speculation_async(query)
+
+    context = await generate_context_from_history_async(query)
+    if not context:
+        return await parse_bare_query_async(query)
+
+    return await parse_and_expand_query_async(f"{context}\n\nCurrent query: {query}")
+
+# Process a user query without blocking on network I/O and return the appropriate response
+async def process_query_async(query: str) -> Dict[str, Any]:
+    logging.debug(f"\n--- Processing Query (async): {query} ---")
+
+    analysis_start = time.perf_counter()
+    result = await resolve_parsed_query_async(query)
+    record_stage_latency(f"analysis_{query_analysis_mode}", time.perf_counter() - analysis_start)
+    if not result:
+        return handle_failed_query()
+
+    if not result['hockey_related']:
+        response = await handle_non_hockey_query_async(query, result)
+    elif result['hockey_related'] and result['query_intent'] == 'general':
+        response = await handle_hockey_query_without_data_async(query, result)
+    else:
+        response = await handle_hockey_query_with_data_async(query, result)
+
+    update_chat_history(query, response['natural_language_answer'])
+
+    return response
+
+# Return the shared background event loop, starting its thread on first use
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None or _background_loop.is_closed():
+            _background_loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_background_loop.run_forever, name="rag-async-loop", daemon=True)
+            thread.start()
+        return _background_loop
+
+# Run process_query_async on the shared loop from a WSGI worker thread and wait for the result,
+# sharing the run with identical concurrent questions. Only the calling thread waits, never the loop;
+# a question still running after async_query_timeout is cancelled on the loop so it stops holding connections.
+def run_query_in_background_loop(query: str) -> Dict[str, Any]:
+    def run_on_loop(query: str) -> Dict[str, Any]:
+        future = asyncio.run_coroutine_threadsafe(process_query_async(query), get_background_loop())
+        try:
+            return future.result(timeout=async_query_timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Query did not finish within {async_query_timeout:g}s")
+
+    return coalesce_query(query, run_on_loop)
+
+def main():
+    print("Welcome to the Hockey Stats Query System (async)!")
+    print("Enter your queries below. Type 'exit' to quit the program.")
+
+    while True:
+        user_query = input("\nEnter your query: ").strip()
+
+        if user_query.lower() == 'exit':
+            print("Thank you for using the Hockey Stats Query System. Goodbye!")
+            break
+
+        result = asyncio.run(process_query_async(user_query))
+        print(json.dumps(result, indent=2, default=str))
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,66 @@
 import sys
 import os
 import json
+import hashlib
 import re
 import logging
 import requests
 import openai
 import csv
 import psycopg2
+import threading
+import time
+import random
 
 from dotenv import load_dotenv
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tabulate import tabulate
 from lookup_table import hockey_stats_schema
 from simplified_hockey_stats_schema import simplified_hockey_stats_schema
-from openai import OpenAI
+from response_cache import make_cache_key, response_cache_from_env
+from history_classifier import classify_history_need, log_history_decision
+from context_packer import pack_schema_columns, pack_history, pack_result_table, check_instructions, get_packer_stats
+from singleflight import SingleFlight
+from resilience import resilient_caller_from_env
+from llm_providers import provider_from_env
+from model_cascade import cascades_from_env, CascadeMetrics, DEFAULT_TIER
+from sql_plan_cache import sql_plan_cache_from_env
+from sql_validator import sql_validator_from_env, load_database_catalog, schema_catalog
+from sql_guard import sql_guard_from_env, QueryRejectedError
+from sql_templates import build_template_sql, record_template_result, get_template_stats, display_sql
+from sql_params import bind_parameters, get_bind_stats, prepared_statements_from_env
+from sql_examples import sql_example_store_from_env, format_examples
+from sql_candidates import sql_candidate_runner_from_env, SQLRace, result_is_sane
+from db_pool import db_pool_from_env, PoolTimeoutError
+from materialized_views import VIEW_NAMES, existing_views
+from result_stream import result_streamer_from_env
+from sql_result_cache import sql_result_cache_from_env, make_result_key
+from intent_router import DEFAULT_MODEL_PATH, load_model, predict, route_is_confident, log_parsed_query
 from psycopg2 import sql
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Iterator, Tuple
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Load environment variables from a .env file if it exists
 load_dotenv()
 
-# Ensure you have set the OPENAI_API_KEY environment variable
+# LLM backend for every stage: "openai" (default), "ollama" or "fake"
+llm_provider_name = os.environ.get("LLM_PROVIDER", "openai").lower()
+
+# Ensure you have set the OPENAI_API_KEY environment variable when using OpenAI
 api_key = os.environ.get('OPENAI_API_KEY')
-if not api_key:
+if llm_provider_name == "openai" and not api_key:
     raise ValueError("OPENAI_API_KEY environment variable not set")
 
 # Set the API key for the OpenAI library
 openai.api_key = api_key
 
-# Initialize the OpenAI client with your API key
-client = OpenAI(api_key=api_key)
+# Provider shared by the sync, async and streaming pipelines; retries are handled by llm_resilience
+llm_provider = provider_from_env(api_key)
+
+# Timeouts, retries, hedging and circuit breaker for every LLM call (configured with LLM_* environment variables)
+llm_resilience = resilient_caller_from_env()
 
 
 # Database connection parameters
@@ -43,19 +71,310 @@ db_params = {
     "password": os.environ.get("DB_PASSWORD", "")
 }
 
+# Pooled, read-only database connections shared by every request (configured with DB_POOL_* environment variables)
+db_pool = db_pool_from_env(db_params)
+
 # Chat memory implementation
 chat_history = deque(maxlen=3)
 
+# Cache for identical LLM requests (configured with LLM_CACHE_* environment variables)
+response_cache = response_cache_from_env()
+
+# Run parse_and_expand_query on the bare query while the history check is in flight
+speculative_parse_enabled = os.environ.get("SPECULATIVE_PARSE", "true").lower() in ("1", "true", "yes")
+speculation_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("SPECULATION_WORKERS", 8)),
+    thread_name_prefix="speculative-parse"
+)
+speculation_metrics = {"runs": 0, "wasted": 0}
+speculation_lock = threading.Lock()
+
+# Let the local heuristic classifier answer the history check when it is confident
+history_classifier_enabled = os.environ.get("HISTORY_CLASSIFIER", "true").lower() in ("1", "true", "yes")
+history_check_metrics = {"local": 0, "llm": 0, "audited": 0}
+history_check_lock = threading.Lock()
+
+# JSONL file receiving LLM-labelled history checks, scored with `python history_classifier.py <file>`.
+# HISTORY_AUDIT_RATE also sends that fraction of local decisions to the LLM in the background for a label.
+history_log_path = os.environ.get("HISTORY_LOG_PATH") or None
+history_audit_rate = float(os.environ.get("HISTORY_AUDIT_RATE", 0))
+
+# "legacy" runs the history check and parse stages, "combined" uses one structured-output call
+query_analysis_mode = os.environ.get("QUERY_ANALYSIS_MODE", "legacy").lower()
+
+# Characters kept from each previous answer when history is passed to the combined analysis
+history_response_chars = int(os.environ.get("HISTORY_RESPONSE_CHARS", 400))
+
+# Offline-trained intent router that can skip or shorten the LLM parse of context-free queries
+intent_router_enabled = os.environ.get("INTENT_ROUTER", "true").lower() in ("1", "true", "yes")
+intent_router_model = load_model(os.environ.get("INTENT_ROUTER_MODEL", DEFAULT_MODEL_PATH)) if intent_router_enabled else None
+intent_router_confidence = float(os.environ.get("INTENT_ROUTER_CONFIDENCE", 0.9))
+intent_router_metrics = {"skipped": 0, "short_prompt": 0, "llm": 0}
+intent_router_lock = threading.Lock()
+
+# JSONL file receiving every LLM parse of a bare query, used as router training data
+query_log_path = os.environ.get("QUERY_LOG_PATH") or None
+
+# Share one pipeline run between identical concurrent questions asked against the same chat history
+singleflight_enabled = os.environ.get("SINGLEFLIGHT", "true").lower() in ("1", "true", "yes")
+query_flights = SingleFlight()
+
+# Model tiers and token caps per stage (LLM_CASCADE_<STAGE>), escalated only when a cheaper tier's output is rejected
+model_cascades = cascades_from_env()
+cascade_metrics = CascadeMetrics()
+
+# Answer common question shapes with deterministic SQL templates before asking the LLM for SQL
+sql_templates_enabled = os.environ.get("SQL_TEMPLATES", "true").lower() in ("1", "true", "yes")
+
+# Last successful SQL per canonical intent (configured with SQL_PLAN_CACHE_* environment variables)
+sql_plan_cache = sql_plan_cache_from_env()
+
+# Local validation and repair of generated SQL against the schema before execution.
+# SQL_VALIDATOR_CATALOG=database resolves identifiers against the live catalog instead of the simplified schema.
+sql_validator = sql_validator_from_env()
+sql_validator_catalog = os.environ.get("SQL_VALIDATOR_CATALOG", "schema").lower()
+sql_validator_catalog_loaded = False
+sql_validator_lock = threading.Lock()
+
+# EXPLAIN cost check and statement_timeout for every query (configured with SQL_GUARD_* environment variables)
+sql_guard = sql_guard_from_env()
+
+# Verified question/SQL examples retrieved into the SQL prompt (configured with SQL_EXAMPLES* environment variables)
+sql_examples = sql_example_store_from_env()
+
+# Concurrent SQL candidates from prompt variants, first sane success wins (SQL_CANDIDATES > 1 enables it)
+sql_candidates = sql_candidate_runner_from_env()
+
+# Query results streamed from server-side cursors under a row and byte budget (SQL_STREAM, on by default)
+result_streamer = result_streamer_from_env()
+
+# Query results shared across requests, keyed on normalized SQL and parameters (SQL_RESULT_CACHE, on by default)
+sql_result_cache = sql_result_cache_from_env()
+CACHED_RESULT_FIELDS = ("column_names", "results", "row_count", "truncated", "total_row_count", "plan")
+
+# Career and tenure views offered to the parse and SQL stages (CAREER_VIEWS): "auto" (default) offers the views
+# found populated in pg_matviews at startup, "true" all of them, "false" none
+def career_views_from_env() -> List[str]:
+    setting = os.environ.get("CAREER_VIEWS", "auto").lower()
+    if setting in ("0", "false", "no"):
+        return []
+    if setting in ("1", "true", "yes"):
+        return list(VIEW_NAMES)
+    try:
+        with db_pool.connection() as conn:
+            views = existing_views(conn)
+    except (psycopg2.Error, PoolTimeoutError) as e:
+        logging.warning(f"Unable to look up the career views, leaving them out of the prompts: {str(e)}")
+        return []
+    missing = [name for name in VIEW_NAMES if name not in views]
+    if missing:
+        logging.warning(f"Career views not created or not populated, leaving them out of the prompts: {', '.join(missing)}. "
+                        f"Run python backend/materialized_views.py create")
+    return views
+
+career_views = career_views_from_env()
+missing_career_views = {name for name in VIEW_NAMES if name not in career_views}
+# The simplified schema describes every view, so the ones missing from the database are dropped from its catalog
+if sql_validator is not None and sql_validator_catalog == "schema" and missing_career_views:
+    sql_validator.set_catalog({table: columns for table, columns in schema_catalog().items() if table not in missing_career_views})
+
+# Server-side PREPARE for recurring parameterized query shapes (SQL_PREPARE, off by default).
+# Prepared statements live in a server session, so they need autocommit connections and no transaction pooling,
+# and a server-side cursor cannot run them, so they only apply when results are not streamed.
+prepared_statements = prepared_statements_from_env() if db_pool.autocommit and result_streamer is None else None
+if prepared_statements is not None:
+    db_pool.add_close_listener(prepared_statements.forget)
+
+# Wall time per pipeline stage, for comparing analysis modes
+stage_latency_metrics: Dict[str, Dict[str, float]] = {}
+stage_latency_lock = threading.Lock()
+
 logging.basicConfig(level=logging.DEBUG)
 
-# Generate a response using the OpenAI API based on given messages and parameters
-def generate_response(messages: List[Dict[str, str]], model: str = "gpt-4o-mini", max_tokens: int = 300) -> str:
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        max_tokens=max_tokens
-    )
-    return response.choices[0].message.content
+# Cache key for a completion, scoped to the provider and the model it actually serves
+def completion_cache_key(model: str, messages: List[Dict[str, str]], max_tokens: int,
+                         response_format: Optional[Dict[str, Any]] = None) -> str:
+    return make_cache_key(f"{llm_provider.name}/{llm_provider.resolve_model(model)}", messages, max_tokens, response_format)
+
+# Generate a response from the configured LLM provider based on given messages and parameters
+def generate_response(messages: List[Dict[str, str]], model: str = "gpt-4o-mini", max_tokens: int = 300,
+                      response_format: Optional[Dict[str, Any]] = None, stage: str = "default") -> str:
+    cache_key = None
+    if response_cache is not None:
+        cache_key = completion_cache_key(model, messages, max_tokens, response_format)
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            logging.debug("LLM response served from cache")
+            return cached_response
+
+    content = llm_resilience.call(stage, lambda timeout: llm_provider.complete(
+        messages, model, max_tokens, response_format=response_format, timeout=timeout
+    ))
+
+    if cache_key is not None and content:
+        response_cache.set(cache_key, content)
+    return content
+
+# Stream a response from the configured LLM provider, yielding content fragments as they arrive
+def stream_response(messages: List[Dict[str, str]], model: str = "gpt-4o-mini", max_tokens: int = 300,
+                    stage: str = "default") -> Iterator[str]:
+    cache_key = None
+    if response_cache is not None:
+        cache_key = completion_cache_key(model, messages, max_tokens)
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            logging.debug("LLM response served from cache")
+            yield cached_response
+            return
+
+    # Retries only cover opening the stream; once fragments are yielded they cannot be taken back
+    stream = llm_resilience.call(stage, lambda timeout: llm_provider.stream(
+        messages, model, max_tokens, timeout=timeout
+    ), hedge=False)
+    fragments = []
+    for fragment in stream:
+        fragments.append(fragment)
+        yield fragment
+
+    if cache_key is not None and fragments:
+        response_cache.set(cache_key, "".join(fragments))
+
+# Return the model and token cap of one tier of a stage's cascade
+def stage_tier(stage: str, index: int = 0) -> Dict[str, Any]:
+    tiers = model_cascades.get(stage) or [DEFAULT_TIER]
+    return tiers[min(index, len(tiers) - 1)]
+
+# Call a stage's models cheapest first (from `first_tier` on) until validate() accepts a response;
+# returns (accepted result or None, last response)
+def run_cascade(stage: str, messages: List[Dict[str, str]], validate, reject_reason: str = "rejected",
+                response_format: Optional[Dict[str, Any]] = None, first_tier: int = 0) -> Tuple[Optional[Any], str]:
+    tiers = model_cascades.get(stage) or [DEFAULT_TIER]
+    cascade_metrics.record_call(stage)
+    response = ""
+    first_tier = min(first_tier, len(tiers) - 1)
+    for index, tier in enumerate(tiers[first_tier:], start=first_tier):
+        tier_start = time.perf_counter()
+        response = generate_response(messages, model=tier["model"], max_tokens=tier["max_tokens"],
+                                     response_format=response_format, stage=stage)
+        result = validate(response)
+        cascade_metrics.record_tier(stage, tier["model"], time.perf_counter() - tier_start, result is not None)
+        if result is not None:
+            return result, response
+
+        if index + 1 < len(tiers):
+            cascade_metrics.record_escalation(stage, reject_reason)
+            logging.debug(f"[{stage}] {tier['model']} output rejected ({reject_reason}); escalating to {tiers[index + 1]['model']}")
+    cascade_metrics.record_exhausted(stage)
+    return None, response
+
+# Accept any response; used for stages without an output check
+def accept_response(response: str) -> str:
+    return response
+
+# Generate a response with the first tier of a stage's cascade
+def generate_for_stage(messages: List[Dict[str, str]], stage: str) -> str:
+    return run_cascade(stage, messages, accept_response)[0]
+
+# Record the outcome of one speculative parse
+def record_speculation(wasted: bool) -> None:
+    with speculation_lock:
+        speculation_metrics["runs"] += 1
+        if wasted:
+            speculation_metrics["wasted"] += 1
+
+# Report how often the speculative parse had to be thrown away
+def get_speculation_stats() -> Dict[str, Any]:
+    with speculation_lock:
+        runs = speculation_metrics["runs"]
+        wasted = speculation_metrics["wasted"]
+    return {
+        "enabled": speculative_parse_enabled,
+        "runs": runs,
+        "wasted": wasted,
+        "waste_rate": round(wasted / runs, 4) if runs else 0.0
+    }
+
+# Record the wall time of one pipeline stage
+def record_stage_latency(stage: str, seconds: float) -> None:
+    with stage_latency_lock:
+        entry = stage_latency_metrics.setdefault(stage, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        entry["count"] += 1
+        entry["total_seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+# Summarize stage latencies as count, mean and max in milliseconds
+def get_stage_latency_stats() -> Dict[str, Any]:
+    with stage_latency_lock:
+        return {
+            stage: {
+                "count": int(entry["count"]),
+                "avg_ms": round(1000 * entry["total_seconds"] / entry["count"], 1),
+                "max_ms": round(1000 * entry["max_seconds"], 1)
+            }
+            for stage, entry in stage_latency_metrics.items()
+        }
+
+# Report how many history checks were decided locally versus by the LLM
+def get_history_check_stats() -> Dict[str, Any]:
+    with history_check_lock:
+        local = history_check_metrics["local"]
+        llm = history_check_metrics["llm"]
+        audited = history_check_metrics["audited"]
+    return {
+        "classifier_enabled": history_classifier_enabled,
+        "local": local,
+        "llm": llm,
+        "audited": audited,
+        "local_rate": round(local / (local + llm), 4) if local + llm else 0.0
+    }
+
+# Count how a bare-query parse was resolved: skipped, short prompt, or full LLM parse
+def record_intent_route(route: str) -> None:
+    with intent_router_lock:
+        intent_router_metrics[route] += 1
+
+# Report how often the intent router saved the full LLM parse
+def get_intent_router_stats() -> Dict[str, Any]:
+    with intent_router_lock:
+        counts = dict(intent_router_metrics)
+    total = sum(counts.values())
+    model = intent_router_model or {}
+    return {
+        "loaded": intent_router_model is not None,
+        "trained_at": model.get("trained_at"),
+        "example_count": model.get("example_count"),
+        "confidence_threshold": intent_router_confidence,
+        **counts,
+        "routed_rate": round((counts["skipped"] + counts["short_prompt"]) / total, 4) if total else 0.0
+    }
+
+# Collect runtime counters for the metrics endpoint
+def get_metrics() -> Dict[str, Any]:
+    return {
+        "llm_provider": llm_provider.stats(),
+        "llm_cache": response_cache.stats() if response_cache is not None else None,
+        "speculative_parse": get_speculation_stats(),
+        "history_check": get_history_check_stats(),
+        "intent_router": get_intent_router_stats(),
+        "parse_repair": get_parse_repair_stats(),
+        "sql_templates": {"enabled": sql_templates_enabled, **get_template_stats()},
+        "sql_plan_cache": sql_plan_cache.stats() if sql_plan_cache is not None else None,
+        "sql_validator": sql_validator.stats() if sql_validator is not None else None,
+        "sql_guard": sql_guard.stats() if sql_guard is not None else None,
+        "sql_examples": sql_examples.stats() if sql_examples is not None else None,
+        "sql_candidates": sql_candidates.stats() if sql_candidates is not None else None,
+        "sql_params": {**get_bind_stats(),
+                       "prepared": prepared_statements.stats() if prepared_statements is not None else None},
+        "singleflight": {"enabled": singleflight_enabled, **query_flights.stats()},
+        "llm_resilience": llm_resilience.stats(),
+        "db_pool": db_pool.stats(),
+        "result_stream": result_streamer.stats() if result_streamer is not None else None,
+        "sql_result_cache": sql_result_cache.stats() if sql_result_cache is not None else None,
+        "model_cascade": cascade_metrics.stats(),
+        "query_analysis_mode": query_analysis_mode,
+        "stage_latency": get_stage_latency_stats(),
+        "context_packer": get_packer_stats()
+    }
 
 # Update the chat history with a new query-response pair
 def update_chat_history(query: str, response: str) -> None:
@@ -65,10 +384,8 @@ def update_chat_history(query: str, response: str) -> None:
 def get_chat_history() -> deque:
     return chat_history
 
-# Determine if the current query requires context from previous conversation
-def query_requires_history(current_query: str) -> bool:
-    logging.debug(f"Analyzing query for history requirement: '{current_query}'")
-
+# Build the messages asking the model whether a query depends on earlier conversation
+def build_history_check_messages(current_query: str) -> List[Dict[str, str]]:
     system_content = """
     Your task is to determine if the current query requires context from a previous conversation to be answered accurately and completely.
     Look for references to previous information, follow-up questions, or implicit context that relies on a previous exchange.
@@ -80,14 +397,13 @@ def query_requires_history(current_query: str) -> bool:
     Does the current query require information from a previous conversation to be answered accurately?
     Respond with only True or False, followed by a brief explanation."""
 
-    messages = [
+    return [
         {"role": "system", "content": system_content},
         {"role": "user", "content": prompt}
     ]
 
-    response = generate_response(messages)
-    logging.debug(f"Model's response for history requirement: {response}")
-
+# Interpret the model's True/False answer to the history check
+def parse_history_decision(response: str) -> bool:
     decision, explanation = response.strip().split('\n', 1) if '\n' in response else (response.strip(), "")
     requires_history = decision.lower() == 'true'
 
@@ -96,22 +412,92 @@ def query_requires_history(current_query: str) -> bool:
 
     return requires_history
 
-# Generate context from chat history if the query requires it
-def generate_context_from_history(query: str) -> str:
-    if not query_requires_history(query):
-        return ""
+# Append an LLM history decision to the label log, with the history it was made against
+def log_llm_history_label(query: str, requires_history: bool, history: Optional[List[Dict[str, str]]] = None,
+                          local_decision: Optional[bool] = None) -> None:
+    if history_log_path is None:
+        return
+    history = list(chat_history) if history is None else history
+    log_history_decision(history_log_path, query, history, requires_history, local_decision)
+
+# Ask the LLM about a query the classifier already decided, only to log its answer as a label
+def audit_history_decision(query: str, history: List[Dict[str, str]], local_decision: bool) -> None:
+    try:
+        response = generate_for_stage(build_history_check_messages(query), "history_check")
+    except Exception as e:
+        logging.warning(f"History check audit failed: {str(e)}")
+        return
+    log_llm_history_label(query, parse_history_decision(response), history, local_decision)
+
+# Decide the history requirement locally, returning None when the LLM has to decide
+def local_history_decision(current_query: str) -> Optional[bool]:
+    if not history_classifier_enabled:
+        return None
+
+    history = list(chat_history)
+    decision, confidence = classify_history_need(current_query, history)
+    audit = (decision is not None and bool(history) and history_log_path is not None
+             and random.random() < history_audit_rate)
+    with history_check_lock:
+        history_check_metrics["local" if decision is not None else "llm"] += 1
+        history_check_metrics["audited"] += audit
+    if audit:
+        speculation_executor.submit(audit_history_decision, current_query, history, decision)
+
+    if decision is None:
+        logging.debug(f"History classifier is unsure (confidence {confidence:.2f}); asking the LLM.")
+    else:
+        logging.debug(f"History classifier decided {decision} with confidence {confidence:.2f}.")
+    return decision
+
+# Ask the LLM whether the current query requires context from previous conversation
+def llm_requires_history(current_query: str) -> bool:
+    logging.debug(f"Analyzing query for history requirement: '{current_query}'")
 
+    response = generate_for_stage(build_history_check_messages(current_query), "history_check")
+    logging.debug(f"Model's response for history requirement: {response}")
+
+    requires_history = parse_history_decision(response)
+    log_llm_history_label(current_query, requires_history)
+    return requires_history
+
+# Determine if the current query requires context from previous conversation
+def query_requires_history(current_query: str) -> bool:
+    decision = local_history_decision(current_query)
+    if decision is not None:
+        return decision
+
+    return llm_requires_history(current_query)
+
+# Format the stored chat history as a context block for the parse prompt
+def format_history_context() -> str:
     context = "Previous conversation:\n"
-    for exchange in chat_history:
+    for exchange in pack_history(list(chat_history), "history_context"):
         context += f"User: {exchange['query']}\nAssistant: {exchange['response']}\n\n"
 
     return context.strip()
 
-# Parse and expand the user query into a structured format
-def parse_and_expand_query(query: str) -> Dict[str, Any]:
-    logging.debug(f"Entering parse_and_expand_query with query: {query}")
+# Generate context from chat history if the query requires it
+def generate_context_from_history(query: str) -> str:
+    if not query_requires_history(query):
+        return ""
+
+    return format_history_context()
+
+# Career and tenure views described to the parse stages, when they exist
+CAREER_VIEW_DESCRIPTIONS = {
+    "player_career_totals": "Career totals of every skater over all seasons, one row per player, situation and season_type ('regular_season', 'playoffs' or 'combined'), such as goals, assists, points and points per game.",
+    "goalie_career_totals": "Career totals of every goalie over all seasons, one row per goalie, situation and season_type, such as saves, save percentage and goals saved above expected.",
+    "team_career_totals": "All-time totals of every team over all seasons, one row per team, situation and season_type, such as wins, losses, goals for and goals against.",
+    "player_team_tenures": "Totals of every skater with each team they played for, over all seasons with that team.",
+    "goalie_team_tenures": "Totals of every goalie with each team they played for, over all seasons with that team."
+}
+career_view_lines = "".join(f"\n    {name}: {CAREER_VIEW_DESCRIPTIONS[name]}" for name in career_views)
+if career_views:
+    career_view_lines += "\n\n    Use the career, all-time and tenure tables for totals over all seasons (career, all-time, since 2008, regular season and playoffs combined) instead of the season tables."
 
-    system_content = """You are an AI assistant specialized in analyzing hockey statistics queries. You have access to the following tables in the hockey statistics database:
+# System prompt shared by the parse and table selection requests
+PARSE_SYSTEM_CONTENT = f"""You are an AI assistant specialized in analyzing hockey statistics queries. You have access to the following tables in the hockey statistics database:
 
     List of tables in database:
     player_stats_regular_season: Contains individual statistics for skaters (excluding goalies) during regular season games, such as goals, assists, points, plus/minus, and penalty minutes.
@@ -122,7 +508,7 @@ def parse_and_expand_query(query: str) -> Dict[str, Any]:
     team_stats_playoffs: Contains aggregated statistics for teams during the playoffs, including total wins, losses, goals for, goals against, power play percentage, and penalty kill percentage.
     team_games: Includes game-by-game statistics for teams, detailing the results of each game, including goals scored, goals allowed, and other team performance metrics.
     lines_and_pairings: Provides information about player lines and defensive pairings for regular season games, indicating which players were on the ice together.
-    lines_and_pairings_playoffs: Provides information about player lines and defensive pairings for playoff games, showing the combinations of players on the ice.
+    lines_and_pairings_playoffs: Provides information about player lines and defensive pairings for playoff games, showing the combinations of players on the ice.{career_view_lines}
 
     Analyze hockey queries and provide a JSON output with specific fields. Follow these instructions:
 
@@ -137,6 +523,8 @@ def parse_and_expand_query(query: str) -> Dict[str, Any]:
 
     If "query_intent" is "stats" but "required_tables" is empty, analyze the query again and select the most appropriate table(s) based on the statistics requested."""
 
+# Build the messages for parsing and expanding a user query
+def build_parse_messages(query: str) -> List[Dict[str, str]]:
     prompt = f"""Analyze the following hockey query and provide a JSON output with specific fields:
 
     Query: '{query}'
@@ -154,57 +542,391 @@ def parse_and_expand_query(query: str) -> Dict[str, Any]:
 
     Provide only the JSON output, without any additional explanation."""
 
-    messages = [
-        {"role": "system", "content": system_content},
+    return [
+        {"role": "system", "content": PARSE_SYSTEM_CONTENT},
         {"role": "user", "content": prompt}
     ]
 
-    def clean_response(response: str) -> str:
-        response = re.sub(r'^```json\s*', '', response)
-        response = re.sub(r'\s*```$', '', response)
-        return response.strip()
+# Strip Markdown code fences from a JSON model response
+def clean_json_response(response: str) -> str:
+    response = re.sub(r'^```json\s*', '', response)
+    response = re.sub(r'\s*```$', '', response)
+    return response.strip()
+
+# Keyword rules for choosing tables locally when a stats parse names none, checked in order
+TABLE_REPAIR_RULES = [
+    (r'\b(line|lines|linemates?|pairings?|d-?pairs?|trios?)\b', "lines_and_pairings"),
+    (r'\b(goalies?|goaltend\w*|saves?|save percentage|sv%|gaa|goals against|shutouts?|netminders?)\b', "goalie_stats_regular_season"),
+    (r'\b(games?|schedule|home|away|head[- ]to[- ]head|matchups?|vs\.?|versus)\b', "team_games"),
+    (r'\b(teams?|standings|records?|franchises?|wins|losses)\b', "team_stats")
+]
+PLAYOFF_PATTERN = re.compile(r'\b(playoffs?|postseason|stanley cup)\b', re.IGNORECASE)
+# A four-digit season start year, as in "2022", "2022-23", "2022/2023" or "20222023"
+SEASON_PATTERN = re.compile(r'^\s*((?:19|20)\d{2})(?:\s*[-/]\s*(?:\d{2}|\d{4})|\d{4})?(?:\s+season)?\s*$', re.IGNORECASE)
+
+# Counters for parse responses fixed locally instead of re-prompting
+parse_repair_metrics = {"parses": 0, "tables_repaired": 0, "tables_dropped": 0, "fields_defaulted": 0, "seasons_mapped": 0,
+                        "seasons_dropped": 0, "career_views": 0}
+parse_repair_lock = threading.Lock()
+
+def record_parse_repair(counter: str, amount: int = 1) -> None:
+    with parse_repair_lock:
+        parse_repair_metrics[counter] += amount
+
+def get_parse_repair_stats() -> Dict[str, Any]:
+    with parse_repair_lock:
+        return dict(parse_repair_metrics)
+
+# Read a parsed season as its start year (the season column's convention), or None if it is not a season
+def parse_season(season: Any) -> Optional[int]:
+    if isinstance(season, bool):
+        return None
+    if isinstance(season, int):
+        return season
+    match = SEASON_PATTERN.match(str(season))
+    return int(match.group(1)) if match else None
+
+# Choose tables for a stats query from its wording: players by default, playoff tables when playoffs are mentioned
+def repair_required_tables(parsed_data: Dict[str, Any], query: str) -> List[str]:
+    text = f"{query} {parsed_data.get('expanded_query', '')}"
+    table = "player_stats_regular_season"
+    for pattern, candidate in TABLE_REPAIR_RULES:
+        if re.search(pattern, text, re.IGNORECASE):
+            # Team words only pick team tables when no player is named
+            if candidate.startswith("team_") and parsed_data.get("player_names"):
+                continue
+            table = candidate
+            break
+
+    if PLAYOFF_PATTERN.search(text) and table != "team_games":
+        table = "team_stats_playoffs" if table == "team_stats" else table.replace("_regular_season", "_playoffs").replace("pairings", "pairings_playoffs")
+    return [table]
+
+# Bring a parse result into the expected shape: known tables only, valid enums, list fields present,
+# and at least one table for stats queries
+def normalize_parsed_query(parsed_data: Dict[str, Any], query: str) -> Dict[str, Any]:
+    record_parse_repair("parses")
+    defaults = {"expanded_query": query, "player_names": [], "team_abbreviations": [], "required_tables": [], "seasons": []}
+    for field, default in defaults.items():
+        if not isinstance(parsed_data.get(field), type(default)) or (field == "expanded_query" and not parsed_data.get(field)):
+            parsed_data[field] = default
+            record_parse_repair("fields_defaulted")
+    if parsed_data.get("situation") not in QUERY_FIELDS_SCHEMA["situation"]["enum"]:
+        parsed_data["situation"] = "all"
+        record_parse_repair("fields_defaulted")
+    if parsed_data.get("query_intent") not in QUERY_FIELDS_SCHEMA["query_intent"]["enum"]:
+        parsed_data["query_intent"] = "stats" if parsed_data["required_tables"] else "general"
+        record_parse_repair("fields_defaulted")
+
+    known_tables = {table.lower(): table for table in HOCKEY_TABLES}
+    tables = []
+    for table in parsed_data["required_tables"]:
+        name = known_tables.get(str(table).strip().lower())
+        if name and name not in tables:
+            tables.append(name)
+    if len(tables) < len(parsed_data["required_tables"]):
+        record_parse_repair("tables_dropped", len(parsed_data["required_tables"]) - len(tables))
+        logging.debug(f"Dropped unknown tables from parse: {parsed_data['required_tables']}")
+    parsed_data["required_tables"] = tables
+
+    seasons = []
+    for season in parsed_data["seasons"]:
+        year = parse_season(season)
+        if year is None:
+            record_parse_repair("seasons_dropped")
+            logging.warning(f"Dropped unrecognized season from parse: {season!r}")
+        elif year not in seasons:
+            if str(season).strip() != str(year):
+                record_parse_repair("seasons_mapped")
+            seasons.append(year)
+    parsed_data["seasons"] = seasons
+
+    if parsed_data["query_intent"] == "stats" and not parsed_data["required_tables"]:
+        parsed_data["required_tables"] = repair_required_tables(parsed_data, query)
+        record_parse_repair("tables_repaired")
+        logging.debug(f"Stats query without tables; selected {parsed_data['required_tables']} locally.")
+    return parsed_data
+
+# Career and all-time materialized views (see materialized_views.py) for the season tables they total up
+CAREER_VIEWS = {
+    "player_stats_regular_season": "player_career_totals",
+    "player_stats_playoffs": "player_career_totals",
+    "goalie_stats_regular_season": "goalie_career_totals",
+    "goalie_stats_playoffs": "goalie_career_totals",
+    "team_stats": "team_career_totals",
+    "team_stats_playoffs": "team_career_totals",
+    "team_games": "team_career_totals"
+}
+TENURE_VIEWS = {"player_career_totals": "player_team_tenures", "goalie_career_totals": "goalie_team_tenures"}
+CAREER_PATTERN = re.compile(r'\b(career|all[- ]time|lifetime|since 2008|(regular[- ]season|regular) and playoffs? (combined|together))\b',
+                            re.IGNORECASE)
+
+# Add the career view of each season table to a query over all seasons, so the SQL prompt carries its columns.
+# A named player with a named team also gets the tenure view.
+def add_career_views(parsed_data: Dict[str, Any]) -> List[str]:
+    tables = list(parsed_data.get("required_tables", []))
+    if parsed_data.get("seasons") or not CAREER_PATTERN.search(parsed_data.get("expanded_query") or ""):
+        return tables
+    views = []
+    for table in tables:
+        view = CAREER_VIEWS.get(table)
+        if view not in career_views:
+            continue
+        views.append(view)
+        if (parsed_data.get("player_names") and parsed_data.get("team_abbreviations")
+                and TENURE_VIEWS.get(view) in career_views):
+            views.append(TENURE_VIEWS[view])
+    added = [view for view in dict.fromkeys(views) if view not in tables]
+    if added:
+        record_parse_repair("career_views", len(added))
+    return tables + added
+
+# Attach the schema columns of every required table to the parsed data
+def finalize_parsed_data(parsed_data: Dict[str, Any]) -> Dict[str, Any]:
+    parsed_data["required_tables"] = add_career_views(parsed_data)
+    parsed_data["required_columns"] = {}
+    for table in parsed_data["required_tables"]:
+        if table in simplified_hockey_stats_schema:
+            parsed_data["required_columns"][table] = list(simplified_hockey_stats_schema[table].keys())
+
+    logging.debug(f"Final parsed_data: {json.dumps(parsed_data, indent=2)}")
+    return parsed_data
+
+# Load a parse response, returning None only if it is not JSON or lacks the intent fields;
+# everything else is repaired locally by normalize_parsed_query
+def validate_parsed_query(response: str, query: str = "") -> Optional[Dict[str, Any]]:
+    try:
+        parsed_data = json.loads(clean_json_response(response))
+    except json.JSONDecodeError as e:
+        logging.error(f"JSON decode error: {str(e)}")
+        logging.error(f"Raw response causing the error: {response}")
+        return None
+
+    if not isinstance(parsed_data, dict) or "hockey_related" not in parsed_data or "query_intent" not in parsed_data:
+        logging.error(f"Parse response is missing required fields: {response}")
+        return None
+    return normalize_parsed_query(parsed_data, query)
+
+# Parse and expand the user query into a structured format
+def parse_and_expand_query(query: str) -> Dict[str, Any]:
+    logging.debug(f"Entering parse_and_expand_query with query: {query}")
+
+    parsed_data, response = run_cascade("parse", build_parse_messages(query), lambda raw: validate_parsed_query(raw, query),
+                                        "invalid_parse", response_format=QUERY_PARSE_RESPONSE_FORMAT)
+    logging.debug(f"Received parse response: {response}")
+    if parsed_data is None:
+        return None
+
+    return finalize_parsed_data(parsed_data)
+
+# Return the router prediction for a bare query when it is confident, otherwise None
+def confident_route(query: str) -> Optional[Dict[str, Any]]:
+    if intent_router_model is None:
+        return None
+
+    prediction = predict(intent_router_model, query)
+    if not route_is_confident(prediction, intent_router_confidence):
+        logging.debug(f"Intent router is unsure about '{query}'; using the full LLM parse.")
+        return None
+
+    logging.debug(f"Intent router predicted hockey_related={prediction['hockey_related']}, "
+                  f"query_intent={prediction['query_intent']}, tables={prediction['required_tables']}")
+    return prediction
+
+# Check whether a routed query can be answered without asking the LLM for entities
+def route_skips_parse(prediction: Dict[str, Any]) -> bool:
+    return not prediction["hockey_related"] or prediction["query_intent"] == "general"
+
+# Build the short prompt that only extracts entities once the router has fixed intent and tables
+def build_entity_parse_messages(query: str) -> List[Dict[str, str]]:
+    prompt = f"""Extract the entities from this hockey statistics query as JSON:
+
+    Query: '{query}'
+
+    {{
+        "expanded_query": "",
+        "player_names": [],
+        "team_abbreviations": [],
+        "situation": "all" / "5on5" / "5on4" / "4on5" / "other",
+        "seasons": []
+    }}
 
-    logging.debug("Sending request to generate_response")
-    response = generate_response(messages)
-    logging.debug(f"Received response from generate_response: {response}")
+    Use full player names and three-letter team abbreviations. Provide only the JSON output."""
 
+    return [{"role": "user", "content": prompt}]
+
+# Parse the entity extraction response, returning None if it is not valid JSON
+def parse_entity_response(response: str) -> Optional[Dict[str, Any]]:
     try:
-        cleaned_response = clean_response(response)
-        parsed_data = json.loads(cleaned_response)
-        logging.debug("Successfully parsed JSON response")
+        entities = json.loads(clean_json_response(response))
+    except json.JSONDecodeError as e:
+        logging.error(f"Entity extraction returned invalid JSON: {str(e)}")
+        return None
+    return entities if isinstance(entities, dict) else None
+
+# Combine the router prediction with extracted entities into the usual parsed data,
+# repaired by normalize_parsed_query like a full LLM parse
+def build_routed_parse(query: str, prediction: Dict[str, Any], entities: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    entities = entities or {}
+    return finalize_parsed_data(normalize_parsed_query({
+        "expanded_query": entities.get("expanded_query") or query,
+        "hockey_related": prediction["hockey_related"],
+        "query_intent": prediction["query_intent"] if prediction["hockey_related"] else "general",
+        "player_names": entities.get("player_names", []),
+        "team_abbreviations": entities.get("team_abbreviations", []),
+        "required_tables": prediction["required_tables"] if prediction["query_intent"] == "stats" else [],
+        "situation": entities.get("situation") or "all",
+        "seasons": entities.get("seasons", []),
+        "routed": True
+    }, query))
+
+# Append an LLM parse of a bare query to the training log, if one is configured
+def log_parse_result(query: str, parsed_data: Optional[Dict[str, Any]]) -> None:
+    if query_log_path and parsed_data:
+        log_parsed_query(query_log_path, query, parsed_data)
+
+# Parse a query without conversation context, letting the intent router skip or shorten the LLM parse
+def parse_bare_query(query: str) -> Optional[Dict[str, Any]]:
+    prediction = confident_route(query)
+    if prediction is not None:
+        if route_skips_parse(prediction):
+            record_intent_route("skipped")
+            return build_routed_parse(query, prediction)
+
+        entities = parse_entity_response(generate_for_stage(build_entity_parse_messages(query), "entity_parse"))
+        if entities is not None:
+            record_intent_route("short_prompt")
+            return build_routed_parse(query, prediction, entities)
+
+    record_intent_route("llm")
+    parsed_data = parse_and_expand_query(query)
+    log_parse_result(query, parsed_data)
+    return parsed_data
+
+# Tables the parse stages may select
+HOCKEY_TABLES = [
+    "player_stats_regular_season",
+    "player_stats_playoffs",
+    "goalie_stats_regular_season",
+    "goalie_stats_playoffs",
+    "team_stats",
+    "team_stats_playoffs",
+    "team_games",
+    "lines_and_pairings",
+    "lines_and_pairings_playoffs"
+] + career_views
+
+# JSON schema properties shared by the structured-output parse stages
+QUERY_FIELDS_SCHEMA = {
+    "expanded_query": {"type": "string"},
+    "hockey_related": {"type": "boolean"},
+    "query_intent": {"type": "string", "enum": ["general", "stats"]},
+    "player_names": {"type": "array", "items": {"type": "string"}},
+    "team_abbreviations": {"type": "array", "items": {"type": "string"}},
+    "required_tables": {"type": "array", "items": {"type": "string", "enum": HOCKEY_TABLES}},
+    "situation": {"type": "string", "enum": ["all", "5on5", "5on4", "4on5", "other"]},
+    "seasons": {"type": "array", "items": {"type": "integer"}}
+}
+
+# Structured-output format for parse_and_expand_query; the table enum is enforced by the provider
+QUERY_PARSE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "query_parse",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": QUERY_FIELDS_SCHEMA,
+            "required": list(QUERY_FIELDS_SCHEMA.keys()),
+            "additionalProperties": False
+        }
+    }
+}
+
+# Structured-output format for the combined history + parse analysis
+QUERY_ANALYSIS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "query_analysis",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"requires_history": {"type": "boolean"}, **QUERY_FIELDS_SCHEMA},
+            "required": ["requires_history"] + list(QUERY_FIELDS_SCHEMA.keys()),
+            "additionalProperties": False
+        }
+    }
+}
 
-        if parsed_data["query_intent"] == "stats" and not parsed_data["required_tables"]:
-            logging.debug("Query intent is stats but no tables selected. Sending for table selection.")
-            table_selection_prompt = f"""The following query requires statistics, but no tables were selected. Please analyze the query again and select the most appropriate table(s) based on the statistics requested:
+# Format the chat history compactly, truncating long previous answers
+def format_compact_history() -> str:
+    exchanges = []
+    for exchange in chat_history:
+        answer = " ".join(exchange['response'].split())
+        if len(answer) > history_response_chars:
+            answer = answer[:history_response_chars].rstrip() + "..."
+        exchanges.append({"query": exchange['query'], "response": answer})
+
+    lines = [f"User: {exchange['query']}\nAssistant: {exchange['response']}"
+             for exchange in pack_history(exchanges, "analyze_query")]
+    return "\n".join(lines)
 
-            {json.dumps(parsed_data, indent=2)}
+# Build the messages for the combined history decision and query parse
+def build_analysis_messages(query: str) -> List[Dict[str, str]]:
+    history = format_compact_history()
 
-            Update the "required_tables" field with the most relevant table(s) for this query."""
+    prompt = f"""Previous conversation (oldest first):
+    {history if history else "None"}
 
-            table_selection_messages = [
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": table_selection_prompt}
-            ]
+    Current query: '{query}'
 
-            table_selection_response = generate_response(table_selection_messages)
-            logging.debug(f"Received table selection response: {table_selection_response}")
-            cleaned_table_selection_response = clean_response(table_selection_response)
-            parsed_data = json.loads(cleaned_table_selection_response)
+    Set "requires_history" to true only if the current query refers to the previous conversation
+    (pronouns, follow-up questions, omitted players, teams or seasons). When it does, resolve those
+    references from the previous conversation in "expanded_query", "player_names", "team_abbreviations"
+    and "seasons". Otherwise ignore the previous conversation.
+    If "query_intent" is "stats", "required_tables" must contain at least one table."""
 
-        parsed_data["required_columns"] = {}
-        for table in parsed_data["required_tables"]:
-            if table in simplified_hockey_stats_schema:
-                parsed_data["required_columns"][table] = list(simplified_hockey_stats_schema[table].keys())
+    return [
+        {"role": "system", "content": PARSE_SYSTEM_CONTENT},
+        {"role": "user", "content": prompt}
+    ]
 
-        logging.debug(f"Final parsed_data: {json.dumps(parsed_data, indent=2)}")
-        return parsed_data
+# Parse the combined analysis response into the same shape parse_and_expand_query returns
+def parse_analysis_response(response: str, query: str = "") -> Optional[Dict[str, Any]]:
+    try:
+        parsed_data = json.loads(clean_json_response(response))
     except json.JSONDecodeError as e:
-        logging.error(f"JSON decode error: {str(e)}")
+        logging.error(f"JSON decode error in combined analysis: {str(e)}")
         logging.error(f"Raw response causing the error: {response}")
         return None
 
-# Generate a SQL query based on the analyzed data from the user's query
-def generate_sql_query(analyzed_data: Dict[str, Any]) -> str:
+    if not isinstance(parsed_data, dict):
+        logging.error(f"Combined analysis is not a JSON object: {response}")
+        return None
+
+    logging.debug(f"Combined analysis: query {'requires' if parsed_data.get('requires_history') else 'does not require'} historical context.")
+    return finalize_parsed_data(normalize_parsed_query(parsed_data, query))
+
+# Decide on history and parse the query in one structured-output call
+def analyze_query(query: str) -> Optional[Dict[str, Any]]:
+    logging.debug(f"Entering analyze_query with query: {query}")
+
+    parsed_data, response = run_cascade("analysis", build_analysis_messages(query), lambda raw: parse_analysis_response(raw, query),
+                                        "invalid_analysis", response_format=QUERY_ANALYSIS_RESPONSE_FORMAT)
+    logging.debug(f"Received combined analysis response: {response}")
+
+    return parsed_data
+
+# SQL prompt rule added when the required tables include a career or tenure view
+CAREER_VIEW_RULE = """
+    15. For totals over all seasons (career, all-time, regular season and playoffs combined), select from
+        player_career_totals, goalie_career_totals, team_career_totals, player_team_tenures or goalie_team_tenures
+        when they are listed, filtering on name or team, situation and season_type ('regular_season', 'playoffs'
+        or 'combined'). They already hold the totals: do not SUM season rows or GROUP BY."""
+
+# Build the messages for generating a SQL query from the analyzed data, with retrieved examples as few-shot demonstrations
+def build_sql_messages(analyzed_data: Dict[str, Any], examples: Optional[List[Dict[str, Any]]] = None,
+                       instruction: str = "") -> List[Dict[str, str]]:
     system_content = """You are a SQL expert specialized in querying hockey statistics databases.
     Generate a PostgreSQL query based on the provided information. Follow these rules:
 
@@ -223,9 +945,14 @@ def generate_sql_query(analyzed_data: Dict[str, Any]) -> str:
         You may use more or fewer columns if it makes sense for the specific query.
     12. For assists, always use (i_f_primaryassists + i_f_secondaryassists) instead of i_f_assists.
     13. USE THE SITUATION PROVIDED!
-    14. Limit results to 50 rows maximum.
+    14. Limit results to 50 rows maximum."""
+    if set(analyzed_data.get("required_tables", [])) & set(career_views):
+        system_content += CAREER_VIEW_RULE
+    system_content += """
 
     Return only the SQL query, without any additional explanation."""
+    if instruction:
+        system_content += f"\n    {instruction}"
 
     prompt = f"""
     Generate a PostgreSQL query for the following:
@@ -233,7 +960,7 @@ def generate_sql_query(analyzed_data: Dict[str, Any]) -> str:
     Expanded Query: {analyzed_data['expanded_query']}
 
     Required Tables and Columns:
-    {json.dumps(analyzed_data['required_columns'], indent=2)}
+    {json.dumps(pack_schema_columns(analyzed_data['required_columns'], analyzed_data['expanded_query'], "generate_sql_query"), indent=2)}
 
     Additional Information:
     - Player Names: {', '.join(analyzed_data['player_names'])}
@@ -244,14 +971,33 @@ def generate_sql_query(analyzed_data: Dict[str, Any]) -> str:
     USE THE SEASON PROVIDED IN HERE NOT IN THE QUERY!
 
     """
+    if examples:
+        prompt += f"""
+    Verified examples of similar questions and SQL that ran successfully (adapt them, do not copy their values):
+
+{format_examples(examples)}
+    """
+    check_instructions(system_content, "generate_sql_query")
 
-    messages = [
+    return [
         {"role": "system", "content": system_content},
         {"role": "user", "content": prompt}
     ]
 
-    raw_response = generate_response(messages)
-
+# Filter a player-table query on the requested situation (bound later as %(situation)s) unless it already
+# filters on one, adding the condition to the first WHERE or a new WHERE ahead of GROUP BY/ORDER BY/LIMIT
+def add_situation_filter(sql_query: str) -> str:
+    if re.search(r'\bsituation\b', sql_query, re.IGNORECASE):
+        return sql_query
+    if re.search(r'\bWHERE\b', sql_query, re.IGNORECASE):
+        return re.sub(r'\bWHERE\b', "WHERE situation = %(situation)s AND", sql_query, count=1, flags=re.IGNORECASE)
+    tail = re.search(r'\s+(GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT)\b', sql_query, re.IGNORECASE)
+    if tail is None:
+        return sql_query.rstrip().rstrip(";") + " WHERE situation = %(situation)s"
+    return f"{sql_query[:tail.start()]} WHERE situation = %(situation)s{sql_query[tail.start():]}"
+
+# Extract the SQL from a model response and enforce the situation filter as a bind parameter
+def postprocess_sql_response(raw_response: str, analyzed_data: Dict[str, Any]) -> str:
     sql_match = re.search(r'```sql\n(.*?)\n```', raw_response, re.DOTALL)
     if sql_match:
         sql_query = sql_match.group(1).strip()
@@ -263,65 +1009,315 @@ def generate_sql_query(analyzed_data: Dict[str, Any]) -> str:
     if 'player_stats_regular_season' in analyzed_data['required_tables'] or 'player_stats_playoffs' in analyzed_data['required_tables']:
         sql_query = sql_query.replace("i_f_assists", "(i_f_primaryassists + i_f_secondaryassists)")
 
-        if "WHERE" in sql_query and "situation" not in sql_query:
-            sql_query = sql_query.replace("WHERE", f"WHERE situation = '{analyzed_data['situation']}' AND")
-        elif "WHERE" not in sql_query:
-            sql_query += f" WHERE situation = '{analyzed_data['situation']}'"
+        sql_query = add_situation_filter(sql_query)
 
-        if "situation = " not in sql_query:
-            sql_query += " WHERE situation = 'all'"
+    return sql_query
 
+# Return the post-processed SQL if the response looks like a single query, otherwise None
+def validate_sql_response(raw_response: str, analyzed_data: Dict[str, Any]) -> Optional[str]:
+    sql_query = postprocess_sql_response(raw_response, analyzed_data)
+    if not re.match(r'\s*(SELECT|WITH)\b', sql_query, re.IGNORECASE):
+        logging.error(f"SQL response is not a query: {raw_response}")
+        return None
     return sql_query
 
-# Execute and test the generated SQL query, attempting to correct it if it fails
-def test_sql_query(query: str, analyzed_data: Dict[str, Any]) -> Dict[str, Any]:
-    def execute_query(cursor, query: str) -> Dict[str, Any]:
-        cursor.execute(query)
-        results = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description]
+# Generate a SQL query based on the analyzed data from the user's query, optionally for one candidate variant.
+# Returns the SQL and whether local validation sent it through the correction stage.
+def generate_sql_query(analyzed_data: Dict[str, Any], examples: Optional[List[Dict[str, Any]]] = None,
+                       variant: Optional[Dict[str, Any]] = None) -> Tuple[str, bool]:
+    variant = variant or {}
+    messages = build_sql_messages(analyzed_data, examples, variant.get("instruction", ""))
+    sql_query, raw_response = run_cascade("sql", messages, lambda response: validate_sql_response(response, analyzed_data),
+                                          "invalid_sql", first_tier=variant.get("tier", 0))
+    if sql_query is None:
+        sql_query = postprocess_sql_response(raw_response, analyzed_data)
+
+    report = check_sql_locally(sql_query)
+    if not report["errors"]:
+        return report["sql"], False
+
+    # Only problems the validator cannot fix go to the correction stage, without a failed database round trip
+    cascade_metrics.record_escalation("sql", "validation_error")
+    return correct_query(query_for_display(report["sql"], analyzed_data), "; ".join(report["errors"]), analyzed_data), True
+
+# Load the live catalog into the validator once; the simplified schema stays in use if the database is unavailable
+def ensure_validator_catalog() -> None:
+    global sql_validator_catalog_loaded
+    if sql_validator is None or sql_validator_catalog != "database" or sql_validator_catalog_loaded:
+        return
+    with sql_validator_lock:
+        if sql_validator_catalog_loaded:
+            return
+        sql_validator_catalog_loaded = True
+        try:
+            with db_pool.connection() as conn:
+                catalog = load_database_catalog(conn)
+            if catalog:
+                sql_validator.set_catalog(catalog)
+        except psycopg2.Error as e:
+            logging.error(f"Unable to load the database catalog for SQL validation: {str(e)}")
+
+# Resolve the identifiers of a query against the catalog, applying unambiguous fixes locally
+def check_sql_locally(sql_query: str) -> Dict[str, Any]:
+    if sql_validator is None:
+        return {"sql": sql_query, "fixes": [], "errors": []}
+    ensure_validator_catalog()
+    return sql_validator.validate(sql_query)
+
+# Describe a failed query, counting statement_timeout cancellations
+def describe_query_error(error: Exception) -> str:
+    if isinstance(error, psycopg2.errors.QueryCanceled) and sql_guard is not None:
+        sql_guard.record_timeout()
+        return f"{str(error).strip()} (statement_timeout is {sql_guard.statement_timeout_ms} ms; the query must be cheaper)"
+    return str(error)
+
+# Bind parameters for a query: template SQL arrives with its own, generated SQL has its filter literals
+# and situation placeholder bound so values are never spliced into the statement
+def bind_query(query: str, analyzed_data: Dict[str, Any],
+               params: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, Any]]:
+    if params is not None:
+        return query, params
+    return bind_parameters(query, {"situation": analyzed_data.get("situation") or "all"})
+
+# A cached query result as returned by test_sql_query
+def cached_query_result(cached: Dict[str, Any], query: str) -> Dict[str, Any]:
+    return {"success": True, **cached, "executed_sql": query, "cached": True}
+
+# Read the data version stamp for the result cache on a psycopg2 cursor; a changed stamp drops every cached result
+def refresh_result_cache_version(cursor) -> None:
+    try:
+        cursor.execute(sql_result_cache.version_query)
+        row = cursor.fetchone()
+        sql_result_cache.set_version(str(row[0]) if row else None)
+    except psycopg2.Error as e:
+        logging.error(f"Unable to read the data version for the SQL result cache: {str(e)}")
+        sql_result_cache.set_version(None)
+        db_pool.recover(cursor.connection)
+
+# Generated SQL with the situation placeholder filled in, for prompts and API responses
+def query_for_display(query: str, analyzed_data: Dict[str, Any]) -> str:
+    return query.replace("%(situation)s", "'" + str(analyzed_data.get("situation") or "all").replace("'", "''") + "'")
+
+# Execute and test the generated SQL query, attempting to correct it if it fails.
+# Parameterized template SQL is not sent for correction; the caller falls back to the LLM instead.
+# A candidate in a race is not corrected either: it runs with the race's timeout and can be cancelled by the winner.
+def test_sql_query(query: str, analyzed_data: Dict[str, Any], params: Optional[Dict[str, Any]] = None,
+                   race: Optional[SQLRace] = None) -> Dict[str, Any]:
+    def execute_query(cursor, query: str, bound_query: Tuple[str, Dict[str, Any]]) -> Dict[str, Any]:
+        statement, bound = bound_query
+        generation = sql_result_cache.generation if sql_result_cache is not None else None
+        plan = None
+        if sql_guard is not None:
+            decision = sql_guard.check(cursor, statement, bound or None)
+            statement, plan = decision["sql"], decision["plan"]
+        if result_streamer is not None:
+            # Rows are read in batches from a server-side cursor until the row or byte budget is spent
+            db_pool.use_transaction(cursor.connection)
+            streamed = result_streamer.fetch(cursor.connection, statement, bound)
+            column_names, results = streamed["column_names"], streamed["rows"]
+            truncated, total_row_count = streamed["truncated"], streamed["total_row_count"]
+        else:
+            if prepared_statements is not None:
+                prepared_statements.execute(cursor, statement, bound)
+            else:
+                cursor.execute(statement, bound or None)
+            results = cursor.fetchall()
+            column_names = [desc[0] for desc in cursor.description]
+            truncated, total_row_count = False, len(results)
         results_dicts = [dict(zip(column_names, row)) for row in results]
-        return {
+        result = {
             "success": True,
             "column_names": column_names,
             "results": results_dicts,
-            "row_count": len(results)
+            "row_count": len(results),
+            "truncated": truncated,
+            "total_row_count": total_row_count,
+            "executed_sql": query,
+            "plan": plan
+        }
+        if sql_result_cache is not None:
+            sql_result_cache.set(make_result_key(*bound_query), bound_query[0], bound_query[1],
+                                 {field: result[field] for field in CACHED_RESULT_FIELDS}, generation)
+        return result
+
+    # Per-query statement_timeout overrides; the pool restores its default when the connection is returned
+    def apply_timeouts(cursor) -> None:
+        if sql_guard is not None and sql_guard.statement_timeout_ms != db_pool.statement_timeout_ms:
+            db_pool.set_statement_timeout(cursor, sql_guard.statement_timeout_ms)
+        if race is not None:
+            db_pool.set_statement_timeout(cursor, race.timeout_ms)
+
+    bound_query = bind_query(query, analyzed_data, params)
+    cache_key = make_result_key(*bound_query) if sql_result_cache is not None else None
+    # While the data version stamp is fresh, cache hits need no database connection
+    if cache_key is not None and not sql_result_cache.version_due():
+        cached = sql_result_cache.get(cache_key)
+        if cached is not None:
+            return cached_query_result(cached, query)
+
+    try:
+        conn = db_pool.getconn()
+    except psycopg2.Error as e:
+        return {
+            "success": False,
+            "error_message": f"Database connection error: {str(e)}",
+            "connection_error": True
         }
+    if race is not None and not race.register(conn):
+        db_pool.putconn(conn)
+        return {"success": False, "error_message": "Another SQL candidate already succeeded", "cancelled": True}
 
+    discard = False
     try:
-        with psycopg2.connect(**db_params) as conn:
-            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-            with conn.cursor() as cursor:
-                try:
-                    return execute_query(cursor, query)
-                except psycopg2.Error as e:
-                    error_message = str(e)
-                    logging.error(f"First attempt failed: {error_message}")
-
-                    corrected_query = correct_query(query, error_message, analyzed_data)
-                    if corrected_query != query:
-                        logging.debug("Attempting with corrected query:")
-                        logging.debug(corrected_query)
-                        try:
-                            return execute_query(cursor, corrected_query)
-                        except psycopg2.Error as e2:
-                            return {
-                                "success": False,
-                                "error_message": f"Corrected query also failed: {str(e2)}"
-                            }
-                    else:
+        with conn.cursor() as cursor:
+            if cache_key is not None and sql_result_cache.version_due():
+                refresh_result_cache_version(cursor)
+                cached = sql_result_cache.get(cache_key)
+                if cached is not None:
+                    return cached_query_result(cached, query)
+            apply_timeouts(cursor)
+            try:
+                return execute_query(cursor, query, bound_query)
+            except (psycopg2.Error, QueryRejectedError) as e:
+                if race is not None and race.settled:
+                    return {"success": False, "error_message": "Cancelled after another SQL candidate succeeded",
+                            "cancelled": True}
+                error_message = describe_query_error(e)
+                logging.error(f"First attempt failed: {error_message}")
+                if params is not None or race is not None:
+                    return {"success": False, "error_message": error_message}
+
+                # The correction runs on the stronger tier configured for the correction stage
+                cascade_metrics.record_escalation("sql", "sql_error")
+                corrected_query = correct_query(query_for_display(query, analyzed_data), error_message, analyzed_data)
+                if corrected_query != query:
+                    logging.debug("Attempting with corrected query:")
+                    logging.debug(corrected_query)
+                    # Outside autocommit the failed statement aborted the transaction
+                    db_pool.recover(conn)
+                    apply_timeouts(cursor)
+                    try:
+                        return {**execute_query(cursor, corrected_query, bind_query(corrected_query, analyzed_data)),
+                                "corrected": True}
+                    except (psycopg2.Error, QueryRejectedError) as e2:
                         return {
                             "success": False,
-                            "error_message": f"Unable to correct query: {error_message}"
+                            "error_message": f"Corrected query also failed: {describe_query_error(e2)}",
+                            "correction_attempted": True
                         }
+                else:
+                    return {
+                        "success": False,
+                        "error_message": f"Unable to correct query: {error_message}",
+                        "correction_attempted": True
+                    }
 
     except psycopg2.Error as e:
+        discard = True
         return {
             "success": False,
-            "error_message": f"Database connection error: {str(e)}"
+            "error_message": f"Database connection error: {str(e)}",
+            "connection_error": True
         }
-
-# Attempt to correct a SQL query based on the error message and original requirements
-def correct_query(query: str, error_message: str, analyzed_data: Dict[str, Any]) -> str:
+    finally:
+        if race is not None:
+            race.unregister(conn)
+        db_pool.putconn(conn, discard=discard)
+
+# Run the SQL for a data query: a matching template first, the LLM-generated query otherwise.
+# Returns the SQL shown to the user and the execution result.
+def generate_and_test_sql(analyzed_data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    plan = build_template_sql(analyzed_data) if sql_templates_enabled else None
+    if plan is not None:
+        test_result = test_sql_query(plan["sql"], analyzed_data, plan["params"])
+        # An empty result usually means the template read the question too narrowly, so the LLM gets a try
+        empty = test_result["success"] and not test_result.get("results")
+        record_template_result(plan["template"], test_result["success"], empty)
+        if (test_result["success"] and not empty) or test_result.get("connection_error"):
+            return display_sql(plan["sql"], plan["params"]), test_result
+        if empty:
+            logging.warning(f"SQL template {plan['template']} returned no rows, falling back to the LLM")
+        else:
+            logging.error(f"SQL template {plan['template']} failed, falling back to the LLM: {test_result['error_message']}")
+
+    # Recurring intents reuse the SQL that last executed successfully for them
+    cached_sql = sql_plan_cache.get(analyzed_data) if sql_plan_cache is not None else None
+    if cached_sql is not None:
+        test_result = test_sql_query(cached_sql, analyzed_data)
+        if test_result["success"] or test_result.get("connection_error"):
+            sql_plan_cache.record_result(analyzed_data, test_result)
+            return query_for_display(cached_sql, analyzed_data), test_result
+        logging.error(f"Cached SQL plan failed, generating a new query: {test_result['error_message']}")
+        sql_plan_cache.invalidate(analyzed_data)
+
+    examples = find_sql_examples(analyzed_data)
+    if sql_candidates is not None:
+        sql_query, test_result, examples = race_sql_candidates(analyzed_data, examples)
+    else:
+        sql_query, test_result = generate_and_test_candidate(analyzed_data, examples)
+    logging.debug("\nGenerated SQL Query:")
+    logging.debug(sql_query)
+    if sql_plan_cache is not None:
+        sql_plan_cache.record_result(analyzed_data, test_result)
+    record_generated_sql(analyzed_data, examples, test_result)
+    return query_for_display(sql_query, analyzed_data), test_result
+
+# Generate one SQL query and run it, alone or as a candidate in a race
+def generate_and_test_candidate(analyzed_data: Dict[str, Any], examples: List[Dict[str, Any]],
+                                variant: Optional[Dict[str, Any]] = None,
+                                race: Optional[SQLRace] = None) -> Tuple[str, Dict[str, Any]]:
+    if variant is not None and not variant["examples"]:
+        examples = []
+    sql_query, validation_corrected = generate_sql_query(analyzed_data, examples, variant)
+    if race is not None and race.settled:
+        return sql_query, {"success": False, "error_message": "Another SQL candidate already succeeded", "cancelled": True}
+    return sql_query, {**test_sql_query(sql_query, analyzed_data, race=race), "validation_corrected": validation_corrected}
+
+# Generate and run SQL candidates concurrently; the first sane result wins and the other queries are cancelled.
+# Without a sane winner, a successful empty result is used, otherwise one correction of the first variant's failure.
+# Returns the SQL, its result, and the examples its prompt carried.
+def race_sql_candidates(analyzed_data: Dict[str, Any],
+                        examples: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any], List[Dict[str, Any]]]:
+    outcome = sql_candidates.run(lambda variant, race: generate_and_test_candidate(analyzed_data, examples, variant, race))
+    if outcome["winner"] is not None:
+        return outcome["sql"], outcome["result"], examples if outcome["winner"]["examples"] else []
+
+    attempts = [attempt for attempt in outcome["attempts"] if not attempt[2].get("cancelled")]
+    if not attempts:
+        sql_query, test_result = generate_and_test_candidate(analyzed_data, examples)
+        return sql_query, test_result, examples
+    for variant, sql_query, test_result in attempts:
+        if test_result["success"] or test_result.get("connection_error"):
+            return sql_query, test_result, examples if variant["examples"] else []
+
+    variant, sql_query, test_result = min(attempts, key=lambda attempt: sql_candidates.variants.index(attempt[0]))
+    cascade_metrics.record_escalation("sql", "sql_error")
+    corrected_query = correct_query(query_for_display(sql_query, analyzed_data), test_result["error_message"], analyzed_data)
+    test_result = test_sql_query(corrected_query, analyzed_data)
+    return corrected_query, {**test_result, "correction_attempted": True}, examples if variant["examples"] else []
+
+# Retrieve the verified examples closest to the analyzed query for the SQL prompt
+def find_sql_examples(analyzed_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if sql_examples is None:
+        return []
+    # Seed examples over views missing from this database would teach SQL that cannot run
+    return sql_examples.search(analyzed_data.get("expanded_query", ""), analyzed_data.get("required_tables", []),
+                               exclude_tables=missing_career_views)
+
+# Count how generated SQL fared with and without examples, and keep SQL that returned rows as a new example.
+# SQL that ran but found nothing is often a wrong reading of the question, so it is not learned.
+def record_generated_sql(analyzed_data: Dict[str, Any], examples: List[Dict[str, Any]],
+                         test_result: Dict[str, Any]) -> None:
+    if sql_examples is None or test_result.get("connection_error"):
+        return
+    corrected = any(test_result.get(flag) for flag in ("validation_corrected", "corrected", "correction_attempted"))
+    sql_examples.record_outcome(bool(examples), test_result["success"], corrected)
+    if result_is_sane(test_result):
+        sql_examples.learn(analyzed_data.get("expanded_query", ""), analyzed_data.get("required_tables", []),
+                           query_for_display(test_result["executed_sql"], analyzed_data))
+
+# Build the messages asking the model to fix a failed SQL query
+def build_correction_messages(query: str, error_message: str, analyzed_data: Dict[str, Any]) -> List[Dict[str, str]]:
     system_content = """You are a SQL expert specialized in correcting and optimizing queries for hockey statistics databases.
     Your task is to analyze the given SQL query, the error message, and the original query requirements, then generate a corrected SQL query.
     Follow these guidelines:
@@ -347,7 +1343,7 @@ def correct_query(query: str, error_message: str, analyzed_data: Dict[str, Any])
 
     Original Query Requirements:
     Expanded Query: {analyzed_data['expanded_query']}
-    Required Tables and Columns: {analyzed_data['required_columns']}
+    Required Tables and Columns: {pack_schema_columns(analyzed_data['required_columns'], analyzed_data['expanded_query'], "correct_query")}
     Player Names: {', '.join(analyzed_data['player_names'])}
     Team Abbreviations: {', '.join(analyzed_data['team_abbreviations'])}
     Situation: {analyzed_data['situation']}
@@ -356,20 +1352,23 @@ def correct_query(query: str, error_message: str, analyzed_data: Dict[str, Any])
     Please generate a corrected SQL query that addresses the error and meets the original requirements.
     """
 
-    messages = [
+    return [
         {"role": "system", "content": system_content},
         {"role": "user", "content": prompt}
     ]
 
-    response = generate_response(messages)
-
+# Strip Markdown code fences from a corrected SQL response
+def clean_sql_response(response: str) -> str:
     corrected_query = response.strip()
-    corrected_query = corrected_query.replace('```sql', '').replace('```', '').strip()
+    return corrected_query.replace('```sql', '').replace('```', '').strip()
 
-    return corrected_query
+# Attempt to correct a SQL query based on the error message and original requirements
+def correct_query(query: str, error_message: str, analyzed_data: Dict[str, Any]) -> str:
+    response = generate_for_stage(build_correction_messages(query, error_message, analyzed_data), "correction")
+    return check_sql_locally(clean_sql_response(response))["sql"]
 
-# Generate a natural language answer for non-hockey related queries
-def generate_natural_language_answer_non_hockey(original_query: str, expanded_query: str) -> str:
+# Build the messages for answering a non-hockey query
+def build_non_hockey_answer_messages(original_query: str, expanded_query: str) -> List[Dict[str, str]]:
     system_content = """Answer to the user as normally but
     if the query is not about hockey, suggest to the user to ask something hockey statistics related.
     The database contains player and team statistics from 2008-2024.
@@ -383,17 +1382,17 @@ def generate_natural_language_answer_non_hockey(original_query: str, expanded_qu
 
     """
 
-    messages = [
+    return [
         {"role": "system", "content": system_content},
         {"role": "user", "content": prompt}
     ]
 
-    response = generate_response(messages, max_tokens=300)
-
-    return response
+# Generate a natural language answer for non-hockey related queries
+def generate_natural_language_answer_non_hockey(original_query: str, expanded_query: str) -> str:
+    return generate_for_stage(build_non_hockey_answer_messages(original_query, expanded_query), "answer_non_hockey")
 
-# Generate a natural language answer for hockey queries that don't require specific data
-def generate_natural_language_answer_hockey_without_data(original_query: str, parsed_result: Dict[str, Any]) -> str:
+# Build the messages for answering a hockey query from general knowledge
+def build_hockey_without_data_answer_messages(original_query: str, parsed_result: Dict[str, Any]) -> List[Dict[str, str]]:
     system_content = """You are an AI assistant and you know everything about the NHL.
     Provide the user with a general answer based on common hockey knowledge.
     Use the information provided in the parsed query to give a more accurate and relevant response.
@@ -415,27 +1414,21 @@ def generate_natural_language_answer_hockey_without_data(original_query: str, pa
     Please provide a comprehensive answer to the query using this information.
     """
 
-    messages = [
+    return [
         {"role": "system", "content": system_content},
         {"role": "user", "content": prompt}
     ]
 
-    response = generate_response(messages, max_tokens=300)
-
-    return response
+# Generate a natural language answer for hockey queries that don't require specific data
+def generate_natural_language_answer_hockey_without_data(original_query: str, parsed_result: Dict[str, Any]) -> str:
+    return generate_for_stage(build_hockey_without_data_answer_messages(original_query, parsed_result), "answer_general")
 
-# Generate a natural language answer based on the query and retrieved data
-def generate_natural_language_answer_with_data(original_query: str, expanded_query: str, sql_query: str, query_result: List[Dict[str, Any]]) -> str:
+# Build the messages for answering a query from the retrieved data
+def build_answer_with_data_messages(original_query: str, expanded_query: str, sql_query: str, query_result: List[Dict[str, Any]]) -> List[Dict[str, str]]:
     table = ""
     if query_result:
         try:
-            headers = query_result[0].keys()
-            rows = [list(row.values()) for row in query_result]
-            table = tabulate(rows, headers=headers, tablefmt="fancy_grid",
-                             numalign="right", stralign="left",
-                             colalign=("left",) + ("right",) * (len(headers) - 1),
-                             maxcolwidths=[None] + [20] * (len(headers) - 1),
-                             floatfmt=".2f")
+            table = pack_result_table(query_result, "generate_natural_language_answer_with_data")
         except (IndexError, AttributeError):
             table = "Error: Unable to generate table from query results."
 
@@ -462,17 +1455,18 @@ def generate_natural_language_answer_with_data(original_query: str, expanded_que
     Otherwise, provide a general answer based on common hockey knowledge. Explain any relevant statistics
     or trends, and provide context if necessary."""
 
-    messages = [
+    return [
         {"role": "system", "content": system_content},
         {"role": "user", "content": prompt}
     ]
 
-    response = generate_response(messages, max_tokens=1200)
-
-    return response
+# Generate a natural language answer based on the query and retrieved data
+def generate_natural_language_answer_with_data(original_query: str, expanded_query: str, sql_query: str, query_result: List[Dict[str, Any]]) -> str:
+    return generate_for_stage(build_answer_with_data_messages(original_query, expanded_query, sql_query, query_result),
+                              "answer_with_data")
 
-# Generate an error response when data fetching fails
-def generate_error_response(query: str, expanded_query: str, error_message: str) -> str:
+# Build the messages explaining a failed data fetch to the user
+def build_error_response_messages(query: str, expanded_query: str, error_message: str) -> List[Dict[str, str]]:
     system_content = """You are an AI assistant specialized in hockey statistics.
     An error occurred while trying to fetch specific data for the user's query.
     Your task is to:
@@ -490,14 +1484,14 @@ def generate_error_response(query: str, expanded_query: str, error_message: str)
 
     Please provide a response that addresses the points mentioned in the system message."""
 
-    messages = [
+    return [
         {"role": "system", "content": system_content},
         {"role": "user", "content": prompt}
     ]
 
-    response = generate_response(messages, max_tokens=500)
-
-    return response
+# Generate an error response when data fetching fails
+def generate_error_response(query: str, expanded_query: str, error_message: str) -> str:
+    return generate_for_stage(build_error_response_messages(query, expanded_query, error_message), "answer_error")
 
 # Handle non-hockey related queries
 def handle_non_hockey_query(query: str, result: Dict[str, Any]) -> Dict[str, Any]:
@@ -523,18 +1517,12 @@ def handle_hockey_query_without_data(query: str, result: Dict[str, Any]) -> Dict
 
 # Handle hockey-related queries that require specific data
 def handle_hockey_query_with_data(query: str, result: Dict[str, Any]) -> Dict[str, Any]:
-    sql_query = generate_sql_query(result)
-    logging.debug("\nGenerated SQL Query:")
-    logging.debug(sql_query)
-
-    test_result = test_sql_query(sql_query, result)
+    sql_query, test_result = generate_and_test_sql(result)
     if test_result["success"]:
         logging.debug("\nQuery executed successfully!")
         logging.debug(f"Columns: {', '.join(test_result['column_names'])}")
-        logging.debug(f"Number of rows: {test_result['row_count']}")
-        logging.debug("All results:")
-        for row in test_result['results']:
-            logging.debug(row)
+        logging.debug(f"Number of rows: {test_result['row_count']} (truncated: {test_result.get('truncated', False)}, "
+                      f"total: {test_result.get('total_row_count')})")
 
         nl_answer = generate_natural_language_answer_with_data(
             query,
@@ -550,8 +1538,11 @@ def handle_hockey_query_with_data(query: str, result: Dict[str, Any]) -> Dict[st
             "sql_query": sql_query,
             "result_summary": {
                 "row_count": test_result['row_count'],
+                "truncated": test_result.get('truncated', False),
+                "total_row_count": test_result.get('total_row_count'),
                 "columns": test_result['column_names']
-            }
+            },
+            "query_plan": test_result.get('plan')
         }
     else:
         logging.debug("\nQuery execution failed!")
@@ -578,15 +1569,75 @@ def handle_failed_query() -> Dict[str, Any]:
     logging.debug("\n" + "="*50)  # Separator between queries
     return response
 
-# Process a user query and return the appropriate response
-def process_query(query: str) -> Dict[str, Any]:
-    logging.debug(f"\n--- Processing Query: {query} ---")
+# Run the history check and a speculative parse of the bare query concurrently
+def parse_with_speculation(query: str) -> Optional[Dict[str, Any]]:
+    # A confident local decision leaves nothing to speculate on
+    decision = local_history_decision(query)
+    if decision is not None:
+        if not decision:
+            return parse_bare_query(query)
+        return parse_and_expand_query(f"{format_history_context()}\n\nCurrent query: {query}")
+
+    speculative_parse = speculation_executor.submit(parse_bare_query, query)
+
+    if not llm_requires_history(query):
+        record_speculation(wasted=False)
+        return speculative_parse.result()
+
+    # History is needed, so the bare-query parse is discarded in favour of the contextual one
+    speculative_parse.cancel()
+    record_speculation(wasted=True)
+    logging.debug("Speculative parse discarded; re-parsing with conversation context.")
+    return parse_and_expand_query(f"{format_history_context()}\n\nCurrent query: {query}")
+
+# Resolve conversation context and parse the query into structured data
+def resolve_parsed_query(query: str) -> Optional[Dict[str, Any]]:
+    if query_analysis_mode == "combined":
+        return analyze_query(query)
+
+    if speculative_parse_enabled:
+        return parse_with_speculation(query)
 
     context = generate_context_from_history(query)
+    if not context:
+        return parse_bare_query(query)
+
+    return parse_and_expand_query(f"{context}\n\nCurrent query: {query}")
+
+# Normalize a query so trivially different spellings of the same question coalesce
+def normalize_query(query: str) -> str:
+    return re.sub(r'\s+', ' ', query.lower()).strip().rstrip("?!. ")
+
+# Key an in-flight query on its normalized text and the chat history it would be answered against
+def flight_key(query: str) -> str:
+    history = list(chat_history)
+    if not history:
+        return normalize_query(query)
+    fingerprint = hashlib.sha256(json.dumps(history, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return f"{normalize_query(query)}|{fingerprint[:16]}"
+
+# Run compute(query), joining an identical in-flight call asked against the same chat history
+def coalesce_query(query: str, compute) -> Dict[str, Any]:
+    if not singleflight_enabled:
+        return compute(query)
+
+    response, shared = query_flights.do(flight_key(query), compute, query)
+    if shared:
+        logging.debug(f"Query '{query}' was answered by an identical in-flight request.")
+        return dict(response)
+    return response
+
+# Process a user query and return the appropriate response
+def process_query(query: str) -> Dict[str, Any]:
+    return coalesce_query(query, run_query_pipeline)
 
-    full_query = f"{context}\n\nCurrent query: {query}" if context else query
+# Run every pipeline stage for one query
+def run_query_pipeline(query: str) -> Dict[str, Any]:
+    logging.debug(f"\n--- Processing Query: {query} ---")
 
-    result = parse_and_expand_query(full_query)
+    analysis_start = time.perf_counter()
+    result = resolve_parsed_query(query)
+    record_stage_latency(f"analysis_{query_analysis_mode}", time.perf_counter() - analysis_start)
     if result:
         logging.debug("\nParsed and expanded query:")
         logging.debug(json.dumps(result, indent=2))
@@ -604,6 +1655,73 @@ def process_query(query: str) -> Dict[str, Any]:
     else:
         return handle_failed_query()
 
+# Reduce the parsed query to the intent fields shown to clients
+def summarize_intent(result: Dict[str, Any]) -> Dict[str, Any]:
+    intent_fields = ["expanded_query", "hockey_related", "query_intent", "player_names",
+                     "team_abbreviations", "required_tables", "situation", "seasons"]
+    return {field: result.get(field) for field in intent_fields}
+
+# Process a user query and yield (event, payload) pairs as each stage finishes
+def process_query_stream(query: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    logging.debug(f"\n--- Streaming Query: {query} ---")
+
+    analysis_start = time.perf_counter()
+    result = resolve_parsed_query(query)
+    record_stage_latency(f"analysis_{query_analysis_mode}", time.perf_counter() - analysis_start)
+    if not result:
+        yield "done", handle_failed_query()
+        return
+
+    yield "intent", summarize_intent(result)
+
+    if not result['hockey_related']:
+        messages = build_non_hockey_answer_messages(query, result['expanded_query'])
+        stage = "answer_non_hockey"
+        response = {"hockey_related": False}
+    elif result['hockey_related'] and result['query_intent'] == 'general':
+        messages = build_hockey_without_data_answer_messages(query, result)
+        stage = "answer_general"
+        response = {"hockey_related": True, "requires_data": False}
+    else:
+        sql_query, test_result = generate_and_test_sql(result)
+        yield "sql", {"sql_query": sql_query}
+
+        if test_result["success"]:
+            yield "results", {
+                "columns": test_result['column_names'],
+                "rows": test_result['results'],
+                "row_count": test_result['row_count'],
+                "truncated": test_result.get('truncated', False)
+            }
+            messages = build_answer_with_data_messages(query, result['expanded_query'], sql_query, test_result['results'])
+            stage = "answer_with_data"
+            response = {
+                "sql_query": sql_query,
+                "result_summary": {
+                    "row_count": test_result['row_count'],
+                    "truncated": test_result.get('truncated', False),
+                    "total_row_count": test_result.get('total_row_count'),
+                    "columns": test_result['column_names']
+                },
+                "query_plan": test_result.get('plan')
+            }
+        else:
+            yield "error", {"error": test_result['error_message']}
+            messages = build_error_response_messages(query, result['expanded_query'], test_result['error_message'])
+            stage = "answer_error"
+            response = {"sql_query": sql_query, "error": test_result['error_message']}
+
+    answer_fragments = []
+    tier = stage_tier(stage)
+    for fragment in stream_response(messages, model=tier["model"], max_tokens=tier["max_tokens"], stage=stage):
+        answer_fragments.append(fragment)
+        yield "answer", {"text": fragment}
+
+    response = {"natural_language_answer": "".join(answer_fragments), **response}
+    update_chat_history(query, response['natural_language_answer'])
+
+    yield "done", response
+
 def main():
     print("Welcome to the Hockey Stats Query System!")
     print("Enter your queries below. Type 'exit' to quit the program.")
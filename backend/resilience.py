@@ -0,0 +1,396 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+import openai
+import requests
+
+# Status codes worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+# Raised instead of calling the provider while the circuit breaker is open
+class CircuitOpenError(Exception):
+    pass
+
+
+# Check whether an LLM call failed in a way that a retry (or hedge) can fix
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (openai.APIConnectionError, requests.ConnectionError, requests.Timeout,
+                          TimeoutError, asyncio.TimeoutError, FutureTimeoutError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and (status_code in RETRYABLE_STATUS_CODES or status_code >= 500)
+
+# Seconds the provider asked us to wait in a Retry-After header, if any
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+# Consecutive-failure circuit breaker with a half-open trial call after the cooldown
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, cooldown_seconds: float = 30):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+        self.opened = 0
+        self.rejected = 0
+
+    # Raise CircuitOpenError unless a call may go through now
+    def before_call(self) -> None:
+        with self._lock:
+            if self._state == "open":
+                if time.monotonic() - self._opened_at < self.cooldown_seconds:
+                    self.rejected += 1
+                    raise CircuitOpenError("LLM provider circuit is open; failing fast")
+                self._state = "half_open"
+                self._trial_in_flight = False
+            if self._state == "half_open":
+                # Only one trial call probes the provider; the rest keep failing fast
+                if self._trial_in_flight:
+                    self.rejected += 1
+                    raise CircuitOpenError("LLM provider circuit is half-open; trial call in flight")
+                self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    self.opened += 1
+                    logging.warning(f"Opening LLM circuit breaker after {self._failures} consecutive failures")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    # Let another call probe the provider when a trial ended without a verdict, such as when it was cancelled
+    def release_trial(self) -> None:
+        with self._lock:
+            self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "failure_threshold": self.failure_threshold,
+                "cooldown_seconds": self.cooldown_seconds
+            }
+
+
+# Sliding window of successful call latencies per stage, used to pick the hedging delay
+class LatencyWindow:
+    def __init__(self, size: int = 200):
+        self.size = size
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self.size)).append(seconds)
+
+    # Latency at the given percentile, or None until enough samples exist
+    def percentile(self, stage: str, percentile: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(percentile * len(samples)))]
+
+    def summary(self, stage: str) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if not samples:
+            return {"samples": 0}
+        return {
+            "samples": len(samples),
+            "p50_ms": round(1000 * samples[len(samples) // 2], 1),
+            "p95_ms": round(1000 * samples[min(len(samples) - 1, int(0.95 * len(samples)))], 1),
+            "p99_ms": round(1000 * samples[min(len(samples) - 1, int(0.99 * len(samples)))], 1)
+        }
+
+
+# Timeouts, jittered retries, hedged requests and a circuit breaker around LLM calls
+class ResilientCaller:
+    def __init__(self, default_timeout: float = 30, stage_timeouts: Optional[Dict[str, float]] = None,
+                 max_retries: int = 2, retry_base_seconds: float = 0.5, retry_max_seconds: float = 8,
+                 hedging: bool = False, hedge_percentile: float = 0.95, hedge_min_samples: int = 20,
+                 hedge_workers: int = 32, breaker: Optional[CircuitBreaker] = None):
+        self.default_timeout = default_timeout
+        self.stage_timeouts = stage_timeouts or {}
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyWindow()
+
+        self._hedge_executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="llm-hedge") if hedging else None
+        self._metrics: Dict[str, Dict[str, int]] = {}
+        self._metrics_lock = threading.Lock()
+
+    def timeout_for(self, stage: str) -> float:
+        return self.stage_timeouts.get(stage, self.default_timeout)
+
+    def _count(self, stage: str, counter: str) -> None:
+        with self._metrics_lock:
+            entry = self._metrics.setdefault(stage, {"calls": 0, "attempts": 0, "retries": 0, "timeouts": 0,
+                                                     "failures": 0, "hedges": 0, "hedge_wins": 0})
+            entry[counter] += 1
+
+    # Full-jitter exponential backoff, honouring Retry-After when the provider sends one
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        delay = random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2 ** attempt))
+        retry_after = retry_after_seconds(error)
+        return max(delay, min(retry_after, self.retry_max_seconds)) if retry_after is not None else delay
+
+    def _hedge_delay(self, stage: str, timeout: float, hedge: bool) -> Optional[float]:
+        if not (self.hedging and hedge):
+            return None
+        delay = self.latency.percentile(stage, self.hedge_percentile, self.hedge_min_samples)
+        return delay if delay is not None and delay < timeout else None
+
+    def _record_outcome(self, stage: str, error: Optional[BaseException]) -> None:
+        if error is None or not is_retryable(error):
+            # A non-retryable error (a 400, a schema error) still means the provider answered,
+            # which settles a half-open trial as well as a success does
+            self.breaker.record_success()
+        else:
+            # Only provider-side trouble counts towards opening the circuit
+            self.breaker.record_failure()
+            timed_out = isinstance(error, (openai.APITimeoutError, requests.Timeout, TimeoutError, asyncio.TimeoutError, FutureTimeoutError))
+            self._count(stage, "timeouts" if timed_out else "failures")
+
+    # Run one attempt, firing a duplicate request if the first one outlives the stage's p95 latency
+    def _attempt(self, stage: str, request: Callable[[float], Any], timeout: float, hedge: bool) -> Any:
+        hedge_delay = self._hedge_delay(stage, timeout, hedge)
+        if hedge_delay is None:
+            return request(timeout)
+
+        primary = self._hedge_executor.submit(request, timeout)
+        try:
+            return primary.result(timeout=hedge_delay)
+        except FutureTimeoutError:
+            pass
+
+        self._count(stage, "hedges")
+        hedge = self._hedge_executor.submit(request, timeout - hedge_delay)
+        pending = {primary, hedge}
+        last_error = None
+        while pending:
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                raise FutureTimeoutError(f"{stage} timed out after {timeout}s")
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count(stage, "hedge_wins")
+                    # The slower request cannot be aborted on the sync client; its timeout bounds it
+                    for loser in pending:
+                        loser.cancel()
+                    return future.result()
+                last_error = future.exception()
+        raise last_error
+
+    # Call request(timeout) with the stage timeout, retries, hedging and circuit breaker applied;
+    # hedge=False suits requests whose losing duplicate would hold a connection open, such as streams
+    def call(self, stage: str, request: Callable[[float], Any], hedge: bool = True) -> Any:
+        timeout = self.timeout_for(stage)
+        self._count(stage, "calls")
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            self._count(stage, "attempts")
+            started = time.perf_counter()
+            try:
+                result = self._attempt(stage, request, timeout, hedge)
+            except Exception as e:
+                self._record_outcome(stage, e)
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                logging.warning(f"[{stage}] LLM call failed ({type(e).__name__}: {str(e)[:200]}); retrying in {delay:.2f}s")
+                self._count(stage, "retries")
+                attempt += 1
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled or interrupted before an outcome: free the half-open trial for the next call
+                self.breaker.release_trial()
+                raise
+            self._record_outcome(stage, None)
+            self.latency.record(stage, time.perf_counter() - started)
+            return result
+
+    # Async attempt: the losing request of a hedge is cancelled outright
+    async def _attempt_async(self, stage: str, request: Callable[[float], Awaitable[Any]], timeout: float, hedge: bool) -> Any:
+        hedge_delay = self._hedge_delay(stage, timeout, hedge)
+        if hedge_delay is None:
+            return await asyncio.wait_for(request(timeout), timeout)
+
+        primary = asyncio.ensure_future(asyncio.wait_for(request(timeout), timeout))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        self._count(stage, "hedges")
+        hedge = asyncio.ensure_future(asyncio.wait_for(request(timeout - hedge_delay), timeout - hedge_delay))
+        pending = {primary, hedge}
+        last_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count(stage, "hedge_wins")
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    # Async counterpart of call() for the AsyncOpenAI client
+    async def call_async(self, stage: str, request: Callable[[float], Awaitable[Any]], hedge: bool = True) -> Any:
+        timeout = self.timeout_for(stage)
+        self._count(stage, "calls")
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            self._count(stage, "attempts")
+            started = time.perf_counter()
+            try:
+                result = await self._attempt_async(stage, request, timeout, hedge)
+            except Exception as e:
+                self._record_outcome(stage, e)
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                logging.warning(f"[{stage}] LLM call failed ({type(e).__name__}: {str(e)[:200]}); retrying in {delay:.2f}s")
+                self._count(stage, "retries")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled or interrupted before an outcome: free the half-open trial for the next call
+                self.breaker.release_trial()
+                raise
+            self._record_outcome(stage, None)
+            self.latency.record(stage, time.perf_counter() - started)
+            return result
+
+    # Report per-stage counters and latency percentiles plus the breaker state
+    def stats(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            stages = {stage: dict(counters) for stage, counters in self._metrics.items()}
+        for stage, counters in stages.items():
+            counters["timeout_seconds"] = self.timeout_for(stage)
+            counters.update(self.latency.summary(stage))
+        return {
+            "max_retries": self.max_retries,
+            "hedging": self.hedging,
+            "hedge_percentile": self.hedge_percentile,
+            "circuit_breaker": self.breaker.stats(),
+            "stages": stages
+        }
+
+
+# Build the resilience layer from LLM_* environment variables
+def resilient_caller_from_env() -> ResilientCaller:
+    # Per-stage overrides such as LLM_TIMEOUT_SQL=20 or LLM_TIMEOUT_ANSWER_WITH_DATA=45
+    stage_timeouts = {
+        key[len("LLM_TIMEOUT_"):].lower(): float(value)
+        for key, value in os.environ.items()
+        if key.startswith("LLM_TIMEOUT_") and key != "LLM_TIMEOUT_SECONDS"
+    }
+    return ResilientCaller(
+        default_timeout=float(os.environ.get("LLM_TIMEOUT_SECONDS", 30)),
+        stage_timeouts=stage_timeouts,
+        max_retries=int(os.environ.get("LLM_MAX_RETRIES", 2)),
+        retry_base_seconds=float(os.environ.get("LLM_RETRY_BASE_SECONDS", 0.5)),
+        retry_max_seconds=float(os.environ.get("LLM_RETRY_MAX_SECONDS", 8)),
+        hedging=os.environ.get("LLM_HEDGING", "false").lower() in ("1", "true", "yes"),
+        hedge_percentile=float(os.environ.get("LLM_HEDGE_PERCENTILE", 0.95)),
+        hedge_min_samples=int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", 20)),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.environ.get("LLM_BREAKER_FAILURES", 5)),
+            cooldown_seconds=float(os.environ.get("LLM_BREAKER_COOLDOWN_SECONDS", 30))
+        )
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure LLM call tail latency through the resilience layer. "
+                                                 "Point OPENAI_BASE_URL at fake_openai_server.py to inject latency and errors.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--stage", default="bench")
+    args = parser.parse_args()
+
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+    from rag_openAI import generate_response, llm_resilience
+
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def one_request(index: int) -> None:
+        started = time.perf_counter()
+        try:
+            generate_response([{"role": "user", "content": f"bench request {index}"}], max_tokens=20, stage=args.stage)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            with lock:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(one_request, range(args.requests)))
+
+    latencies.sort()
+    def percentile(p: float) -> Optional[float]:
+        return round(1000 * latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1) if latencies else None
+
+    print(json.dumps({
+        "succeeded": len(latencies),
+        "errors": errors,
+        "p50_ms": percentile(0.5),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(1000 * latencies[-1], 1) if latencies else None,
+        "resilience": llm_resilience.stats()
+    }, indent=2))
+
+if __name__ == "__main__":
+    sys.exit(main())
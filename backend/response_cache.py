@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+
+# Build a stable cache key from the parameters that determine an LLM completion
+def make_cache_key(model: str, messages: List[Dict[str, str]], max_tokens: int,
+                   response_format: Optional[Dict[str, Any]] = None) -> str:
+    key_fields = {"model": model, "messages": messages, "max_tokens": max_tokens}
+    if response_format is not None:
+        key_fields["response_format"] = response_format
+    payload = json.dumps(key_fields, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# In-memory LRU cache with TTL eviction and an optional SQLite store shared between processes
+class ResponseCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024,
+                 ttl_seconds: float = 3600, disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if self.disk_path:
+            self._init_disk_store()
+
+    # Create the on-disk table if it does not exist yet
+    def _init_disk_store(self) -> None:
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_responses ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Disabling on-disk LLM cache at {self.disk_path}: {str(e)}")
+            self.disk_path = None
+
+    # Open a short-lived SQLite connection; safe to use after a gunicorn fork
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.disk_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    # Store an entry in memory and evict least recently used entries over the limits
+    def _store_in_memory(self, key: str, value: str, created_at: float) -> None:
+        if key in self._entries:
+            old_value, _ = self._entries.pop(key)
+            self._bytes -= len(old_value)
+
+        size = len(value)
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = (value, created_at)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (evicted_value, _) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted_value)
+            self.evictions += 1
+
+    def _get_from_disk(self, key: str) -> Optional[Tuple[str, float]]:
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, created_at FROM llm_responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and self._is_expired(row[1]):
+                    conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                    self.expirations += 1
+                    return None
+                return row
+        except sqlite3.Error as e:
+            logging.error(f"On-disk LLM cache read failed: {str(e)}")
+            return None
+
+    def _set_on_disk(self, key: str, value: str, created_at: float) -> None:
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_responses (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, value, created_at)
+                )
+        except sqlite3.Error as e:
+            logging.error(f"On-disk LLM cache write failed: {str(e)}")
+
+    # Return the cached value for a key, or None on a miss
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._is_expired(created_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._entries.pop(key)
+                self._bytes -= len(value)
+                self.expirations += 1
+
+        if self.disk_path:
+            row = self._get_from_disk(key)
+            if row is not None:
+                value, created_at = row
+                with self._lock:
+                    self._store_in_memory(key, value, created_at)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    # Add a value to the cache (and the on-disk store if configured)
+    def set(self, key: str, value: str) -> None:
+        created_at = time.time()
+        with self._lock:
+            self._store_in_memory(key, value, created_at)
+        if self.disk_path:
+            self._set_on_disk(key, value, created_at)
+
+    # Drop every cached entry, including the on-disk store
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM llm_responses")
+            except sqlite3.Error as e:
+                logging.error(f"On-disk LLM cache clear failed: {str(e)}")
+
+    # Report hit/miss counters and current memory usage
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_path": self.disk_path
+            }
+
+
+# Build the cache from LLM_CACHE_* environment variables, or return None if disabled
+def response_cache_from_env() -> Optional[ResponseCache]:
+    if os.environ.get("LLM_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return ResponseCache(
+        max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 1024)),
+        max_bytes=int(os.environ.get("LLM_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+        ttl_seconds=float(os.environ.get("LLM_CACHE_TTL_SECONDS", 3600)),
+        disk_path=os.environ.get("LLM_CACHE_PATH") or None
+    )
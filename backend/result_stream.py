@@ -0,0 +1,140 @@
+import os
+import itertools
+import threading
+
+from typing import Dict, Any, List, Optional, Tuple
+
+
+# Text size of a row, the measure of the byte budget
+def row_bytes(row) -> int:
+    return sum(len(str(value)) for value in row)
+
+
+# Reads query results from a server-side cursor in fixed-size batches and stops at a row or byte budget,
+# so the memory a query takes no longer grows with the size of its result.
+# When the budget truncates a result, the remaining rows are counted on the server, up to `count_limit` of them.
+class ResultStreamer:
+    def __init__(self, batch_size: int = 100, max_rows: int = 1000, max_bytes: int = 1000000,
+                 count_limit: int = 10000):
+        self.batch_size = max(1, batch_size)
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.count_limit = count_limit
+        self._names = itertools.count(1)
+        self._lock = threading.Lock()
+        self._metrics = {"queries": 0, "truncated": 0, "counted": 0, "batches": 0, "rows": 0, "bytes": 0,
+                         "max_rows_seen": 0, "max_bytes_seen": 0}
+
+    def _cursor_name(self) -> str:
+        with self._lock:
+            return f"rag_stream_{os.getpid()}_{next(self._names)}"
+
+    # Keep rows from a batch until the budget is spent; returns the new byte total and whether the budget ran out
+    def _take(self, batch, rows: List[Any], size: int, max_rows: int) -> Tuple[int, bool]:
+        for row in batch:
+            size_of_row = row_bytes(row)
+            if len(rows) >= max_rows or (rows and size + size_of_row > self.max_bytes):
+                return size, True
+            rows.append(row)
+            size += size_of_row
+        return size, False
+
+    def _record(self, rows: int, size: int, batches: int, truncated: bool, counted: bool) -> None:
+        with self._lock:
+            self._metrics["queries"] += 1
+            self._metrics["truncated"] += truncated
+            self._metrics["counted"] += counted
+            self._metrics["batches"] += batches
+            self._metrics["rows"] += rows
+            self._metrics["bytes"] += size
+            self._metrics["max_rows_seen"] = max(self._metrics["max_rows_seen"], rows)
+            self._metrics["max_bytes_seen"] = max(self._metrics["max_bytes_seen"], size)
+
+    @staticmethod
+    def _result(column_names: List[str], rows: List[Any], truncated: bool, fetched: int,
+                moved: Optional[int], count_limit: int) -> Dict[str, Any]:
+        if not truncated:
+            total = len(rows)
+        elif moved is not None and moved < count_limit:
+            total = fetched + moved
+        else:
+            total = None
+        return {"column_names": column_names, "rows": rows, "row_count": len(rows), "truncated": truncated,
+                "total_row_count": total}
+
+    # Run a query on a named psycopg2 cursor. Named cursors only exist inside a transaction,
+    # so the connection must not be in autocommit mode.
+    # Returns column names, row tuples, the returned row count, `truncated` and `total_row_count`
+    # (None when counting the rest would take more than `count_limit` rows).
+    def fetch(self, conn, sql: str, params: Optional[Dict[str, Any]] = None,
+              max_rows: Optional[int] = None) -> Dict[str, Any]:
+        max_rows = self.max_rows if max_rows is None else max_rows
+        name = self._cursor_name()
+        rows: List[Any] = []
+        size = fetched = batches = 0
+        truncated = False
+        moved = None
+        with conn.cursor(name=name) as cursor:
+            cursor.itersize = self.batch_size
+            cursor.execute(sql, params or None)
+            while not truncated:
+                batch = cursor.fetchmany(self.batch_size)
+                batches += 1
+                fetched += len(batch)
+                size, truncated = self._take(batch, rows, size, max_rows)
+                if len(batch) < self.batch_size:
+                    break
+            # Named cursors only describe their columns after the first FETCH
+            column_names = [desc[0] for desc in cursor.description]
+            if truncated and self.count_limit:
+                with conn.cursor() as counter:
+                    counter.execute(f'MOVE FORWARD {int(self.count_limit)} IN "{name}"')
+                    moved = counter.rowcount
+        self._record(len(rows), size, batches, truncated, moved is not None and moved < self.count_limit)
+        return self._result(column_names, rows, truncated, fetched, moved, self.count_limit)
+
+    # Run a prepared asyncpg statement through a cursor, which must also run inside a transaction
+    async def fetch_async(self, conn, statement, args: List[Any], timeout: Optional[float] = None,
+                          max_rows: Optional[int] = None) -> Dict[str, Any]:
+        max_rows = self.max_rows if max_rows is None else max_rows
+        column_names = [attribute.name for attribute in statement.get_attributes()]
+        rows: List[Any] = []
+        size = fetched = batches = 0
+        truncated = False
+        moved = None
+        async with conn.transaction():
+            cursor = await statement.cursor(*args, timeout=timeout)
+            while not truncated:
+                batch = await cursor.fetch(self.batch_size, timeout=timeout)
+                batches += 1
+                fetched += len(batch)
+                size, truncated = self._take(batch, rows, size, max_rows)
+                if len(batch) < self.batch_size:
+                    break
+            if truncated and self.count_limit:
+                moved = await cursor.forward(self.count_limit, timeout=timeout)
+        self._record(len(rows), size, batches, truncated, moved is not None and moved < self.count_limit)
+        return self._result(column_names, rows, truncated, fetched, moved, self.count_limit)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queries = self._metrics["queries"]
+            return {
+                **self._metrics,
+                "avg_rows": round(self._metrics["rows"] / queries, 1) if queries else 0.0,
+                "batch_size": self.batch_size,
+                "max_rows": self.max_rows,
+                "max_bytes": self.max_bytes
+            }
+
+
+# Build the streamer from SQL_STREAM* and SQL_RESULT_* environment variables, or return None to fetch whole results
+def result_streamer_from_env() -> Optional[ResultStreamer]:
+    if os.environ.get("SQL_STREAM", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return ResultStreamer(
+        batch_size=int(os.environ.get("SQL_STREAM_BATCH_SIZE", 100)),
+        max_rows=int(os.environ.get("SQL_RESULT_MAX_ROWS", 1000)),
+        max_bytes=int(os.environ.get("SQL_RESULT_MAX_BYTES", 1000000)),
+        count_limit=int(os.environ.get("SQL_RESULT_COUNT_LIMIT", 10000))
+    )
@@ -925,5 +925,119 @@ simplified_hockey_stats_schema = {
         "unblockedshotattemptsagainst": "Total unblocked shot attempts against the team.",
         "scoreadjustedunblockedshotattemptsagainst": "Score adjusted unblocked shot attempts against the team.",
         "dzonegiveawaysagainst": "Total defensive zone giveaways against the team."
+    },
+    "player_career_totals": {
+        "player_id": "Identifier for the player.",
+        "name": "Name of the player.",
+        "position": "Most recent position of the player as a letter (D, L, R, C).",
+        "last_team": "3 Letter abbreviation of the players most recent team",
+        "situation": "Game situation: all, 5on5, 5on4, 4on5 or other.",
+        "season_type": "'regular_season', 'playoffs', or 'combined' for both added up.",
+        "first_season": "First season with data.",
+        "last_season": "Most recent season with data.",
+        "seasons": "Number of seasons with data.",
+        "games_played": "Total games played.",
+        "goals": "Total goals.",
+        "assists": "Total assists (primary and secondary).",
+        "primary_assists": "Total primary assists.",
+        "points": "Total points.",
+        "points_per_game": "Points per game played.",
+        "shots_on_goal": "Total shots on goal.",
+        "expected_goals": "Total expected goals.",
+        "hits": "Total hits.",
+        "takeaways": "Total takeaways.",
+        "giveaways": "Total giveaways.",
+        "penalty_minutes": "Total penalty minutes.",
+        "blocked_shots": "Total shots blocked by the player.",
+        "faceoffs_won": "Total faceoffs won.",
+        "faceoffs_lost": "Total faceoffs lost.",
+        "icetime_minutes": "Total ice time in minutes."
+    },
+    "goalie_career_totals": {
+        "player_id": "Identifier for the goalie.",
+        "name": "Name of the goalie.",
+        "last_team": "3 Letter abbreviation of the goalies most recent team",
+        "situation": "Game situation: all, 5on5, 5on4, 4on5 or other.",
+        "season_type": "'regular_season', 'playoffs', or 'combined' for both added up.",
+        "first_season": "First season with data.",
+        "last_season": "Most recent season with data.",
+        "seasons": "Number of seasons with data.",
+        "games_played": "Total games played.",
+        "shots_against": "Total shots on goal against.",
+        "goals_against": "Total goals against.",
+        "saves": "Total saves.",
+        "save_percentage": "Save percentage over all shots against (0 to 1).",
+        "goals_against_average": "Goals against per 60 minutes.",
+        "expected_goals_against": "Total expected goals against.",
+        "goals_saved_above_expected": "Expected goals against minus goals against.",
+        "high_danger_shots_against": "Total high danger shots against.",
+        "high_danger_goals_against": "Total high danger goals against.",
+        "icetime_minutes": "Total ice time in minutes."
+    },
+    "team_career_totals": {
+        "team": "3 Letter abbreviation of the team",
+        "situation": "Game situation: all, 5on5, 5on4, 4on5 or other.",
+        "season_type": "'regular_season', 'playoffs', or 'combined' for both added up.",
+        "first_season": "First season with data.",
+        "last_season": "Most recent season with data.",
+        "seasons": "Number of seasons with data.",
+        "games_played": "Total games played.",
+        "wins": "Games won (use with situation 'all').",
+        "losses": "Games lost (use with situation 'all').",
+        "goals_for": "Total goals scored.",
+        "goals_against": "Total goals allowed.",
+        "goal_differential": "Goals for minus goals against.",
+        "expected_goals_for": "Total expected goals for.",
+        "expected_goals_against": "Total expected goals against.",
+        "shots_on_goal_for": "Total shots on goal for.",
+        "shots_on_goal_against": "Total shots on goal against."
+    },
+    "player_team_tenures": {
+        "player_id": "Identifier for the player.",
+        "name": "Name of the player.",
+        "position": "Most recent position of the player with the team as a letter (D, L, R, C).",
+        "team": "3 Letter abbreviation of the team the totals were recorded with",
+        "situation": "Game situation: all, 5on5, 5on4, 4on5 or other.",
+        "season_type": "'regular_season', 'playoffs', or 'combined' for both added up.",
+        "first_season": "First season with data.",
+        "last_season": "Most recent season with data.",
+        "seasons": "Number of seasons with data.",
+        "games_played": "Total games played.",
+        "goals": "Total goals.",
+        "assists": "Total assists (primary and secondary).",
+        "primary_assists": "Total primary assists.",
+        "points": "Total points.",
+        "points_per_game": "Points per game played.",
+        "shots_on_goal": "Total shots on goal.",
+        "expected_goals": "Total expected goals.",
+        "hits": "Total hits.",
+        "takeaways": "Total takeaways.",
+        "giveaways": "Total giveaways.",
+        "penalty_minutes": "Total penalty minutes.",
+        "blocked_shots": "Total shots blocked by the player.",
+        "faceoffs_won": "Total faceoffs won.",
+        "faceoffs_lost": "Total faceoffs lost.",
+        "icetime_minutes": "Total ice time in minutes."
+    },
+    "goalie_team_tenures": {
+        "player_id": "Identifier for the goalie.",
+        "name": "Name of the goalie.",
+        "team": "3 Letter abbreviation of the team the totals were recorded with",
+        "situation": "Game situation: all, 5on5, 5on4, 4on5 or other.",
+        "season_type": "'regular_season', 'playoffs', or 'combined' for both added up.",
+        "first_season": "First season with data.",
+        "last_season": "Most recent season with data.",
+        "seasons": "Number of seasons with data.",
+        "games_played": "Total games played.",
+        "shots_against": "Total shots on goal against.",
+        "goals_against": "Total goals against.",
+        "saves": "Total saves.",
+        "save_percentage": "Save percentage over all shots against (0 to 1).",
+        "goals_against_average": "Goals against per 60 minutes.",
+        "expected_goals_against": "Total expected goals against.",
+        "goals_saved_above_expected": "Expected goals against minus goals against.",
+        "high_danger_shots_against": "Total high danger shots against.",
+        "high_danger_goals_against": "Total high danger goals against.",
+        "icetime_minutes": "Total ice time in minutes."
     }
 }
\ No newline at end of file
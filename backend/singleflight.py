@@ -0,0 +1,67 @@
+import threading
+
+from typing import Dict, Any, Callable, Tuple
+
+
+# One in-flight computation and the outcome shared with every caller waiting on it
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+# Collapse concurrent calls with the same key into a single execution
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+        self.executions = 0
+        self.collapsed = 0
+        self.max_waiters = 0
+
+    # Run fn once per key at a time; returns (result, shared) where shared is True for callers that waited
+    def do(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.collapsed += 1
+                self.max_waiters = max(self.max_waiters, flight.waiters)
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn(*args, **kwargs)
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            # Later callers start a fresh computation instead of reusing this result
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    # Report how many calls executed and how many were collapsed onto an in-flight call
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self.executions + self.collapsed
+            return {
+                "executions": self.executions,
+                "collapsed": self.collapsed,
+                "collapse_rate": round(self.collapsed / requests, 4) if requests else 0.0,
+                "max_waiters": self.max_waiters,
+                "in_flight": len(self._flights)
+            }
@@ -0,0 +1,166 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable
+
+# Ways of asking for the same SQL, so concurrent candidates fail independently.
+# `tier` is the first model tier of the sql cascade to use, `examples` whether retrieved examples go in the prompt,
+# and `instruction` is appended to the system prompt.
+CANDIDATE_VARIANTS = [
+    {"name": "default", "tier": 0, "examples": True, "instruction": ""},
+    {"name": "strong_model", "tier": 1, "examples": True, "instruction": ""},
+    {"name": "explicit_joins", "tier": 0, "examples": False,
+     "instruction": "Qualify every column with its table alias. Join regular season and playoff tables explicitly "
+                    "with JOIN ... ON on the player id, season and situation, and aggregate with GROUP BY."},
+    {"name": "ctes", "tier": 0, "examples": True,
+     "instruction": "Compute each table's part of the answer in its own CTE, then combine the CTEs in the final SELECT."}
+]
+
+Attempt = Tuple[Optional[str], Dict[str, Any]]
+
+
+# Whether a successful run returned something worth answering with: at least one row with a non-null value
+def result_is_sane(test_result: Dict[str, Any]) -> bool:
+    if not test_result.get("success") or not test_result.get("results"):
+        return False
+    return any(value is not None for row in test_result["results"] for value in row.values())
+
+
+# One race between candidates: tracks the connections executing candidate SQL so the losers can be cancelled
+class SQLRace:
+    def __init__(self, timeout_ms: int):
+        self.timeout_ms = timeout_ms
+        self._connections: set = set()
+        self._settled = False
+        self._lock = threading.Lock()
+
+    @property
+    def settled(self) -> bool:
+        return self._settled
+
+    # Track a psycopg2 connection about to execute a candidate; False if the race is already won
+    def register(self, conn) -> bool:
+        with self._lock:
+            if self._settled:
+                return False
+            self._connections.add(conn)
+            return True
+
+    def unregister(self, conn) -> None:
+        with self._lock:
+            self._connections.discard(conn)
+
+    # Mark the race as won and cancel the queries still running on the other connections.
+    # Cancelling under the lock keeps a loser from returning its connection to the pool mid-cancel.
+    def settle(self) -> int:
+        with self._lock:
+            self._settled = True
+            for conn in self._connections:
+                try:
+                    conn.cancel()
+                except Exception as e:
+                    logging.debug(f"Unable to cancel a losing SQL candidate: {str(e)}")
+            return len(self._connections)
+
+
+# Runs N SQL candidates concurrently and keeps the first one that succeeds with a sane result
+class SQLCandidateRunner:
+    def __init__(self, candidates: int = 3, timeout_ms: int = 3000, max_workers: int = 16):
+        self.variants = CANDIDATE_VARIANTS[:max(1, min(candidates, len(CANDIDATE_VARIANTS)))]
+        self.timeout_ms = timeout_ms
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sql-candidate")
+        self._lock = threading.Lock()
+        self._metrics = {"races": 0, "won": 0, "no_winner": 0, "cancelled": 0, "total_seconds": 0.0,
+                         "max_seconds": 0.0, "wins": {}}
+
+    def _record(self, seconds: float, winner: Optional[Dict[str, Any]], cancelled: int = 0) -> None:
+        with self._lock:
+            self._metrics["races"] += 1
+            self._metrics["total_seconds"] += seconds
+            self._metrics["max_seconds"] = max(self._metrics["max_seconds"], seconds)
+            self._metrics["cancelled"] += cancelled
+            if winner is None:
+                self._metrics["no_winner"] += 1
+            else:
+                self._metrics["won"] += 1
+                self._metrics["wins"][winner["name"]] = self._metrics["wins"].get(winner["name"], 0) + 1
+
+    # Run attempt(variant, race) for every variant on worker threads.
+    # Returns the winning variant (or None) and every finished attempt as (variant, sql, result).
+    def run(self, attempt: Callable[[Dict[str, Any], SQLRace], Attempt]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        race = SQLRace(self.timeout_ms)
+        futures = {self.executor.submit(attempt, variant, race): variant for variant in self.variants}
+        attempts = []
+        for future in as_completed(futures):
+            variant = futures[future]
+            try:
+                sql_query, test_result = future.result()
+            except Exception as e:
+                logging.error(f"SQL candidate {variant['name']} failed: {str(e)}")
+                continue
+            attempts.append((variant, sql_query, test_result))
+            if result_is_sane(test_result):
+                # The losers keep running in the background only until their queries are cancelled
+                cancelled = race.settle()
+                self._record(time.perf_counter() - start, variant, cancelled)
+                logging.debug(f"SQL candidate {variant['name']} won; cancelled {cancelled} running queries")
+                return {"winner": variant, "sql": sql_query, "result": test_result, "attempts": attempts}
+
+        race.settle()
+        self._record(time.perf_counter() - start, None)
+        return {"winner": None, "sql": None, "result": None, "attempts": attempts}
+
+    # Async counterpart of run(); losing tasks are cancelled, which cancels their asyncpg queries
+    async def run_async(self, attempt: Callable[[Dict[str, Any], SQLRace], Awaitable[Attempt]]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        race = SQLRace(self.timeout_ms)
+        tasks = {asyncio.ensure_future(attempt(variant, race)): variant for variant in self.variants}
+        pending = set(tasks)
+        attempts = []
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                variant = tasks[task]
+                if task.exception() is not None:
+                    logging.error(f"SQL candidate {variant['name']} failed: {str(task.exception())}")
+                    continue
+                sql_query, test_result = task.result()
+                attempts.append((variant, sql_query, test_result))
+                if result_is_sane(test_result):
+                    race.settle()
+                    for loser in pending:
+                        loser.cancel()
+                    self._record(time.perf_counter() - start, variant, len(pending))
+                    return {"winner": variant, "sql": sql_query, "result": test_result, "attempts": attempts}
+
+        race.settle()
+        self._record(time.perf_counter() - start, None)
+        return {"winner": None, "sql": None, "result": None, "attempts": attempts}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            races = self._metrics["races"]
+            return {
+                **self._metrics,
+                "wins": dict(self._metrics["wins"]),
+                "avg_seconds": round(self._metrics["total_seconds"] / races, 4) if races else 0.0,
+                "candidates": [variant["name"] for variant in self.variants],
+                "timeout_ms": self.timeout_ms
+            }
+
+
+# Build the runner from SQL_CANDIDATES* environment variables, or return None for one candidate at a time
+def sql_candidate_runner_from_env() -> Optional[SQLCandidateRunner]:
+    candidates = int(os.environ.get("SQL_CANDIDATES", 1))
+    if candidates <= 1:
+        return None
+    return SQLCandidateRunner(
+        candidates=candidates,
+        timeout_ms=int(os.environ.get("SQL_CANDIDATE_TIMEOUT_MS", 3000)),
+        max_workers=int(os.environ.get("SQL_CANDIDATE_WORKERS", 16))
+    )
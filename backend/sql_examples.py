@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import threading
+
+from collections import Counter, deque
+from typing import Dict, Any, List, Optional, Set
+
+from intent_router import tokenize
+
+DEFAULT_SEED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sql_examples_seed.jsonl")
+
+
+# Verified (question, tables, SQL) examples with a BM25 index over the questions.
+# Retrieved examples are added to the SQL prompt as few-shot demonstrations.
+class SQLExampleStore:
+    def __init__(self, k: int = 3, max_examples: int = 2000, log_path: Optional[str] = None,
+                 k1: float = 1.5, b: float = 0.75):
+        self.k = k
+        self.max_examples = max_examples
+        self.log_path = log_path
+        self.k1 = k1
+        self.b = b
+        self._examples: List[Dict[str, Any]] = []
+        self._questions: Dict[str, Dict[str, Any]] = {}
+        # Question keys of learned examples, oldest first; only these are evicted
+        self._learned: deque = deque()
+        self._document_frequency: Counter = Counter()
+        self._total_length = 0
+        self._lock = threading.Lock()
+        # Outcomes of generated SQL, split by whether the prompt carried examples
+        self._outcomes = {arm: {"runs": 0, "first_try": 0, "corrections": 0, "failed": 0}
+                          for arm in ("with_examples", "without_examples")}
+        self._metrics = {"searches": 0, "learned": 0, "duplicates": 0, "evicted": 0}
+
+    @staticmethod
+    def _question_key(question: str) -> str:
+        return " ".join(question.lower().split())
+
+    def _index(self, example: Dict[str, Any]) -> None:
+        terms = Counter(tokenize(example["question"]))
+        example["terms"] = terms
+        example["length"] = sum(terms.values())
+        self._document_frequency.update(terms.keys())
+        self._total_length += example["length"]
+
+    def _unindex(self, example: Dict[str, Any]) -> None:
+        for term in example["terms"]:
+            self._document_frequency[term] -= 1
+            if self._document_frequency[term] <= 0:
+                del self._document_frequency[term]
+        self._total_length -= example["length"]
+
+    # Drop the oldest learned example to make room; seed examples are never evicted
+    def _evict_learned(self) -> bool:
+        if not self._learned:
+            return False
+        example = self._questions.pop(self._learned.popleft())
+        self._examples.remove(example)
+        self._unindex(example)
+        self._metrics["evicted"] += 1
+        return True
+
+    # Add an example unless the same question is already stored; returns True if added.
+    # A full store makes room by evicting its oldest learned example, and refuses the new one if it holds only seeds.
+    def add(self, question: str, required_tables: List[str], sql: str, source: str = "learned") -> bool:
+        key = self._question_key(question)
+        if not key or not sql:
+            return False
+        with self._lock:
+            if key in self._questions:
+                self._metrics["duplicates"] += 1
+                return False
+            if len(self._examples) >= self.max_examples and not self._evict_learned():
+                return False
+            example = {"question": question, "required_tables": sorted(set(required_tables)), "sql": sql,
+                       "source": source}
+            self._index(example)
+            self._questions[key] = example
+            self._examples.append(example)
+            if source == "learned":
+                self._learned.append(key)
+        return True
+
+    # Load examples from JSONL files; missing files are skipped
+    def load(self, paths: List[str], source: str = "seed") -> int:
+        loaded = 0
+        for path in paths:
+            if not path or not os.path.exists(path):
+                continue
+            with open(path) as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        logging.error(f"Skipping malformed SQL example in {path}")
+                        continue
+                    loaded += self.add(record.get("question", ""), record.get("required_tables", []),
+                                       record.get("sql", ""), record.get("source", source))
+        return loaded
+
+    # Store the SQL of a generated query that returned rows, appending it to the example log when one is configured
+    def learn(self, question: str, required_tables: List[str], sql: str) -> None:
+        if not self.add(question, required_tables, sql):
+            return
+        with self._lock:
+            self._metrics["learned"] += 1
+        if self.log_path:
+            record = {"question": question, "required_tables": sorted(set(required_tables)), "sql": sql,
+                      "source": "learned", "logged_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            try:
+                with self._lock, open(self.log_path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                logging.error(f"Unable to write SQL example log {self.log_path}: {str(e)}")
+
+    # Top-k examples by BM25 score of the question, boosted by the overlap of their tables with the query's;
+    # examples reading any of `exclude_tables` are skipped
+    def search(self, question: str, required_tables: Optional[List[str]] = None,
+               k: Optional[int] = None, exclude_tables: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        k = self.k if k is None else k
+        query_terms = set(tokenize(question or ""))
+        tables = set(required_tables or [])
+        with self._lock:
+            self._metrics["searches"] += 1
+            if k <= 0 or not self._examples or not query_terms:
+                return []
+            count = len(self._examples)
+            average_length = self._total_length / count
+            idf = {term: math.log(1 + (count - self._document_frequency[term] + 0.5) /
+                                  (self._document_frequency[term] + 0.5))
+                   for term in query_terms if term in self._document_frequency}
+            scored = []
+            for example in self._examples:
+                if exclude_tables and not exclude_tables.isdisjoint(example["required_tables"]):
+                    continue
+                score = 0.0
+                for term, weight in idf.items():
+                    frequency = example["terms"].get(term, 0)
+                    if frequency:
+                        norm = self.k1 * (1 - self.b + self.b * example["length"] / average_length)
+                        score += weight * frequency * (self.k1 + 1) / (frequency + norm)
+                if score <= 0:
+                    continue
+                if tables:
+                    example_tables = set(example["required_tables"])
+                    score *= 1 + len(tables & example_tables) / len(tables | example_tables)
+                scored.append((score, example))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [{"question": example["question"], "required_tables": example["required_tables"],
+                 "sql": example["sql"], "score": round(score, 3)} for score, example in scored[:k]]
+
+    # Record how a generated query fared: right on the first try, or only after the correction loop ran
+    def record_outcome(self, used_examples: bool, success: bool, corrected: bool) -> None:
+        with self._lock:
+            outcome = self._outcomes["with_examples" if used_examples else "without_examples"]
+            outcome["runs"] += 1
+            outcome["first_try"] += success and not corrected
+            outcome["corrections"] += corrected
+            outcome["failed"] += not success
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            outcomes = {}
+            for arm, counts in self._outcomes.items():
+                runs = counts["runs"]
+                outcomes[arm] = {
+                    **counts,
+                    "first_try_rate": round(counts["first_try"] / runs, 4) if runs else 0.0,
+                    "correction_rate": round(counts["corrections"] / runs, 4) if runs else 0.0
+                }
+            return {
+                **self._metrics,
+                "examples": len(self._examples),
+                "k": self.k,
+                "outcomes": outcomes
+            }
+
+
+# Format retrieved examples for the SQL prompt
+def format_examples(examples: List[Dict[str, Any]]) -> str:
+    return "\n\n".join(f"Question: {example['question']}\nSQL: {example['sql']}" for example in examples)
+
+
+# Build the example store from SQL_EXAMPLES* environment variables, or return None if disabled
+def sql_example_store_from_env() -> Optional[SQLExampleStore]:
+    if os.environ.get("SQL_EXAMPLES", "true").lower() not in ("1", "true", "yes"):
+        return None
+    log_path = os.environ.get("SQL_EXAMPLES_LOG_PATH") or None
+    store = SQLExampleStore(k=int(os.environ.get("SQL_EXAMPLES_K", 3)),
+                            max_examples=int(os.environ.get("SQL_EXAMPLES_MAX", 2000)),
+                            log_path=log_path)
+    seed_path = os.environ.get("SQL_EXAMPLES_SEED_PATH", DEFAULT_SEED_PATH)
+    store.load([seed_path])
+    store.load([log_path], source="learned")
+    return store
+
+
+# Show the examples retrieved for a question
+def main():
+    parser = argparse.ArgumentParser(description="Search the few-shot SQL example store")
+    parser.add_argument("question", help="Question to retrieve examples for")
+    parser.add_argument("--tables", nargs="*", default=[], help="Required tables of the question")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--seed-data", default=DEFAULT_SEED_PATH)
+    parser.add_argument("--log", default=os.environ.get("SQL_EXAMPLES_LOG_PATH"), help="Learned examples (JSONL)")
+    args = parser.parse_args()
+
+    store = SQLExampleStore(k=args.k)
+    store.load([args.seed_data])
+    store.load([args.log], source="learned")
+    for example in store.search(args.question, args.tables):
+        print(f"{example['score']:>7}  {example['question']}\n         {example['sql']}\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
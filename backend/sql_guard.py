@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import logging
+import argparse
+import threading
+
+from typing import Dict, Any, List, Optional
+
+from sql_validator import tokenize
+
+
+# Raised when a query's estimated plan is too expensive to run
+class QueryRejectedError(Exception):
+    def __init__(self, message: str, plan: Dict[str, Any]):
+        super().__init__(message)
+        self.plan = plan
+
+
+# Checks the EXPLAIN estimate of every query before it runs and bounds its runtime with statement_timeout
+class SQLGuard:
+    def __init__(self, max_cost: float = 500000, max_rows: int = 1000, statement_timeout_ms: int = 10000):
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.statement_timeout_ms = statement_timeout_ms
+        self._lock = threading.Lock()
+        self._metrics = {"checked": 0, "rejected": 0, "rewritten": 0, "timeouts": 0,
+                         "total_cost": 0.0, "max_cost_seen": 0.0}
+
+    def _count(self, counter: str, amount: float = 1) -> None:
+        with self._lock:
+            self._metrics[counter] += amount
+
+    def record_timeout(self) -> None:
+        self._count("timeouts")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            checked = self._metrics["checked"]
+            return {
+                **self._metrics,
+                "avg_cost": round(self._metrics["total_cost"] / checked, 1) if checked else 0.0,
+                "max_cost": self.max_cost,
+                "max_rows": self.max_rows,
+                "statement_timeout_ms": self.statement_timeout_ms
+            }
+
+    # Statement that bounds the runtime of every following query on the session
+    def timeout_statement(self) -> str:
+        return f"SET statement_timeout = {int(self.statement_timeout_ms)}"
+
+    @staticmethod
+    def explain_sql(sql: str) -> str:
+        return f"EXPLAIN (FORMAT JSON) {sql.strip().rstrip(';')}"
+
+    # Reduce EXPLAIN (FORMAT JSON) output to the top node's estimates
+    @staticmethod
+    def parse_plan(raw: Any) -> Dict[str, Any]:
+        if isinstance(raw, str):
+            raw = json.loads(raw)
+        plan = raw[0]["Plan"]
+        return {"cost": float(plan["Total Cost"]), "rows": int(plan["Plan Rows"]), "node": plan["Node Type"]}
+
+    # Whether the outermost query already has a LIMIT
+    @staticmethod
+    def has_top_level_limit(sql: str) -> bool:
+        depth = 0
+        for kind, text in tokenize(sql):
+            if text == "(":
+                depth += 1
+            elif text == ")":
+                depth -= 1
+            elif depth == 0 and kind == "ident" and text.lower() in ("limit", "fetch"):
+                return True
+        return False
+
+    def limited_sql(self, sql: str) -> str:
+        return f"SELECT * FROM ({sql.strip().rstrip(';')}) AS guarded_query LIMIT {int(self.max_rows)}"
+
+    def _record_plan(self, plan: Dict[str, Any]) -> None:
+        with self._lock:
+            self._metrics["checked"] += 1
+            self._metrics["total_cost"] += plan["cost"]
+            self._metrics["max_cost_seen"] = max(self._metrics["max_cost_seen"], plan["cost"])
+
+    def _reject(self, sql: str, plan: Dict[str, Any]) -> None:
+        self._count("rejected")
+        logging.warning(f"SQL guard rejected a query with estimated cost {plan['cost']:.0f} "
+                        f"and {plan['rows']} rows: {sql}")
+        raise QueryRejectedError(
+            f"Query rejected before execution: estimated cost {plan['cost']:.0f} exceeds the limit of "
+            f"{self.max_cost:.0f}. Add filters on season, team or name, avoid cross joins, and aggregate "
+            f"before joining large tables.", plan)
+
+    # Decide on a query from its estimated plan: run as is, run with a LIMIT added, or reject.
+    # `explain` returns the parsed plan for a query; the caller supplies it so the check works for psycopg2 and asyncpg.
+    def review(self, sql: str, explain) -> Dict[str, Any]:
+        plan = explain(sql)
+        self._record_plan(plan)
+        decision = {"sql": sql, "plan": {**plan, "rewritten": False}}
+
+        if plan["rows"] > self.max_rows and not self.has_top_level_limit(sql):
+            limited = self.limited_sql(sql)
+            limited_plan = explain(limited)
+            self._count("rewritten")
+            logging.info(f"SQL guard added LIMIT {self.max_rows} to a query estimated at {plan['rows']} rows")
+            decision = {"sql": limited, "plan": {**limited_plan, "rewritten": True, "original_cost": plan["cost"],
+                                                 "original_rows": plan["rows"]}}
+            plan = limited_plan
+
+        if plan["cost"] > self.max_cost:
+            self._reject(sql, decision["plan"])
+        logging.info(f"SQL plan: cost={plan['cost']:.1f} rows={plan['rows']} node={plan['node']}")
+        return decision
+
+    # Check a query on a psycopg2 cursor, returning the SQL to run and its plan summary
+    def check(self, cursor, sql: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        def explain(query: str) -> Dict[str, Any]:
+            cursor.execute(self.explain_sql(query), params)
+            return self.parse_plan(cursor.fetchone()[0])
+        return self.review(sql, explain)
+
+    # Check a query on an asyncpg connection
+    async def check_async(self, conn, sql: str, args: Optional[List[Any]] = None) -> Dict[str, Any]:
+        plans: Dict[str, Dict[str, Any]] = {}
+        plans[sql] = self.parse_plan(await conn.fetchval(self.explain_sql(sql), *(args or [])))
+        if plans[sql]["rows"] > self.max_rows and not self.has_top_level_limit(sql):
+            limited = self.limited_sql(sql)
+            plans[limited] = self.parse_plan(await conn.fetchval(self.explain_sql(limited), *(args or [])))
+        return self.review(sql, lambda query: plans[query])
+
+
+# Build the guard from SQL_GUARD_* environment variables, or return None if disabled
+def sql_guard_from_env() -> Optional[SQLGuard]:
+    if os.environ.get("SQL_GUARD", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return SQLGuard(
+        max_cost=float(os.environ.get("SQL_GUARD_MAX_COST", 500000)),
+        max_rows=int(os.environ.get("SQL_GUARD_MAX_ROWS", 1000)),
+        statement_timeout_ms=int(os.environ.get("SQL_STATEMENT_TIMEOUT_MS", 10000))
+    )
+
+
+# Synthetic tables shaped like team_games and player_stats_regular_season, created as temporary tables
+SYNTHETIC_TABLES = [
+    "CREATE TEMP TABLE team_games AS "
+    "SELECT g AS gameid, (ARRAY['TOR','MTL','BOS','NYR','EDM','CGY'])[1 + g %% 6] AS team, "
+    "2008 + g %% 16 AS season, s AS situation, (g %% 7) AS goalsfor, (g %% 5) AS goalsagainst, 0 AS playoffgame "
+    "FROM generate_series(1, %(games)s) AS g, unnest(ARRAY['all','5on5','5on4','4on5','other']) AS s",
+    "CREATE TEMP TABLE player_stats_regular_season AS "
+    "SELECT p AS player_id, 'Player ' || p AS name, 2008 + p %% 16 AS season, s AS situation, "
+    "(p %% 50) AS i_f_goals, (p %% 70) AS i_f_points "
+    "FROM generate_series(1, %(players)s) AS p, unnest(ARRAY['all','5on5','5on4','4on5','other']) AS s",
+    "ANALYZE team_games",
+    "ANALYZE player_stats_regular_season"
+]
+
+SAMPLE_QUERIES = [
+    ("filtered", "SELECT name, season, i_f_goals FROM player_stats_regular_season "
+                 "WHERE situation = 'all' AND season = 2022 ORDER BY i_f_goals DESC LIMIT 10"),
+    ("unbounded", "SELECT name, season, i_f_goals FROM player_stats_regular_season WHERE situation = 'all'"),
+    ("cross_join", "SELECT a.team, b.team, COUNT(*) FROM team_games a, team_games b "
+                   "WHERE a.situation = 'all' GROUP BY a.team, b.team"),
+    ("slow", "SELECT pg_sleep(30)")
+]
+
+
+# Run the sample queries through the guard against synthetic data in a local Postgres
+def main():
+    parser = argparse.ArgumentParser(description="Exercise the SQL guard against synthetic data in temporary tables")
+    parser.add_argument("--games", type=int, default=50000, help="Synthetic team_games rows per situation")
+    parser.add_argument("--players", type=int, default=20000, help="Synthetic player rows per situation")
+    parser.add_argument("--max-cost", type=float, default=float(os.environ.get("SQL_GUARD_MAX_COST", 500000)))
+    parser.add_argument("--max-rows", type=int, default=int(os.environ.get("SQL_GUARD_MAX_ROWS", 1000)))
+    parser.add_argument("--timeout-ms", type=int, default=2000)
+    args = parser.parse_args()
+
+    import psycopg2
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    guard = SQLGuard(args.max_cost, args.max_rows, args.timeout_ms)
+    conn = psycopg2.connect(dbname=os.environ.get("DB_NAME", "hockey_stats"), user=os.environ.get("DB_USER"),
+                            host=os.environ.get("DB_HOST", "localhost"), password=os.environ.get("DB_PASSWORD", ""))
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        for statement in SYNTHETIC_TABLES:
+            cursor.execute(statement, {"games": args.games, "players": args.players})
+        cursor.execute(guard.timeout_statement())
+
+        for name, sql in SAMPLE_QUERIES:
+            try:
+                decision = guard.check(cursor, sql)
+                cursor.execute(decision["sql"])
+                print(f"{name}: ran {cursor.rowcount} rows, plan {decision['plan']}")
+            except QueryRejectedError as e:
+                print(f"{name}: rejected, plan {e.plan}")
+            except psycopg2.errors.QueryCanceled:
+                guard.record_timeout()
+                print(f"{name}: cancelled by statement_timeout after {args.timeout_ms} ms")
+    conn.close()
+    print(json.dumps(guard.stats(), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
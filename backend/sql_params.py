@@ -0,0 +1,181 @@
+import os
+import hashlib
+import logging
+import threading
+
+import psycopg2
+
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from sql_validator import tokenize
+from sql_templates import to_positional
+
+# Tokens after which a literal is a filter value (season = 2022, name IN ('A', 'B'), team LIKE 'T%')
+COMPARISON_OPS = {"=", "<>", "!=", "<", ">", "<=", ">="}
+VALUE_KEYWORDS = {"like", "ilike", "between"}
+# Typed literals (INTERVAL '1 day', DATE '2023-01-01') cannot take a parameter
+TYPED_LITERAL_KEYWORDS = {"interval", "date", "time", "timestamp", "timestamptz"}
+
+bind_metrics = {"queries": 0, "bound_queries": 0, "literals": 0}
+bind_lock = threading.Lock()
+
+
+def get_bind_stats() -> Dict[str, Any]:
+    with bind_lock:
+        return dict(bind_metrics)
+
+def _literal_value(kind: str, text: str) -> Any:
+    if kind == "string":
+        return text[1:-1].replace("''", "'")
+    if any(char in text for char in ".eE"):
+        return float(text)
+    return int(text)
+
+# Replace the filter literals of a query with %(pN)s placeholders, returning the SQL and its parameters.
+# `params` holds values for placeholders already in the SQL (such as %(situation)s); only referenced ones are kept.
+# Literal % signs are escaped for psycopg2 whenever the query ends up with parameters.
+def bind_parameters(sql: str, params: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, Any]]:
+    tokens = tokenize(sql)
+    referenced = {text[2:-2] for kind, text in tokens if kind == "param" and text.startswith("%(")}
+    bound = {name: value for name, value in (params or {}).items() if name in referenced}
+
+    parts: List[Tuple[str, str]] = []
+    previous: List[str] = []
+    in_lists: List[bool] = []
+    between = False
+    literals = 0
+
+    # Whether a literal following the significant tokens in `context` is a filter value
+    def value_position(context: List[str]) -> bool:
+        last = context[-1] if context else ""
+        before = context[-2] if len(context) > 1 else ""
+        in_list = bool(in_lists) and in_lists[-1] and last in ("(", ",")
+        is_value = (last in COMPARISON_OPS or last in VALUE_KEYWORDS or in_list
+                    or (between and last == "and"))
+        return is_value and before not in TYPED_LITERAL_KEYWORDS and last not in TYPED_LITERAL_KEYWORDS
+
+    for kind, text in tokens:
+        lowered = text.lower()
+        if kind in ("string", "number"):
+            # A minus sign directly in a value position makes a negative literal (season > -5 binds -5)
+            negative = kind == "number" and previous[-1:] == ["-"] and value_position(previous[:-1])
+            if negative or value_position(previous):
+                if negative:
+                    previous.pop()
+                    sign = max(index for index, (part_kind, _) in enumerate(parts) if part_kind not in ("ws", "comment"))
+                    del parts[sign]
+                literals += 1
+                name = f"p{literals}"
+                bound[name] = -_literal_value(kind, text) if negative else _literal_value(kind, text)
+                last = previous[-1] if previous else ""
+                text = f"%({name})s"
+                kind = "param"
+                if between and last == "and":
+                    between = False
+        elif text == "(":
+            in_lists.append(bool(previous) and previous[-1] == "in")
+        elif text == ")" and in_lists:
+            in_lists.pop()
+        elif lowered == "between":
+            between = True
+
+        parts.append((kind, text))
+        if kind not in ("ws", "comment"):
+            previous.append(lowered if kind in ("ident", "op") else text)
+
+    with bind_lock:
+        bind_metrics["queries"] += 1
+        bind_metrics["literals"] += literals
+        if bound:
+            bind_metrics["bound_queries"] += 1
+
+    if not bound:
+        return sql, {}
+    escaped = [text if kind == "param" and text.startswith("%(") else text.replace("%", "%%")
+               for kind, text in parts]
+    return "".join(escaped), bound
+
+# Stable short identifier of a parameterized query shape
+def shape_name(sql: str) -> str:
+    return "rag_" + hashlib.sha1(" ".join(sql.split()).encode("utf-8")).hexdigest()[:16]
+
+
+# Server-side PREPARE for query shapes that recur, so Postgres plans each shape once per connection.
+# Shapes run fewer than `min_uses` times, and shapes Postgres cannot prepare, run as plain parameterized queries.
+class PreparedStatements:
+    def __init__(self, min_uses: int = 2, max_shapes: int = 256):
+        self.min_uses = min_uses
+        self.max_shapes = max_shapes
+        self._uses: "OrderedDict[str, int]" = OrderedDict()
+        self._unpreparable: Set[str] = set()
+        self._prepared: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._metrics = {"executions": 0, "prepared": 0, "reused": 0, "unpreparable": 0}
+
+    def _count_use(self, name: str) -> int:
+        with self._lock:
+            uses = self._uses.pop(name, 0) + 1
+            self._uses[name] = uses
+            while len(self._uses) > self.max_shapes:
+                evicted, _ = self._uses.popitem(last=False)
+                self._unpreparable.discard(evicted)
+            self._metrics["executions"] += 1
+            return uses
+
+    # Execute a parameterized query on a psycopg2 cursor, through a prepared statement once its shape recurs.
+    # The connection must be in autocommit mode so a failed PREPARE does not abort a transaction.
+    def execute(self, cursor, sql: str, params: Dict[str, Any]) -> None:
+        name = shape_name(sql)
+        uses = self._count_use(name)
+        connection_key = id(cursor.connection)
+        with self._lock:
+            prepared = name in self._prepared.get(connection_key, set())
+            preparable = params and uses >= self.min_uses and name not in self._unpreparable
+
+        if not prepared and not preparable:
+            cursor.execute(sql, params or None)
+            return
+
+        positional_sql, args = to_positional(sql, params)
+        if not prepared:
+            try:
+                cursor.execute(f"PREPARE {name} AS {positional_sql}")
+            except psycopg2.Error as e:
+                logging.debug(f"Unable to prepare {name}, running it unprepared: {str(e)}")
+                with self._lock:
+                    self._unpreparable.add(name)
+                    self._metrics["unpreparable"] += 1
+                cursor.execute(sql, params)
+                return
+            with self._lock:
+                self._prepared.setdefault(connection_key, set()).add(name)
+                self._metrics["prepared"] += 1
+        else:
+            with self._lock:
+                self._metrics["reused"] += 1
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(args))})", args)
+
+    # Drop the bookkeeping for a connection that was closed (its prepared statements went with it)
+    def forget(self, conn) -> None:
+        with self._lock:
+            self._prepared.pop(id(conn), None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._metrics,
+                "shapes": len(self._uses),
+                "connections": len(self._prepared),
+                "min_uses": self.min_uses
+            }
+
+
+# Build the prepared statement cache from SQL_PREPARE* environment variables, or return None if disabled
+def prepared_statements_from_env() -> Optional[PreparedStatements]:
+    if os.environ.get("SQL_PREPARE", "false").lower() not in ("1", "true", "yes"):
+        return None
+    return PreparedStatements(
+        min_uses=int(os.environ.get("SQL_PREPARE_MIN_USES", 2)),
+        max_shapes=int(os.environ.get("SQL_PREPARE_MAX_SHAPES", 256))
+    )
@@ -0,0 +1,112 @@
+import os
+import re
+import json
+import logging
+import threading
+
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from sql_templates import query_shape
+
+
+# Normalize a query word so "goals"/"goal" and "leaders"/"leader" compare equal
+def _stem(word: str) -> str:
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+# Every word of the expanded query, lowercased and stemmed, in its original order
+def normalize_query_text(text: str) -> str:
+    return " ".join(_stem(word) for word in re.findall(r'[a-z%]+|\d+', (text or "").lower()))
+
+# Canonical key for the analyzed data of a stats query. Entity lists are order-independent and the
+# wording is reduced to the stats, ranking and limit it asks for, so paraphrases share a plan; wording
+# that names no known stat keeps its normalized text, since nothing else tells such queries apart
+def canonical_intent(analyzed_data: Dict[str, Any]) -> str:
+    text = analyzed_data.get("expanded_query") or ""
+    shape = query_shape(text)
+    key_fields = {
+        "tables": sorted(set(analyzed_data.get("required_tables", []))),
+        "players": sorted({" ".join(str(name).lower().split()) for name in analyzed_data.get("player_names", [])}),
+        "teams": sorted({str(team).strip().upper() for team in analyzed_data.get("team_abbreviations", [])}),
+        "seasons": sorted({int(season) for season in analyzed_data.get("seasons", []) if str(season).strip().isdigit()}),
+        "situation": (analyzed_data.get("situation") or "all").lower(),
+        "shape": shape if shape["stats"] else {"query": normalize_query_text(text)}
+    }
+    return json.dumps(key_fields, sort_keys=True, ensure_ascii=False)
+
+
+# LRU map from a canonical intent to the SQL that last executed successfully for it
+class SQLPlanCache:
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.skipped = 0
+
+    # Return the cached SQL for the analyzed data, or None on a miss
+    def get(self, analyzed_data: Dict[str, Any]) -> Optional[str]:
+        key = canonical_intent(analyzed_data)
+        with self._lock:
+            sql_query = self._entries.get(key)
+            if sql_query is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        logging.debug(f"SQL plan cache hit for {key}")
+        return sql_query
+
+    # Remember the SQL of a successful execution; failed runs (including failed corrections) are not stored
+    def record_result(self, analyzed_data: Dict[str, Any], test_result: Dict[str, Any]) -> None:
+        if not test_result.get("success") or not test_result.get("executed_sql"):
+            with self._lock:
+                self.skipped += 1
+            return
+
+        key = canonical_intent(analyzed_data)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = test_result["executed_sql"]
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # Forget the SQL for an intent, for example after it stopped executing
+    def invalidate(self, analyzed_data: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._entries.pop(canonical_intent(analyzed_data), None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "skipped": self.skipped,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries
+            }
+
+
+# Build the cache from SQL_PLAN_CACHE_* environment variables, or return None if disabled
+def sql_plan_cache_from_env() -> Optional[SQLPlanCache]:
+    if os.environ.get("SQL_PLAN_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return SQLPlanCache(max_entries=int(os.environ.get("SQL_PLAN_CACHE_MAX_ENTRIES", 512)))
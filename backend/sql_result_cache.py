@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from sql_validator import tokenize
+from result_stream import row_bytes
+
+# Season values outside this range are not read as final seasons
+SEASON_RANGE = (1900, 2100)
+# Cheap stamp that changes whenever rows are loaded into any table
+DEFAULT_VERSION_QUERY = ("SELECT coalesce(sum(n_tup_ins + n_tup_upd + n_tup_del), 0)::text || ':' || count(*)::text "
+                         "FROM pg_stat_user_tables")
+
+
+# Whitespace- and case-insensitive form of a query: comments dropped, keywords and identifiers lowercased,
+# string literals and quoted identifiers kept as written
+def normalize_sql(sql: str) -> str:
+    return " ".join(text.lower() if kind == "ident" else text
+                    for kind, text in tokenize(sql.strip().rstrip(";")) if kind not in ("ws", "comment"))
+
+def make_result_key(sql: str, params: Optional[Dict[str, Any]] = None) -> str:
+    payload = json.dumps({"sql": normalize_sql(sql), "params": params or {}}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# Integer value of a number literal or a named parameter, or None
+def _int_value(token: Tuple[str, str], params: Dict[str, Any]) -> Optional[int]:
+    kind, text = token
+    if kind == "number" and text.isdigit():
+        return int(text)
+    if kind == "param" and text.startswith("%("):
+        value = params.get(text[2:-2])
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    return None
+
+# Seasons a "season <op> ..." condition starting at tokens[index] can read, and the index after it.
+# None means the condition is not a closed set of seasons (<>, !=, >, NOT IN, a subquery, an unknown value).
+def _season_condition(tokens: List[Tuple[str, str]], index: int,
+                      params: Dict[str, Any]) -> Tuple[Optional[List[int]], int]:
+    def text(position: int) -> str:
+        return tokens[position][1].lower() if position < len(tokens) else ""
+
+    operator = text(index)
+    if operator in ("=", "<=", "<") and text(index + 1) == "any" and text(index + 2) == "(":
+        # season = ANY(%(seasons)s) with a list parameter, as the SQL templates write it
+        token = tokens[index + 3] if index + 3 < len(tokens) else ("", "")
+        values = params.get(token[1][2:-2]) if token[0] == "param" and token[1].startswith("%(") else None
+        if operator != "=" or text(index + 4) != ")" or not isinstance(values, (list, tuple)) or not values:
+            return None, index
+        if not all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+            return None, index
+        return list(values), index + 5
+    if operator in ("=", "<=", "<"):
+        value = _int_value(tokens[index + 1], params) if index + 1 < len(tokens) else None
+        if value is None:
+            return None, index
+        return [value - 1 if operator == "<" else value], index + 2
+    if operator == "in" and text(index + 1) == "(":
+        values = []
+        position = index + 2
+        while position < len(tokens):
+            value = _int_value(tokens[position], params)
+            if value is None:
+                return None, index
+            values.append(value)
+            if text(position + 1) == ")":
+                return values, position + 2
+            if text(position + 1) != ",":
+                return None, index
+            position += 2
+        return None, index
+    if operator == "between" and index + 3 < len(tokens) and text(index + 2) == "and":
+        low, high = _int_value(tokens[index + 1], params), _int_value(tokens[index + 3], params)
+        if low is None or high is None:
+            return None, index
+        return [low, high], index + 4
+    return None, index
+
+# Whether a query only reads final seasons: every condition on a `season` column is =, IN, BETWEEN, <= or <
+# with literal values or parameters, at least one exists, and none names a season after `last_final_season`.
+# Anything open-ended (>, >=, <>, !=, NOT IN, a subquery, OR between conditions, a season on the right-hand
+# side) or a query without a season filter may read the current season, so its result gets the TTL instead.
+def reads_final_seasons_only(sql: str, params: Optional[Dict[str, Any]], last_final_season: int) -> bool:
+    params = params or {}
+    tokens = [(kind, text) for kind, text in tokenize(sql) if kind not in ("ws", "comment")]
+    seasons: List[int] = []
+    index = 0
+    while index < len(tokens):
+        kind, text = tokens[index]
+        name = text[1:-1] if kind == "qident" else text.lower() if kind == "ident" else None
+        if name == "or":
+            return False
+        if name != "season":
+            index += 1
+            continue
+        following = tokens[index + 1][1].lower() if index + 1 < len(tokens) else ""
+        previous = tokens[index - 1][1].lower() if index > 0 else ""
+        if previous in ("=", "<>", "!=", "<", "<=", ">", ">=", "in", "between") or following == "not":
+            return False
+        if following not in ("=", "<>", "!=", "<", "<=", ">", ">=", "in", "between"):
+            # A season in the select list, GROUP BY or ORDER BY is not a filter
+            index += 1
+            continue
+        values, index = _season_condition(tokens, index + 1, params)
+        if values is None:
+            return False
+        seasons.extend(values)
+    return bool(seasons) and all(SEASON_RANGE[0] <= season <= last_final_season for season in seasons)
+
+# Approximate memory taken by a cached result
+def result_size(result: Dict[str, Any]) -> int:
+    return (sum(row_bytes(row.values()) for row in result.get("results", []))
+            + sum(len(name) for name in result.get("column_names", [])) + 256)
+
+
+# Byte-bounded LRU of query results keyed on normalized SQL and parameters.
+# Results that only read final seasons never expire; all others expire after `current_ttl_seconds`.
+# Every entry is dropped when the data version stamp changes, such as after a season load.
+class SQLResultCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, current_ttl_seconds: float = 300,
+                 last_final_season: int = 2023, version_query: Optional[str] = DEFAULT_VERSION_QUERY,
+                 version_check_seconds: float = 60):
+        self.max_bytes = max_bytes
+        self.current_ttl_seconds = current_ttl_seconds
+        self.last_final_season = last_final_season
+        self.version_query = version_query
+        self.version_check_seconds = version_check_seconds
+
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], int, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self._version: Optional[str] = None
+        self._version_checked_at: Optional[float] = None
+        # Bumped on every invalidation, so results computed before it are not stored after it
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "misses": 0, "stores": 0, "final_season_stores": 0, "too_large": 0,
+                         "evictions": 0, "expirations": 0, "invalidations": 0, "version_checks": 0}
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    # Whether the data version stamp should be read again before the next lookup
+    def version_due(self) -> bool:
+        if not self.version_query:
+            return False
+        checked_at = self._version_checked_at
+        return checked_at is None or time.monotonic() - checked_at >= self.version_check_seconds
+
+    # Record the current data version stamp (None if it could not be read); a changed stamp drops every entry
+    def set_version(self, version: Optional[str]) -> None:
+        with self._lock:
+            self._version_checked_at = time.monotonic()
+            self._metrics["version_checks"] += 1
+            if version is None or version == self._version:
+                return
+            if self._version is not None:
+                logging.info(f"Data version changed from {self._version} to {version}, dropping cached SQL results")
+                self._clear()
+                self._metrics["invalidations"] += 1
+            self._version = version
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+        self._generation += 1
+
+    # Return a cached result, or None on a miss
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                result, size, expires_at = entry
+                if expires_at is None or time.monotonic() < expires_at:
+                    self._entries.move_to_end(key)
+                    self._metrics["hits"] += 1
+                    return dict(result)
+                self._entries.pop(key)
+                self._bytes -= size
+                self._metrics["expirations"] += 1
+            self._metrics["misses"] += 1
+        return None
+
+    # Store a successful result computed under `generation`, evicting least recently used entries over max_bytes
+    def set(self, key: str, sql: str, params: Optional[Dict[str, Any]], result: Dict[str, Any],
+            generation: int) -> None:
+        final = reads_final_seasons_only(sql, params, self.last_final_season)
+        expires_at = None if final or self.current_ttl_seconds <= 0 else time.monotonic() + self.current_ttl_seconds
+        size = result_size(result)
+        with self._lock:
+            if generation != self._generation:
+                return
+            if size > self.max_bytes:
+                self._metrics["too_large"] += 1
+                return
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (dict(result), size, expires_at)
+            self._bytes += size
+            self._metrics["stores"] += 1
+            self._metrics["final_season_stores"] += final
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._metrics["evictions"] += 1
+
+    # Drop every cached result, for example right after loading a season
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+            self._metrics["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._metrics["hits"] + self._metrics["misses"]
+            return {
+                **self._metrics,
+                "hit_rate": round(self._metrics["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "current_ttl_seconds": self.current_ttl_seconds,
+                "last_final_season": self.last_final_season,
+                "data_version": self._version
+            }
+
+
+# Build the cache from SQL_RESULT_CACHE* environment variables, or return None if disabled
+def sql_result_cache_from_env() -> Optional[SQLResultCache]:
+    if os.environ.get("SQL_RESULT_CACHE", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return SQLResultCache(
+        max_bytes=int(os.environ.get("SQL_RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+        current_ttl_seconds=float(os.environ.get("SQL_RESULT_CACHE_TTL_SECONDS", 300)),
+        last_final_season=int(os.environ.get("SQL_RESULT_CACHE_LAST_FINAL_SEASON", 2023)),
+        version_query=os.environ.get("SQL_RESULT_CACHE_VERSION_QUERY", DEFAULT_VERSION_QUERY) or None,
+        version_check_seconds=float(os.environ.get("SQL_RESULT_CACHE_VERSION_CHECK_SECONDS", 60))
+    )
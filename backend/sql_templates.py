@@ -0,0 +1,254 @@
+import re
+import logging
+import threading
+
+from typing import Dict, Any, List, Optional, Tuple
+
+# Stat words mapped to the SQL expression and result column used by the player templates
+PLAYER_STATS = [
+    (r'\bpoints?\b', "i_f_points", "points"),
+    (r'\bassists?\b', "(i_f_primaryassists + i_f_secondaryassists)", "assists"),
+    (r'\bexpected goals\b|\bxg\b|\bxgoals\b', "i_f_xgoals", "expected_goals"),
+    (r'\bgoals?\b|\bscor(ed|er|ers|ing)\b', "i_f_goals", "goals"),
+    (r'\bshots?\b', "i_f_shotsongoal", "shots"),
+    (r'\bhits?\b', "i_f_hits", "hits"),
+    (r'\btakeaways?\b', "i_f_takeaways", "takeaways"),
+    (r'\bgiveaways?\b', "i_f_giveaways", "giveaways"),
+    (r'\bblock(ed|s)?\b', "shotsblockedbyplayer", "blocked_shots"),
+    (r'\bpenalty minutes\b|\bpims?\b', "penalityminutes", "penalty_minutes"),
+    (r'\bfaceoffs?\b', "faceoffswon", "faceoffs_won")
+]
+
+LEADERBOARD_PATTERN = re.compile(r'\b(most|top|leaders?|leading|led|best|highest|lead)\b', re.IGNORECASE)
+SAVE_PATTERN = re.compile(r'\b(save percentage|save %|save pct|sv%|sv %|saves?)\b', re.IGNORECASE)
+RECORD_PATTERN = re.compile(r'\b(record|wins?|won|losses|lost|standings?)\b', re.IGNORECASE)
+TOP_N_PATTERN = re.compile(r'\btop\s+(\d{1,2})\b', re.IGNORECASE)
+LOWEST_PATTERN = re.compile(r'\b(least|fewest|lowest|worst|bottom)\b', re.IGNORECASE)
+RATE_PATTERN = re.compile(r'\b(per (game|60|minute)|averages?|avg|rate)\b', re.IGNORECASE)
+
+PLAYER_TABLES = ("player_stats_regular_season", "player_stats_playoffs")
+GOALIE_TABLES = ("goalie_stats_regular_season", "goalie_stats_playoffs")
+TEAM_TABLES = ("team_stats", "team_stats_playoffs", "team_games")
+
+# Minimum shots faced before a goalie appears in a save percentage leaderboard
+MIN_GOALIE_SHOTS = 300
+# Rows returned by leaderboards unless the query asks for a "top N"
+DEFAULT_LEADERBOARD_LIMIT = 10
+# The SQL prompt caps results at 50 rows; templates do the same
+MAX_ROWS = 50
+
+template_metrics = {"matched": {}, "succeeded": {}, "empty": {}, "failed": {}, "no_match": 0}
+template_lock = threading.Lock()
+
+
+def _count(counter: str, template: Optional[str] = None) -> None:
+    with template_lock:
+        if template is None:
+            template_metrics[counter] += 1
+        else:
+            template_metrics[counter][template] = template_metrics[counter].get(template, 0) + 1
+
+# Record whether the SQL of a matched template ran successfully, and whether it returned any rows
+def record_template_result(template: str, success: bool, empty: bool = False) -> None:
+    _count("failed" if not success else "empty" if empty else "succeeded", template)
+
+def get_template_stats() -> Dict[str, Any]:
+    with template_lock:
+        matched = sum(template_metrics["matched"].values())
+        total = matched + template_metrics["no_match"]
+        return {
+            "matched": dict(template_metrics["matched"]),
+            "succeeded": dict(template_metrics["succeeded"]),
+            "empty": dict(template_metrics["empty"]),
+            "failed": dict(template_metrics["failed"]),
+            "no_match": template_metrics["no_match"],
+            "match_rate": round(matched / total, 4) if total else 0.0
+        }
+
+# Every stat named in the query text, as (expression, label) pairs in PLAYER_STATS order
+def _named_stats(text: str) -> List[Tuple[str, str]]:
+    found = []
+    remaining = text
+    for pattern, expression, label in PLAYER_STATS:
+        if re.search(pattern, remaining, re.IGNORECASE):
+            found.append((expression, label))
+            # "expected goals" should not also count as "goals"
+            remaining = re.sub(pattern, " ", remaining, flags=re.IGNORECASE)
+    return found
+
+# Return the single stat named in the query text, or None when there are none or several
+def _requested_stat(text: str) -> Optional[Tuple[str, str]]:
+    found = _named_stats(text)
+    return found[0] if len(found) == 1 else None
+
+# The stats, ranking and row limit a query asks for, read the same way the templates read them;
+# "stats" is empty when the wording names no stat the templates know
+def query_shape(text: str) -> Dict[str, Any]:
+    stats = {label for _, label in _named_stats(text)}
+    if SAVE_PATTERN.search(text):
+        stats.add("save_percentage")
+    if RECORD_PATTERN.search(text):
+        stats.add("record")
+    order = "asc" if LOWEST_PATTERN.search(text) else "desc" if LEADERBOARD_PATTERN.search(text) else None
+    return {
+        "stats": sorted(stats),
+        "order": order,
+        "limit": _limit(text) if order else None,
+        "rate": bool(RATE_PATTERN.search(text))
+    }
+
+# Filters shared by every template: seasons and situation as parameters
+def _common_filters(analyzed_data: Dict[str, Any], params: Dict[str, Any], situation: bool = True) -> List[str]:
+    filters = []
+    if situation:
+        filters.append("situation = %(situation)s")
+        params["situation"] = analyzed_data.get("situation") or "all"
+    if analyzed_data.get("seasons"):
+        filters.append("season = ANY(%(seasons)s)")
+        params["seasons"] = [int(season) for season in analyzed_data["seasons"]]
+    return filters
+
+# Names compared against lower(name), so "connor mcdavid" finds "Connor McDavid"
+def _lowered(names: List[Any]) -> List[str]:
+    return [" ".join(str(name).split()).lower() for name in names]
+
+def _single_table(analyzed_data: Dict[str, Any], candidates: Tuple[str, ...]) -> Optional[str]:
+    tables = [table for table in analyzed_data.get("required_tables", []) if table in candidates]
+    return tables[0] if len(tables) == 1 and len(analyzed_data["required_tables"]) == 1 else None
+
+def _limit(text: str) -> int:
+    match = TOP_N_PATTERN.search(text)
+    return min(int(match.group(1)), MAX_ROWS) if match else DEFAULT_LEADERBOARD_LIMIT
+
+# Season-by-season totals for named players, with the requested stat included when it is not a default column
+def player_season_totals(analyzed_data: Dict[str, Any], text: str) -> Optional[Dict[str, Any]]:
+    table = _single_table(analyzed_data, PLAYER_TABLES)
+    if table is None or not analyzed_data.get("player_names") or LEADERBOARD_PATTERN.search(text):
+        return None
+
+    columns = ["name", "team", "season", "games_played", "i_f_goals AS goals",
+               "(i_f_primaryassists + i_f_secondaryassists) AS assists", "i_f_points AS points",
+               "i_f_shotsongoal AS shots", "ROUND(icetime / 60.0, 1) AS icetime_minutes"]
+    stat = _requested_stat(text)
+    if stat is not None and stat[1] not in ("goals", "assists", "points", "shots"):
+        columns.append(f"{stat[0]} AS {stat[1]}")
+
+    params = {"player_names": _lowered(analyzed_data["player_names"])}
+    filters = _common_filters(analyzed_data, params) + ["lower(name) = ANY(%(player_names)s)"]
+    sql = (f"SELECT {', '.join(columns)} FROM {table} WHERE {' AND '.join(filters)} "
+           f"ORDER BY name, season LIMIT {MAX_ROWS}")
+    return {"sql": sql, "params": params}
+
+# League leaders for one stat, optionally limited to teams and seasons
+def player_leaderboard(analyzed_data: Dict[str, Any], text: str) -> Optional[Dict[str, Any]]:
+    table = _single_table(analyzed_data, PLAYER_TABLES)
+    if table is None or analyzed_data.get("player_names") or not LEADERBOARD_PATTERN.search(text):
+        return None
+    stat = _requested_stat(text)
+    if stat is None:
+        return None
+
+    expression, label = stat
+    params = {"limit": _limit(text)}
+    filters = _common_filters(analyzed_data, params)
+    if analyzed_data.get("team_abbreviations"):
+        filters.append("team = ANY(%(teams)s)")
+        params["teams"] = list(analyzed_data["team_abbreviations"])
+    sql = (f"SELECT name, team, season, games_played, {expression} AS {label} FROM {table} "
+           f"WHERE {' AND '.join(filters)} ORDER BY {label} DESC LIMIT %(limit)s")
+    return {"sql": sql, "params": params}
+
+# Save percentage per season for named goalies, or the league leaders when no goalie is named
+def goalie_save_percentage(analyzed_data: Dict[str, Any], text: str) -> Optional[Dict[str, Any]]:
+    table = _single_table(analyzed_data, GOALIE_TABLES)
+    if table is None or not SAVE_PATTERN.search(text):
+        return None
+
+    columns = ("name, team, season, games_played, ongoal AS shots_against, goals AS goals_against, "
+               "ROUND(1 - goals::numeric / NULLIF(ongoal, 0), 3) AS save_percentage")
+    params: Dict[str, Any] = {}
+    filters = _common_filters(analyzed_data, params)
+    if analyzed_data.get("player_names"):
+        filters.append("lower(name) = ANY(%(player_names)s)")
+        params["player_names"] = _lowered(analyzed_data["player_names"])
+        order = f"ORDER BY name, season LIMIT {MAX_ROWS}"
+    elif LEADERBOARD_PATTERN.search(text):
+        filters.append("ongoal >= %(min_shots)s")
+        params["min_shots"] = MIN_GOALIE_SHOTS
+        params["limit"] = _limit(text)
+        order = "ORDER BY save_percentage DESC LIMIT %(limit)s"
+    else:
+        return None
+
+    sql = f"SELECT {columns} FROM {table} WHERE {' AND '.join(filters)} {order}"
+    return {"sql": sql, "params": params}
+
+# Wins, losses and ties (games level on goals) per season for named teams, counted from game results in all situations
+def team_record(analyzed_data: Dict[str, Any], text: str) -> Optional[Dict[str, Any]]:
+    table = _single_table(analyzed_data, TEAM_TABLES)
+    if (table is None or not analyzed_data.get("team_abbreviations") or analyzed_data.get("player_names")
+            or not RECORD_PATTERN.search(text)):
+        return None
+
+    params = {"teams": list(analyzed_data["team_abbreviations"]),
+              "playoff_game": 1 if table == "team_stats_playoffs" or re.search(r'\bplayoffs?\b', text, re.IGNORECASE) else 0}
+    # A game's record always comes from the full-game score, whatever situation the query names
+    filters = ["situation = 'all'", "team = ANY(%(teams)s)", "playoffgame = %(playoff_game)s"]
+    filters += _common_filters(analyzed_data, params, situation=False)
+    sql = ("SELECT team, season, COUNT(*) AS games_played, "
+           "SUM(CASE WHEN goalsfor > goalsagainst THEN 1 ELSE 0 END) AS wins, "
+           "SUM(CASE WHEN goalsfor < goalsagainst THEN 1 ELSE 0 END) AS losses, "
+           "SUM(CASE WHEN goalsfor = goalsagainst THEN 1 ELSE 0 END) AS ties, "
+           "SUM(goalsfor) AS goals_for, SUM(goalsagainst) AS goals_against "
+           f"FROM team_games WHERE {' AND '.join(filters)} "
+           f"GROUP BY team, season ORDER BY team, season LIMIT {MAX_ROWS}")
+    return {"sql": sql, "params": params}
+
+# Templates in the order they are tried; the first match wins
+TEMPLATES = [
+    ("goalie_save_percentage", goalie_save_percentage),
+    ("team_record", team_record),
+    ("player_leaderboard", player_leaderboard),
+    ("player_season_totals", player_season_totals)
+]
+
+# Build parameterized SQL for the analyzed query from the first matching template, or None to use the LLM
+def build_template_sql(analyzed_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not analyzed_data.get("hockey_related") or analyzed_data.get("query_intent") != "stats":
+        return None
+
+    text = analyzed_data.get("expanded_query") or ""
+    for name, template in TEMPLATES:
+        plan = template(analyzed_data, text)
+        if plan is not None:
+            _count("matched", name)
+            logging.debug(f"SQL template {name} matched: {plan['sql']} {plan['params']}")
+            return {"template": name, **plan}
+
+    _count("no_match")
+    return None
+
+# Convert %(name)s placeholders into asyncpg's $n placeholders and a positional argument list
+def to_positional(sql: str, params: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    names: List[str] = []
+
+    def placeholder(match: re.Match) -> str:
+        name = match.group(1)
+        if name is None:
+            return "%"
+        if name not in names:
+            names.append(name)
+        return f"${names.index(name) + 1}"
+
+    return re.sub(r'%\((\w+)\)s|%%', placeholder, sql), [params[name] for name in names]
+
+# Readable SQL with the parameters inlined, for prompts and API responses only (never executed)
+def display_sql(sql: str, params: Dict[str, Any]) -> str:
+    def literal(value: Any) -> str:
+        if isinstance(value, (list, tuple)):
+            return "ARRAY[" + ", ".join(literal(item) for item in value) + "]"
+        if isinstance(value, (int, float)):
+            return str(value)
+        return "'" + str(value).replace("'", "''") + "'"
+
+    return re.sub(r'%\((\w+)\)s|%%', lambda match: literal(params[match.group(1)]) if match.group(1) else "%", sql)
@@ -0,0 +1,571 @@
+import os
+import re
+import logging
+import threading
+
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from simplified_hockey_stats_schema import simplified_hockey_stats_schema
+
+# One SQL token: (kind, text). Kinds: ws, comment, string, param, number, ident, qident (quoted identifier), op
+TOKEN_PATTERN = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<param>%\(\w+\)s|%s|\$\d+)
+  | (?P<qident>"(?:[^"]|"")+")
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][-+]?\d+)?|\.\d+)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<op>::|<>|!=|<=|>=|\|\||.)
+""", re.VERBOSE | re.DOTALL)
+
+KEYWORDS = {
+    "select", "from", "where", "and", "or", "not", "in", "is", "null", "as", "on", "join", "left", "right",
+    "inner", "outer", "full", "cross", "natural", "lateral", "using", "group", "by", "order", "having", "limit",
+    "offset", "fetch", "next", "first", "last", "nulls", "only", "rows", "row", "asc", "desc", "distinct", "all",
+    "case", "when", "then", "else", "end", "with", "recursive", "materialized", "union", "intersect", "except",
+    "between", "symmetric", "like", "ilike", "similar", "escape", "true", "false", "unknown", "any", "some",
+    "exists", "over", "partition", "range", "groups", "preceding", "following", "unbounded", "current",
+    "window", "filter", "within", "interval", "year", "month", "day", "hour", "minute", "second", "epoch",
+    "date", "time", "timestamp", "numeric", "decimal", "integer", "int", "bigint", "smallint", "real", "float",
+    "double", "precision", "text", "varchar", "char", "character", "varying", "boolean", "bool", "at", "zone",
+    "array", "values", "default", "collate", "isnull", "notnull", "ties", "percent"
+}
+
+# Functions that make a SELECT an aggregate query
+AGGREGATES = {"sum", "avg", "count", "min", "max", "array_agg", "string_agg", "bool_and", "bool_or",
+              "stddev", "stddev_pop", "stddev_samp", "variance", "var_pop", "var_samp", "percentile_cont",
+              "percentile_disc", "mode", "every", "json_agg", "jsonb_agg", "corr", "covar_pop", "covar_samp"}
+
+# Words that end a select list, GROUP BY list or FROM item at the same nesting level
+CLAUSE_ENDS = {"from", "where", "group", "having", "order", "limit", "offset", "fetch", "window",
+               "union", "intersect", "except", "on", "using", "join", "left", "right", "inner", "outer",
+               "full", "cross", "natural", "lateral", "for"}
+
+# Names models commonly invent for real columns, rewritten to the expression the schema supports.
+# {q} is the table qualifier ("p.") when the invented column was qualified.
+COLUMN_ALIASES = {
+    "player": {
+        "i_f_assists": "({q}i_f_primaryassists + {q}i_f_secondaryassists)",
+        "assists": "({q}i_f_primaryassists + {q}i_f_secondaryassists)",
+        "i_f_penaltyminutes": "{q}i_f_penalityminutes",
+        "penalty_minutes": "{q}i_f_penalityminutes",
+        "goals": "{q}i_f_goals",
+        "points": "{q}i_f_points",
+        "shots": "{q}i_f_shotsongoal",
+        "shots_on_goal": "{q}i_f_shotsongoal",
+        "hits": "{q}i_f_hits",
+        "player_name": "{q}name",
+        "toi": "{q}icetime",
+        "time_on_ice": "{q}icetime",
+        "gp": "{q}games_played"
+    },
+    "goalie": {
+        "goals_against": "{q}goals",
+        "shots_against": "{q}ongoal",
+        "saves": "({q}ongoal - {q}goals)",
+        "goalie_name": "{q}name",
+        "player_name": "{q}name",
+        "gp": "{q}games_played"
+    },
+    "team": {
+        "goals_for": "{q}goalsfor",
+        "goals_against": "{q}goalsagainst",
+        "team_name": "{q}team",
+        "gp": "{q}games_played"
+    }
+}
+
+
+# Lower-case column names per table, as Postgres stores unquoted identifiers.
+# Every table also carries the situation column the SQL prompt filters on.
+def schema_catalog() -> Dict[str, Set[str]]:
+    return {table: {column.lower() for column in columns} | {"situation"}
+            for table, columns in simplified_hockey_stats_schema.items()}
+
+# Introspect tables, views and materialized views of the public schema from the database
+def load_database_catalog(conn) -> Dict[str, Set[str]]:
+    catalog: Dict[str, Set[str]] = {}
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, a.attname FROM pg_attribute a "
+            "JOIN pg_class c ON c.oid = a.attrelid JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = 'public' AND c.relkind IN ('r', 'v', 'm', 'p') AND a.attnum > 0 AND NOT a.attisdropped"
+        )
+        for table, column in cursor.fetchall():
+            catalog.setdefault(table, set()).add(column)
+    return catalog
+
+def tokenize(sql: str) -> List[Tuple[str, str]]:
+    return [(match.lastgroup, match.group()) for match in TOKEN_PATTERN.finditer(sql)]
+
+def _name(token: Tuple[str, str]) -> str:
+    kind, text = token
+    return text[1:-1].replace('""', '"') if kind == "qident" else text.lower()
+
+def _is_name(token: Tuple[str, str]) -> bool:
+    return token[0] == "qident" or (token[0] == "ident" and token[1].lower() not in KEYWORDS)
+
+# Levenshtein distance, used to find the intended column for a misspelled one
+def edit_distance(a: str, b: str) -> int:
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+def _table_group(table: str) -> Optional[str]:
+    for group in ("player", "goalie", "team"):
+        if table.startswith(group):
+            return group
+    return None
+
+
+# Token stream with the tables, aliases and nesting of one statement
+class _Statement:
+    def __init__(self, sql: str):
+        self.tokens = tokenize(sql)
+        # Indexes of significant tokens (no whitespace or comments)
+        self.sig = [index for index, (kind, _) in enumerate(self.tokens) if kind not in ("ws", "comment")]
+        self.depth: Dict[int, int] = {}
+        self.paren_kind: Dict[int, str] = {}
+        self.tables: Dict[str, str] = {}      # alias or name -> real table
+        self.table_tokens: Set[int] = set()
+        self.opaque: Set[str] = set()         # CTE names, subquery and function aliases
+        self.aliases: Set[str] = set()        # output column names declared in the statement
+        self.alias_tokens: Set[int] = set()
+        self._scan()
+
+    def tok(self, position: int) -> Tuple[str, str]:
+        if 0 <= position < len(self.sig):
+            return self.tokens[self.sig[position]]
+        return ("eof", "")
+
+    def word(self, position: int) -> str:
+        kind, text = self.tok(position)
+        return text.lower() if kind == "ident" else ("" if kind != "op" else text)
+
+    # Record nesting depth and whether each parenthesis holds a subquery or an expression
+    def _scan_parens(self) -> None:
+        stack: List[str] = []
+        for position, index in enumerate(self.sig):
+            text = self.tokens[index][1]
+            if text == "(":
+                stack.append("sub" if self.word(position + 1) in ("select", "with", "values") else "expr")
+            self.depth[index] = len(stack)
+            self.paren_kind[index] = stack[-1] if stack else "top"
+            if text == ")" and stack:
+                stack.pop()
+
+    def _scan(self) -> None:
+        self._scan_parens()
+        count = len(self.sig)
+        position = 0
+        while position < count:
+            word = self.word(position)
+            index = self.sig[position]
+
+            # WITH name [(columns)] AS (...)
+            if word in ("with", "recursive") or (word == "," and self._in_with_list(position)):
+                name_position = position + 1
+                if self.word(name_position) == "recursive":
+                    name_position += 1
+                if _is_name(self.tok(name_position)) and self.word(name_position + 1) in ("as", "("):
+                    self.opaque.add(_name(self.tok(name_position)))
+                    self.alias_tokens.add(self.sig[name_position])
+                    if self.word(name_position + 1) == "(":
+                        self._declare_column_list(name_position + 1)
+
+            elif word in ("from", "join") and self.paren_kind.get(index) != "expr":
+                self._scan_from_items(position + 1, self.depth[index])
+
+            elif word == "as" and _is_name(self.tok(position + 1)):
+                self.aliases.add(_name(self.tok(position + 1)))
+                self.alias_tokens.add(self.sig[position + 1])
+                if self.word(position + 2) == "(" and self.word(position + 3) != "select":
+                    self._declare_column_list(position + 2)
+
+            elif _is_name(self.tok(position)) and self._is_implicit_alias(position):
+                self.aliases.add(_name(self.tok(position)))
+                self.alias_tokens.add(index)
+            position += 1
+
+    def _in_with_list(self, position: int) -> bool:
+        # A comma directly after a CTE body's closing parenthesis at depth zero
+        return self.word(position - 1) == ")" and self.depth.get(self.sig[position], 0) == 0 and \
+            self.word(position + 2) == "as" and any(self.word(p) == "with" for p in range(position))
+
+    def _declare_column_list(self, open_position: int) -> None:
+        position = open_position + 1
+        while position < len(self.sig) and self.word(position) != ")":
+            if _is_name(self.tok(position)):
+                self.aliases.add(_name(self.tok(position)))
+                self.alias_tokens.add(self.sig[position])
+            position += 1
+
+    # "expr alias" without AS: a name directly after a value inside a select list
+    def _is_implicit_alias(self, position: int) -> bool:
+        previous_kind, previous_text = self.tok(position - 1)
+        if previous_text == ")" or previous_kind in ("number", "string", "param"):
+            return self.word(position + 1) in (",", ")", "from", "")
+        if previous_kind in ("ident", "qident") and _is_name(self.tok(position - 1)):
+            return self.word(position - 2) not in (".", "as") and self.word(position + 1) in (",", "from", "") \
+                and self.sig[position - 1] not in self.table_tokens
+        return False
+
+    # Collect "table [AS] alias" items (and subqueries or functions, which are opaque) after FROM/JOIN
+    def _scan_from_items(self, position: int, depth: int) -> None:
+        while position < len(self.sig):
+            kind, text = self.tok(position)
+            if text == "(":
+                # Subquery or table function: skip to its closing parenthesis and record its alias as opaque
+                position = self._skip_parens(position)
+                alias_position = position + 1 + (self.word(position + 1) == "as")
+                if _is_name(self.tok(alias_position)):
+                    self.opaque.add(_name(self.tok(alias_position)))
+                    self.alias_tokens.add(self.sig[alias_position])
+                    if self.word(alias_position + 1) == "(":
+                        self._declare_column_list(alias_position + 1)
+                    position = alias_position
+            elif self.word(position) == "lateral":
+                pass
+            elif _is_name(self.tok(position)):
+                name_position = position
+                if self.word(position + 1) == "." and _is_name(self.tok(position + 2)):
+                    # schema.table
+                    self.table_tokens.add(self.sig[position])
+                    name_position = position + 2
+                if self.word(name_position + 1) == "(":
+                    position = self._skip_parens(name_position + 1)
+                    self.opaque.add(_name(self.tok(name_position)))
+                    continue
+                table = _name(self.tok(name_position))
+                self.table_tokens.add(self.sig[name_position])
+                self.tables[table] = table
+                position = name_position
+                alias_position = position + 1 + (self.word(position + 1) == "as")
+                if _is_name(self.tok(alias_position)) and self.word(alias_position) not in CLAUSE_ENDS:
+                    self.tables[_name(self.tok(alias_position))] = table
+                    self.alias_tokens.add(self.sig[alias_position])
+                    position = alias_position
+            else:
+                return
+
+            # Continue only through a comma-separated FROM list at the same depth
+            if self.word(position + 1) == "," and self.depth.get(self.sig[position + 1]) == depth:
+                position += 2
+                continue
+            return
+
+    def _skip_parens(self, open_position: int) -> int:
+        level = 0
+        position = open_position
+        while position < len(self.sig):
+            text = self.tok(position)[1]
+            level += (text == "(") - (text == ")")
+            if level == 0:
+                return position
+            position += 1
+        return position
+
+    def text(self) -> str:
+        return "".join(text for _, text in self.tokens)
+
+
+# Resolves every identifier of a generated query against the catalog, fixing what it can locally
+class SQLValidator:
+    def __init__(self, catalog: Optional[Dict[str, Set[str]]] = None, max_edit_distance: int = 2):
+        self.catalog = catalog or schema_catalog()
+        self.max_edit_distance = max_edit_distance
+        self._lock = threading.Lock()
+        self._metrics = {"validated": 0, "clean": 0, "auto_fixed": 0, "unresolved": 0, "skipped": 0, "fixes": {}}
+
+    def set_catalog(self, catalog: Dict[str, Set[str]]) -> None:
+        self.catalog = catalog
+
+    def _record(self, fixes: List[Dict[str, str]], errors: List[str]) -> None:
+        with self._lock:
+            self._metrics["validated"] += 1
+            if errors:
+                self._metrics["unresolved"] += 1
+            elif fixes:
+                self._metrics["auto_fixed"] += 1
+            else:
+                self._metrics["clean"] += 1
+            for fix in fixes:
+                self._metrics["fixes"][fix["kind"]] = self._metrics["fixes"].get(fix["kind"], 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            validated = self._metrics["validated"]
+            return {
+                **self._metrics,
+                "fixes": dict(self._metrics["fixes"]),
+                "unresolved_rate": round(self._metrics["unresolved"] / validated, 4) if validated else 0.0,
+                "catalog_tables": len(self.catalog)
+            }
+
+    # Pick the column a name missing from the catalog most likely meant: case and underscores first,
+    # then a unique nearest match. Nothing is picked when two candidates fit equally well.
+    def _nearest(self, name: str, candidates: Set[str]) -> Tuple[Optional[str], str, List[str]]:
+        lowered = name.lower()
+        if lowered in candidates:
+            return lowered, "case", []
+        squashed = sorted(candidate for candidate in candidates if candidate.replace("_", "") == lowered.replace("_", ""))
+        if len(squashed) == 1:
+            return squashed[0], "underscore", []
+        if squashed:
+            return None, "", squashed
+
+        scored = sorted((edit_distance(lowered, candidate), candidate) for candidate in candidates)
+        closest = [candidate for _, candidate in scored[:3]]
+        if scored and len(lowered) >= 5:
+            best_distance, best = scored[0]
+            unique = len(scored) == 1 or scored[1][0] > best_distance
+            if best_distance <= self.max_edit_distance and unique:
+                return best, "edit_distance", closest
+        return None, "", closest
+
+    def _alias_expression(self, name: str, tables: List[str], qualifier: str) -> Optional[str]:
+        for table in tables:
+            group = _table_group(table)
+            expression = COLUMN_ALIASES.get(group, {}).get(name.lower())
+            if expression is None:
+                continue
+            columns = re.findall(r'\{q\}(\w+)', expression)
+            if all(column in self.catalog.get(table, set()) for column in columns):
+                return expression.format(q=f"{qualifier}." if qualifier else "")
+        return None
+
+    # Resolve table names, fixing case or near-miss spellings of catalog tables
+    def _check_tables(self, statement: _Statement, fixes: List[Dict[str, str]], errors: List[str]) -> None:
+        known_tables = set(self.catalog)
+        for index in sorted(statement.table_tokens):
+            token = statement.tokens[index]
+            name = _name(token)
+            if name in known_tables or name in statement.opaque or name == "public":
+                continue
+            fixed, kind, closest = self._nearest(name, known_tables)
+            if fixed is None:
+                errors.append(f'relation "{name}" does not exist; available tables include: {", ".join(closest)}')
+                continue
+            statement.tokens[index] = ("ident", fixed)
+            fixes.append({"kind": f"table_{kind}", "from": token[1], "to": fixed})
+            for alias, table in list(statement.tables.items()):
+                if table == name:
+                    statement.tables[alias] = fixed
+
+    # Resolve every column reference of the statement
+    def _check_columns(self, statement: _Statement, fixes: List[Dict[str, str]], errors: List[str]) -> None:
+        real_tables = sorted({table for table in statement.tables.values() if table in self.catalog})
+        all_columns = set().union(*(self.catalog[table] for table in real_tables)) if real_tables else set()
+        has_opaque = bool(statement.opaque) or any(table not in self.catalog for table in statement.tables.values())
+        select_items = self._bare_select_items(statement)
+
+        for position, index in enumerate(statement.sig):
+            token = statement.tokens[index]
+            if not _is_name(token) or index in statement.table_tokens or index in statement.alias_tokens:
+                continue
+            following = statement.word(position + 1)
+            preceding = statement.word(position - 1)
+            if following in ("(", ".") or preceding in ("::", "as"):
+                continue
+            name = _name(token)
+
+            qualifier = ""
+            if preceding == ".":
+                qualifier = _name(statement.tok(position - 2))
+                table = statement.tables.get(qualifier)
+                if table is None or table not in self.catalog:
+                    continue
+                candidates = self.catalog[table]
+                scope = [table]
+            else:
+                if name in statement.aliases or name in statement.tables or name in statement.opaque:
+                    continue
+                candidates = all_columns
+                scope = real_tables
+
+            # Only identifiers missing from the catalog are rewritten; a quoted name that exists is left as written
+            if name in candidates:
+                continue
+            if not candidates:
+                continue
+
+            expression = self._alias_expression(name, scope, statement.tok(position - 2)[1] if qualifier else "")
+            if expression is not None and name not in candidates:
+                if qualifier:
+                    statement.tokens[statement.sig[position - 2]] = ("op", "")
+                    statement.tokens[statement.sig[position - 1]] = ("op", "")
+                # A whole select item keeps its name as the result column label
+                if position in select_items:
+                    expression = f"{expression} AS {token[1]}"
+                statement.tokens[index] = ("op", expression)
+                fixes.append({"kind": "alias", "from": token[1], "to": expression})
+                continue
+
+            fixed, kind, closest = self._nearest(name, candidates)
+            if fixed is not None:
+                statement.tokens[index] = ("ident", fixed)
+                fixes.append({"kind": kind, "from": token[1], "to": fixed})
+            elif qualifier or not has_opaque:
+                where = f"table {scope[0]}" if len(scope) == 1 else f"tables {', '.join(scope)}"
+                errors.append(f'column "{name}" does not exist in {where}; closest columns: {", ".join(closest)}')
+
+    # Positions of the column names that make up a whole select item on their own ("name" or "t.name", no alias)
+    def _bare_select_items(self, statement: _Statement) -> Set[int]:
+        positions: Set[int] = set()
+        for position, index in enumerate(statement.sig):
+            if statement.word(position) != "select":
+                continue
+            depth = statement.depth[index]
+            start = position + 1 + (statement.word(position + 1) in ("distinct", "all"))
+            end = self._clause_end(statement, start, depth, CLAUSE_ENDS)
+            for item in self._items(statement, start, end, depth):
+                words = [statement.tok(p) for p in item]
+                if len(words) == 1 and _is_name(words[0]):
+                    positions.add(item[0])
+                elif len(words) == 3 and words[1][1] == "." and _is_name(words[0]) and _is_name(words[2]):
+                    positions.add(item[2])
+        return positions
+
+    # Split a token range into comma-separated items at the given depth
+    def _items(self, statement: _Statement, start: int, end: int, depth: int) -> List[List[int]]:
+        items, current = [], []
+        for position in range(start, end):
+            if statement.word(position) == "," and statement.depth[statement.sig[position]] == depth:
+                items.append(current)
+                current = []
+            else:
+                current.append(position)
+        if current:
+            items.append(current)
+        return items
+
+    # Position of the first clause word in `ends` at this depth, or of the parenthesis closing the subquery
+    def _clause_end(self, statement: _Statement, start: int, depth: int, ends: Set[str]) -> int:
+        position = start
+        while position < len(statement.sig):
+            index = statement.sig[position]
+            word = statement.word(position)
+            # Parentheses share their contents' depth, so the only ")" at this depth closes the subquery
+            if statement.depth[index] < depth or (statement.depth[index] == depth and (word in ends or word in (")", ";"))):
+                return position
+            position += 1
+        return position
+
+    # Bare column references of a select item, or None if the item is an expression
+    def _bare_column(self, statement: _Statement, item: List[int]) -> Optional[str]:
+        words = [statement.tok(position) for position in item]
+        # Drop a trailing alias ("col AS x" or "col x")
+        if len(words) >= 3 and words[-2][1].lower() == "as":
+            words = words[:-2]
+        elif len(words) == 2 and all(_is_name(word) for word in words):
+            words = words[:1]
+        if len(words) == 1 and _is_name(words[0]):
+            return words[0][1]
+        if len(words) == 3 and words[1][1] == "." and _is_name(words[0]) and _is_name(words[2]):
+            return "".join(text for _, text in words)
+        return None
+
+    # Add non-aggregated select columns missing from GROUP BY (or a GROUP BY when aggregates need one)
+    def _check_group_by(self, statement: _Statement, fixes: List[Dict[str, str]]) -> None:
+        insertions: List[Tuple[int, str]] = []
+        for position, index in enumerate(statement.sig):
+            if statement.word(position) != "select":
+                continue
+            depth = statement.depth[index]
+            start = position + 1
+            if statement.word(start) == "distinct":
+                continue
+            end = self._clause_end(statement, start, depth, {"from"})
+            # Scalar subqueries in the select list have their own aggregation
+            select_positions = []
+            p = start
+            while p < end:
+                if statement.word(p) == "(" and statement.word(p + 1) in ("select", "with"):
+                    p = statement._skip_parens(p) + 1
+                    continue
+                select_positions.append(p)
+                p += 1
+            select_words = [statement.word(p) for p in select_positions]
+            if "over" in select_words or "*" in select_words:
+                continue
+            has_aggregate = any(word in AGGREGATES and statement.word(p + 1) == "("
+                                for p, word in zip(select_positions, select_words))
+            if not has_aggregate:
+                continue
+
+            columns = [column for column in (self._bare_column(statement, item)
+                                             for item in self._items(statement, start, end, depth)) if column]
+            if not columns:
+                continue
+
+            group_position = None
+            tail = self._clause_end(statement, end, depth, {"group", "having", "order", "limit", "offset",
+                                                            "fetch", "window", "union", "intersect", "except"})
+            if statement.word(tail) == "group" and statement.word(tail + 1) == "by":
+                group_position = tail
+            if group_position is None:
+                missing = columns
+                insert_at = tail
+                text = f" GROUP BY {', '.join(missing)}"
+            else:
+                group_end = self._clause_end(statement, group_position + 2, depth,
+                                             {"having", "order", "limit", "offset", "fetch", "window",
+                                              "union", "intersect", "except"})
+                grouped_items = self._items(statement, group_position + 2, group_end, depth)
+                grouped = {"".join(statement.tok(p)[1] for p in item).lower() for item in grouped_items}
+                if any(statement.tok(item[0])[0] == "number" for item in grouped_items if item):
+                    continue
+                grouped |= {entry.split(".")[-1] for entry in grouped}
+                missing = [column for column in columns
+                           if column.lower() not in grouped and column.lower().split(".")[-1] not in grouped]
+                if not missing:
+                    continue
+                insert_at = group_end
+                text = f", {', '.join(missing)}"
+            insertions.append((insert_at, text))
+            fixes.append({"kind": "group_by", "from": "", "to": ", ".join(missing)})
+
+        # Append each insertion to the last token of the clause it extends
+        for insert_at, text in sorted(insertions, reverse=True):
+            index = statement.sig[insert_at - 1]
+            statement.tokens[index] = ("op", statement.tokens[index][1] + text)
+
+    # Validate one query; returns the (possibly fixed) SQL, the fixes applied and the errors left for the LLM
+    def validate(self, sql: str) -> Dict[str, Any]:
+        fixes: List[Dict[str, str]] = []
+        errors: List[str] = []
+        try:
+            statement = _Statement(sql)
+            self._check_tables(statement, fixes, errors)
+            self._check_columns(statement, fixes, errors)
+            fixed_sql = statement.text()
+            # GROUP BY completeness is checked on the repaired columns
+            statement = _Statement(fixed_sql)
+            self._check_group_by(statement, fixes)
+            fixed_sql = statement.text()
+        except (IndexError, KeyError, ValueError) as e:
+            # SQL too malformed to scan (unbalanced parentheses, a truncated statement) is left to Postgres,
+            # which reports the error to the correction stage; anything else is a validator bug and is raised
+            logging.warning(f"SQL validation skipped, the query could not be scanned: {type(e).__name__}: {str(e)}")
+            with self._lock:
+                self._metrics["skipped"] += 1
+            return {"sql": sql, "fixes": [], "errors": []}
+
+        self._record(fixes, errors)
+        if fixes:
+            logging.debug(f"SQL validator fixes: {fixes}")
+        if errors:
+            logging.debug(f"SQL validator errors: {errors}")
+        return {"sql": fixed_sql, "fixes": fixes, "errors": errors}
+
+
+# Build the validator from SQL_VALIDATOR_* environment variables, or return None if disabled
+def sql_validator_from_env() -> Optional[SQLValidator]:
+    if os.environ.get("SQL_VALIDATOR", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return SQLValidator(max_edit_distance=int(os.environ.get("SQL_VALIDATOR_MAX_EDIT_DISTANCE", 2)))
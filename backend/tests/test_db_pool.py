@@ -0,0 +1,96 @@
+import unittest
+from unittest import mock
+
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+from db_pool import PostgresPool
+
+
+# Connection double that keeps SET statement_timeout per session and undoes uncommitted SETs on rollback
+class FakeConnection:
+    def __init__(self):
+        self.autocommit = True
+        self.closed = 0
+        self.info = mock.Mock(transaction_status=TRANSACTION_STATUS_IDLE)
+        self.committed_timeout = None
+        self.timeout = None
+
+    def set_session(self, readonly=None, autocommit=None):
+        self.autocommit = autocommit
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, statement):
+                if statement.startswith("SET statement_timeout"):
+                    connection.timeout = int(statement.rsplit(" ", 1)[1])
+                    if connection.autocommit:
+                        connection.committed_timeout = connection.timeout
+                if not connection.autocommit:
+                    connection.info.transaction_status = TRANSACTION_STATUS_INTRANS
+        cursor = Cursor()
+        cursor.connection = self
+        return cursor
+
+    def commit(self):
+        self.committed_timeout = self.timeout
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.timeout = self.committed_timeout
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class PostgresPoolSessionTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch("db_pool.psycopg2.connect", side_effect=lambda **params: FakeConnection())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_session_timeout_survives_checkouts_without_autocommit(self):
+        pool = PostgresPool({}, autocommit=False, statement_timeout_ms=10000)
+        conn = pool.getconn()
+        self.assertEqual(conn.info.transaction_status, TRANSACTION_STATUS_IDLE)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        pool.putconn(conn)
+
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(conn.timeout, 10000)
+
+    def test_override_is_restored_and_left_idle_without_autocommit(self):
+        pool = PostgresPool({}, autocommit=False, statement_timeout_ms=10000)
+        conn = pool.getconn()
+        with conn.cursor() as cursor:
+            pool.set_statement_timeout(cursor, 2000)
+            cursor.execute("SELECT 1")
+        conn.commit()
+        pool.putconn(conn)
+
+        self.assertEqual(conn.timeout, 10000)
+        self.assertEqual(conn.committed_timeout, 10000)
+        self.assertEqual(conn.info.transaction_status, TRANSACTION_STATUS_IDLE)
+
+    def test_override_is_restored_with_autocommit(self):
+        pool = PostgresPool({}, statement_timeout_ms=10000)
+        conn = pool.getconn()
+        with conn.cursor() as cursor:
+            pool.set_statement_timeout(cursor, 2000)
+        pool.putconn(conn)
+
+        self.assertEqual(conn.timeout, 10000)
+        self.assertEqual(conn.info.transaction_status, TRANSACTION_STATUS_IDLE)
+
+
+if __name__ == "__main__":
+    unittest.main()
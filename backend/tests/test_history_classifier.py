@@ -0,0 +1,33 @@
+import json
+import os
+import tempfile
+import unittest
+
+from history_classifier import HOLDOUT_LABELS_PATH, TUNING_LABELS_PATH, evaluate, log_history_decision
+
+
+class HistoryClassifierEvaluationTest(unittest.TestCase):
+    def test_holdout_set_is_separate_from_the_tuning_set(self):
+        def queries(path):
+            with open(path) as f:
+                return {json.loads(line)["query"].lower() for line in f if line.strip()}
+        self.assertFalse(queries(HOLDOUT_LABELS_PATH) & queries(TUNING_LABELS_PATH))
+
+    def test_logged_llm_decisions_are_a_labelled_set(self):
+        history = [{"query": "How many goals did Connor McDavid score?", "response": "64."}]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "history_log.jsonl")
+            log_history_decision(path, "What about Leon Draisaitl?", history, True, True)
+            log_history_decision(path, "Who won the Stanley Cup in 2019?", history, False, None)
+            log_history_decision(path, "How about the Leafs?", history, False, True)
+            report = evaluate(path)
+
+        self.assertEqual(report["total"], 3)
+        self.assertEqual(report["true_positive"], 1)
+        self.assertEqual(report["true_negative"], 1)
+        self.assertEqual(report["false_positive"], 1)
+        self.assertEqual(report["error_rate_when_decided"], round(1 / 3, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
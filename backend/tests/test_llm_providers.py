@@ -0,0 +1,84 @@
+import json
+import unittest
+
+from llm_providers import OllamaProvider
+from ollama_client import OllamaClient
+
+
+class StubResponse:
+    def __init__(self, body=None, lines=None):
+        self.status_code = 200
+        self.text = ""
+        self._body = body
+        self._lines = lines or []
+
+    def json(self):
+        return self._body
+
+    def iter_lines(self):
+        return iter(json.dumps(line).encode() for line in self._lines)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class StubSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.payloads = []
+
+    def post(self, url, json=None, timeout=None, stream=False):
+        self.payloads.append(json)
+        return self.responses.pop(0)
+
+
+def chat_body(content, load_seconds, **durations):
+    body = {"message": {"content": content}, "done": True, "prompt_eval_count": 10, "eval_count": 5,
+            "load_duration": int(load_seconds * 1e9)}
+    body.update({name: int(seconds * 1e9) for name, seconds in durations.items()})
+    return body
+
+
+class OllamaProviderTest(unittest.TestCase):
+    def provider(self, responses):
+        client = OllamaClient(model="llama3", keep_alive="30m")
+        client.session = StubSession(responses)
+        return OllamaProvider(client)
+
+    def test_chat_timings_and_reloads_are_recorded(self):
+        provider = self.provider([
+            StubResponse(chat_body("first", 4.0, prompt_eval_duration=0.5, eval_duration=1.0, total_duration=5.5)),
+            StubResponse(chat_body("second", 0.01, prompt_eval_duration=0.1, eval_duration=0.4, total_duration=0.6))
+        ])
+        self.assertEqual(provider.complete([{"role": "user", "content": "hi"}], "gpt-4o-mini", 50), "first")
+        self.assertEqual(provider.complete([{"role": "user", "content": "hi"}], "gpt-4o-mini", 50), "second")
+
+        stats = provider.stats()
+        self.assertEqual(stats["responses"], 2)
+        self.assertEqual(stats["reloads"], 1)
+        self.assertEqual(stats["load_seconds"], 4.01)
+        self.assertEqual(stats["max_load_seconds"], 4.0)
+        self.assertEqual(stats["eval_seconds"], 1.4)
+        self.assertEqual(stats["total_seconds"], 6.1)
+        self.assertEqual(stats["prompt_tokens"], 20)
+        self.assertEqual(provider.client.session.payloads[0]["model"], "llama3")
+
+    def test_streamed_chat_records_timings_from_the_final_chunk(self):
+        provider = self.provider([StubResponse(lines=[
+            {"message": {"content": "Hello "}, "done": False},
+            {"message": {"content": "there"}, "done": False},
+            chat_body("", 1.5, eval_duration=0.2)
+        ])])
+        self.assertEqual("".join(provider.stream([{"role": "user", "content": "hi"}], "gpt-4o-mini", 50)), "Hello there")
+
+        stats = provider.stats()
+        self.assertEqual(stats["responses"], 1)
+        self.assertEqual(stats["reloads"], 1)
+        self.assertEqual(stats["eval_seconds"], 0.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
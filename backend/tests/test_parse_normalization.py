@@ -0,0 +1,58 @@
+import os
+import unittest
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+
+from rag_openAI import normalize_parsed_query, parse_season
+
+
+def parse(**fields):
+    data = {"expanded_query": "", "hockey_related": True, "query_intent": "stats", "player_names": [],
+            "team_abbreviations": [], "required_tables": ["player_stats_regular_season"], "situation": "all",
+            "seasons": []}
+    data.update(fields)
+    return data
+
+
+class ParseSeasonTest(unittest.TestCase):
+    def test_ranges_map_to_their_start_year(self):
+        for season in (2022, "2022", "2022-23", "2022 - 2023", "2022/23", "2022/2023", "20222023", "2022 season"):
+            self.assertEqual(parse_season(season), 2022, season)
+
+    def test_values_that_are_not_seasons_are_rejected(self):
+        for season in (True, "last season", "Not specified", "22-23", "1850", ""):
+            self.assertIsNone(parse_season(season), season)
+
+    def test_normalized_seasons_are_start_years_without_duplicates(self):
+        data = normalize_parsed_query(parse(seasons=["2021-22", "2022/2023", "2022", "current"]), "query")
+        self.assertEqual(data["seasons"], [2021, 2022])
+
+
+class TableRepairTest(unittest.TestCase):
+    def repaired(self, query, **fields):
+        return normalize_parsed_query(parse(required_tables=[], expanded_query=query, **fields), query)["required_tables"]
+
+    def test_team_words_pick_team_tables_without_a_player(self):
+        self.assertEqual(self.repaired("What is the Oilers record this season?"), ["team_stats"])
+        self.assertEqual(self.repaired("Oilers home games against Calgary"), ["team_games"])
+
+    def test_team_words_do_not_override_a_named_player(self):
+        self.assertEqual(self.repaired("How many points does McDavid have for his team?", player_names=["Connor McDavid"]),
+                         ["player_stats_regular_season"])
+        self.assertEqual(self.repaired("McDavid's points in games against Calgary", player_names=["Connor McDavid"]),
+                         ["player_stats_regular_season"])
+
+    def test_playoff_wording_picks_playoff_tables(self):
+        self.assertEqual(self.repaired("McDavid playoff points", player_names=["Connor McDavid"]),
+                         ["player_stats_playoffs"])
+        self.assertEqual(self.repaired("Which goalie had the best save percentage in the playoffs?"),
+                         ["goalie_stats_playoffs"])
+
+    def test_unknown_tables_are_dropped_before_repair(self):
+        data = normalize_parsed_query(parse(required_tables=["Player_Stats_Regular_Season", "made_up_table"]), "query")
+        self.assertEqual(data["required_tables"], ["player_stats_regular_season"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+import time
+import asyncio
+import unittest
+
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCaller, is_retryable
+
+
+# Stand-in for an openai/requests error carrying an HTTP status code
+class FakeHTTPError(Exception):
+    def __init__(self, status_code: int, retry_after: str = None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": {"retry-after": retry_after} if retry_after else {}})()
+
+
+# Request callable that replays a script of outcomes: an exception to raise, a float to sleep, or a value to return
+class ScriptedRequest:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def __call__(self, timeout: float):
+        outcome = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+        self.calls += 1
+        if isinstance(outcome, BaseException):
+            raise outcome
+        if isinstance(outcome, tuple):
+            delay, value = outcome
+            time.sleep(delay)
+            return value
+        return outcome
+
+
+def make_caller(**kwargs) -> ResilientCaller:
+    options = {"default_timeout": 2, "max_retries": 2, "retry_base_seconds": 0.001, "retry_max_seconds": 0.01,
+               "breaker": CircuitBreaker(failure_threshold=2, cooldown_seconds=0.05)}
+    options.update(kwargs)
+    return ResilientCaller(**options)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def open_breaker(self, breaker: CircuitBreaker) -> None:
+        for _ in range(breaker.failure_threshold):
+            breaker.before_call()
+            breaker.record_failure()
+        self.assertEqual(breaker.stats()["state"], "open")
+
+    def test_opens_after_consecutive_failures_and_fails_fast(self):
+        breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=60)
+        self.open_breaker(breaker)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        self.assertEqual(breaker.stats()["rejected"], 1)
+
+    def test_half_open_allows_a_single_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=0.01)
+        self.open_breaker(breaker)
+        time.sleep(0.02)
+        breaker.before_call()
+        self.assertEqual(breaker.stats()["state"], "half_open")
+        with self.assertRaisesRegex(CircuitOpenError, "trial call in flight"):
+            breaker.before_call()
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=0.01)
+        self.open_breaker(breaker)
+        time.sleep(0.02)
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.stats()["state"], "open")
+
+    def test_released_trial_lets_the_next_call_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=0.01)
+        self.open_breaker(breaker)
+        time.sleep(0.02)
+        breaker.before_call()
+        breaker.release_trial()
+        breaker.before_call()
+        self.assertEqual(breaker.stats()["state"], "half_open")
+
+
+class ResilientCallerTest(unittest.TestCase):
+    def test_non_retryable_trial_failure_closes_breaker(self):
+        caller = make_caller(max_retries=0)
+        for _ in range(2):
+            with self.assertRaises(FakeHTTPError):
+                caller.call("sql", ScriptedRequest(FakeHTTPError(503)))
+        self.assertEqual(caller.breaker.stats()["state"], "open")
+
+        time.sleep(0.06)
+        with self.assertRaises(FakeHTTPError):
+            caller.call("sql", ScriptedRequest(FakeHTTPError(400)))
+        self.assertEqual(caller.breaker.stats()["state"], "closed")
+        self.assertEqual(caller.call("sql", ScriptedRequest("ok")), "ok")
+
+    def test_cancelled_trial_is_released(self):
+        caller = make_caller(max_retries=0)
+        for _ in range(2):
+            with self.assertRaises(FakeHTTPError):
+                caller.call("sql", ScriptedRequest(FakeHTTPError(503)))
+        time.sleep(0.06)
+        with self.assertRaises(KeyboardInterrupt):
+            caller.call("sql", ScriptedRequest(KeyboardInterrupt()))
+        self.assertEqual(caller.call("sql", ScriptedRequest("ok")), "ok")
+        self.assertEqual(caller.breaker.stats()["state"], "closed")
+
+    def test_retries_retryable_errors(self):
+        caller = make_caller(breaker=CircuitBreaker(failure_threshold=10))
+        request = ScriptedRequest(FakeHTTPError(429), FakeHTTPError(502), "ok")
+        self.assertEqual(caller.call("sql", request), "ok")
+        self.assertEqual(request.calls, 3)
+        stage = caller.stats()["stages"]["sql"]
+        self.assertEqual((stage["attempts"], stage["retries"], stage["failures"]), (3, 2, 2))
+
+    def test_does_not_retry_non_retryable_errors(self):
+        caller = make_caller()
+        request = ScriptedRequest(FakeHTTPError(400), "ok")
+        with self.assertRaises(FakeHTTPError):
+            caller.call("sql", request)
+        self.assertEqual(request.calls, 1)
+        self.assertEqual(caller.breaker.stats()["consecutive_failures"], 0)
+
+    def test_gives_up_after_max_retries(self):
+        caller = make_caller(max_retries=1, breaker=CircuitBreaker(failure_threshold=10))
+        request = ScriptedRequest(FakeHTTPError(500))
+        with self.assertRaises(FakeHTTPError):
+            caller.call("sql", request)
+        self.assertEqual(request.calls, 2)
+
+    def test_backoff_honours_retry_after(self):
+        caller = make_caller(retry_max_seconds=5)
+        self.assertGreaterEqual(caller._backoff(0, FakeHTTPError(429, retry_after="2")), 2)
+        self.assertLessEqual(caller._backoff(0, FakeHTTPError(429, retry_after="60")), 5)
+
+    def test_retryable_classification(self):
+        self.assertTrue(is_retryable(FakeHTTPError(429)))
+        self.assertTrue(is_retryable(FakeHTTPError(503)))
+        self.assertTrue(is_retryable(TimeoutError()))
+        self.assertFalse(is_retryable(FakeHTTPError(400)))
+        self.assertFalse(is_retryable(ValueError("bad schema")))
+
+
+class HedgingTest(unittest.TestCase):
+    def warm(self, caller: ResilientCaller, seconds: float, samples: int = 5) -> None:
+        for _ in range(samples):
+            caller.latency.record("sql", seconds)
+
+    def test_hedge_wins_when_primary_is_slow(self):
+        caller = make_caller(hedging=True, hedge_min_samples=5, hedge_workers=4)
+        self.warm(caller, 0.02)
+        request = ScriptedRequest((1.0, "slow"), (0.0, "fast"))
+        started = time.perf_counter()
+        self.assertEqual(caller.call("sql", request), "fast")
+        self.assertLess(time.perf_counter() - started, 0.5)
+        stage = caller.stats()["stages"]["sql"]
+        self.assertEqual((stage["hedges"], stage["hedge_wins"]), (1, 1))
+
+    def test_no_hedge_before_enough_samples(self):
+        caller = make_caller(hedging=True, hedge_min_samples=5, hedge_workers=4)
+        request = ScriptedRequest((0.05, "primary"))
+        self.assertEqual(caller.call("sql", request), "primary")
+        self.assertEqual(request.calls, 1)
+        self.assertEqual(caller.stats()["stages"]["sql"]["hedges"], 0)
+
+    def test_hedge_disabled_per_call(self):
+        caller = make_caller(hedging=True, hedge_min_samples=5, hedge_workers=4)
+        self.warm(caller, 0.01)
+        request = ScriptedRequest((0.05, "primary"), (0.0, "hedge"))
+        self.assertEqual(caller.call("sql", request, hedge=False), "primary")
+        self.assertEqual(request.calls, 1)
+
+    def test_async_hedge_wins_and_cancels_primary(self):
+        caller = make_caller(hedging=True, hedge_min_samples=5)
+        self.warm(caller, 0.02)
+        calls = []
+
+        async def request(timeout: float):
+            calls.append(timeout)
+            await asyncio.sleep(1.0 if len(calls) == 1 else 0.0)
+            return "slow" if len(calls) == 1 else "fast"
+
+        async def run():
+            return await caller.call_async("sql", request)
+
+        self.assertEqual(asyncio.run(run()), "fast")
+        self.assertEqual(caller.stats()["stages"]["sql"]["hedge_wins"], 1)
+
+    def test_async_non_retryable_trial_failure_closes_breaker(self):
+        caller = make_caller(max_retries=0)
+
+        async def failing(timeout: float):
+            raise FakeHTTPError(503)
+
+        async def rejected(timeout: float):
+            raise FakeHTTPError(400)
+
+        async def run():
+            for _ in range(2):
+                with self.assertRaises(FakeHTTPError):
+                    await caller.call_async("sql", failing)
+            await asyncio.sleep(0.06)
+            with self.assertRaises(FakeHTTPError):
+                await caller.call_async("sql", rejected)
+
+        asyncio.run(run())
+        self.assertEqual(caller.breaker.stats()["state"], "closed")
+
+
+if __name__ == "__main__":
+    unittest.main()
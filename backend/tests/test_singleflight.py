@@ -0,0 +1,64 @@
+import os
+import threading
+import time
+import unittest
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+
+import rag_openAI
+
+
+class CoalesceQueryTest(unittest.TestCase):
+    def setUp(self):
+        self.saved_history = list(rag_openAI.chat_history)
+        rag_openAI.chat_history.clear()
+
+    def tearDown(self):
+        rag_openAI.chat_history.clear()
+        rag_openAI.chat_history.extend(self.saved_history)
+
+    def run_concurrently(self, queries):
+        calls = []
+        release = threading.Event()
+
+        def compute(query):
+            calls.append(query)
+            release.wait(5)
+            return {"natural_language_answer": f"answer to {query}"}
+
+        results = [None] * len(queries)
+
+        def worker(index, query):
+            results[index] = rag_openAI.coalesce_query(query, compute)
+
+        threads = [threading.Thread(target=worker, args=(index, query)) for index, query in enumerate(queries)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return calls, results
+
+    def test_identical_questions_after_an_answer_share_one_run(self):
+        rag_openAI.update_chat_history("Who leads the league in goals?", "Auston Matthews.")
+
+        calls, results = self.run_concurrently(["How many points does McDavid have?",
+                                                "how many points does mcdavid have"])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results[0], results[1])
+
+    def test_different_history_gets_a_different_flight(self):
+        key_without_history = rag_openAI.flight_key("and his assists?")
+        rag_openAI.update_chat_history("How many goals does McDavid have?", "64.")
+        key_after_mcdavid = rag_openAI.flight_key("and his assists?")
+        rag_openAI.chat_history.clear()
+        rag_openAI.update_chat_history("How many goals does Draisaitl have?", "52.")
+
+        self.assertNotEqual(key_without_history, key_after_mcdavid)
+        self.assertNotEqual(key_after_mcdavid, rag_openAI.flight_key("and his assists?"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from sql_examples import SQLExampleStore
+
+
+class SQLExampleStoreTest(unittest.TestCase):
+    def test_full_store_evicts_oldest_learned_example(self):
+        store = SQLExampleStore(max_examples=3)
+        store.add("most goals by a defenseman", ["player_stats_regular_season"], "SELECT 1", source="seed")
+        for index in range(4):
+            store.learn(f"learned question {index}", [], f"SELECT {index}")
+
+        questions = [example["question"] for example in store.search("learned question goals defenseman", k=10)]
+        self.assertIn("most goals by a defenseman", questions)
+        self.assertEqual(sorted(q for q in questions if q.startswith("learned")), ["learned question 2", "learned question 3"])
+        self.assertEqual(store.stats()["evicted"], 2)
+        self.assertEqual(store._total_length, sum(example["length"] for example in store._examples))
+
+    def test_store_of_seeds_refuses_learned_examples(self):
+        store = SQLExampleStore(max_examples=1)
+        store.add("seed question", [], "SELECT 1", source="seed")
+        store.learn("learned question", [], "SELECT 2")
+        self.assertEqual(store.stats()["examples"], 1)
+        self.assertEqual(store.stats()["learned"], 0)
+
+    def test_evicted_question_can_be_learned_again(self):
+        store = SQLExampleStore(max_examples=1)
+        store.learn("first question", [], "SELECT 1")
+        store.learn("second question", [], "SELECT 2")
+        store.learn("first question", [], "SELECT 1")
+        self.assertEqual([example["question"] for example in store.search("first question")], ["first question"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import unittest
+
+from sql_guard import SQLGuard, QueryRejectedError
+
+
+def plan(cost, rows, node="Seq Scan"):
+    return {"cost": float(cost), "rows": rows, "node": node}
+
+
+# Returns a canned plan per query and remembers which queries were explained
+class StubExplain:
+    def __init__(self, plans):
+        self.plans = plans
+        self.queries = []
+
+    def __call__(self, sql):
+        self.queries.append(sql)
+        return self.plans[sql]
+
+
+# asyncpg-style connection answering EXPLAIN (FORMAT JSON) from the same canned plans
+class StubConnection:
+    def __init__(self, plans):
+        self.plans = plans
+
+    async def fetchval(self, statement, *args):
+        sql = statement[len("EXPLAIN (FORMAT JSON) "):]
+        found = self.plans[sql]
+        return json.dumps([{"Plan": {"Total Cost": found["cost"], "Plan Rows": found["rows"], "Node Type": found["node"]}}])
+
+
+class SQLGuardTest(unittest.TestCase):
+    def setUp(self):
+        self.guard = SQLGuard(max_cost=1000, max_rows=100)
+
+    def test_cheap_small_query_passes_through(self):
+        sql = "SELECT name FROM player_stats_regular_season WHERE season = 2023"
+        explain = StubExplain({sql: plan(50, 20)})
+        decision = self.guard.review(sql, explain)
+
+        self.assertEqual(decision["sql"], sql)
+        self.assertFalse(decision["plan"]["rewritten"])
+        self.assertEqual(explain.queries, [sql])
+        self.assertEqual(self.guard.stats()["checked"], 1)
+
+    def test_large_result_without_top_level_limit_gets_a_limit(self):
+        sql = "SELECT name FROM player_stats_regular_season;"
+        limited = "SELECT * FROM (SELECT name FROM player_stats_regular_season) AS guarded_query LIMIT 100"
+        decision = self.guard.review(sql, StubExplain({sql: plan(400, 5000), limited: plan(10, 100, "Limit")}))
+
+        self.assertEqual(decision["sql"], limited)
+        self.assertTrue(decision["plan"]["rewritten"])
+        self.assertEqual(decision["plan"]["original_rows"], 5000)
+        self.assertEqual(decision["plan"]["node"], "Limit")
+        self.assertEqual(self.guard.stats()["rewritten"], 1)
+
+    def test_limit_inside_a_subquery_is_not_a_top_level_limit(self):
+        self.assertTrue(SQLGuard.has_top_level_limit("SELECT name FROM t ORDER BY name LIMIT 10"))
+        self.assertTrue(SQLGuard.has_top_level_limit("SELECT name FROM t FETCH FIRST 5 ROWS ONLY"))
+        self.assertFalse(SQLGuard.has_top_level_limit("SELECT name FROM (SELECT name FROM t LIMIT 10) s"))
+        self.assertFalse(SQLGuard.has_top_level_limit("SELECT 'limit' AS word FROM t"))
+
+        sql = "SELECT s.name FROM (SELECT name FROM t LIMIT 10) s JOIN u ON u.name = s.name"
+        limited = self.guard.limited_sql(sql)
+        decision = self.guard.review(sql, StubExplain({sql: plan(400, 5000), limited: plan(10, 100, "Limit")}))
+        self.assertEqual(decision["sql"], limited)
+
+    def test_query_with_top_level_limit_is_not_rewritten(self):
+        sql = "SELECT name FROM t LIMIT 5000"
+        explain = StubExplain({sql: plan(400, 5000)})
+        decision = self.guard.review(sql, explain)
+
+        self.assertEqual(decision["sql"], sql)
+        self.assertEqual(explain.queries, [sql])
+
+    def test_expensive_query_is_rejected_with_its_plan(self):
+        sql = "SELECT * FROM a CROSS JOIN b LIMIT 10"
+        with self.assertRaises(QueryRejectedError) as raised:
+            self.guard.review(sql, StubExplain({sql: plan(50000, 10, "Nested Loop")}))
+
+        self.assertEqual(raised.exception.plan["cost"], 50000.0)
+        self.assertEqual(raised.exception.plan["node"], "Nested Loop")
+        self.assertIn("exceeds the limit of 1000", str(raised.exception))
+        self.assertEqual(self.guard.stats()["rejected"], 1)
+
+    def test_rewritten_query_still_too_expensive_is_rejected(self):
+        sql = "SELECT * FROM a CROSS JOIN b"
+        limited = self.guard.limited_sql(sql)
+        with self.assertRaises(QueryRejectedError) as raised:
+            self.guard.review(sql, StubExplain({sql: plan(90000, 5000), limited: plan(80000, 100, "Limit")}))
+
+        self.assertTrue(raised.exception.plan["rewritten"])
+        self.assertEqual(raised.exception.plan["original_cost"], 90000.0)
+
+    def test_check_async_explains_with_asyncpg(self):
+        sql = "SELECT name FROM t"
+        limited = self.guard.limited_sql(sql)
+        conn = StubConnection({sql: plan(400, 5000), limited: plan(10, 100, "Limit")})
+        decision = asyncio.run(self.guard.check_async(conn, sql))
+
+        self.assertEqual(decision["sql"], limited)
+        self.assertTrue(decision["plan"]["rewritten"])
+
+
+if __name__ == "__main__":
+    unittest.main()
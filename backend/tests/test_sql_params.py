@@ -0,0 +1,106 @@
+import unittest
+
+import psycopg2
+
+from sql_params import PreparedStatements, bind_parameters, shape_name
+
+
+class BindParametersTest(unittest.TestCase):
+    def test_comparison_and_like_values_are_bound(self):
+        sql, params = bind_parameters("SELECT name FROM t WHERE name = 'Connor McDavid' AND team LIKE 'E%' "
+                                      "AND situation = %(situation)s", {"situation": "all", "unused": 1})
+        self.assertEqual(sql, "SELECT name FROM t WHERE name = %(p1)s AND team LIKE %(p2)s AND situation = %(situation)s")
+        self.assertEqual(params, {"p1": "Connor McDavid", "p2": "E%", "situation": "all"})
+
+    def test_percent_signs_left_in_the_sql_are_escaped(self):
+        sql, params = bind_parameters("SELECT name || ' 100%' AS label FROM t WHERE season = 2022")
+        self.assertEqual(sql, "SELECT name || ' 100%%' AS label FROM t WHERE season = %(p1)s")
+        self.assertEqual(params, {"p1": 2022})
+
+    def test_sql_without_values_is_returned_unescaped(self):
+        sql = "SELECT name || ' 100%' FROM t ORDER BY 1"
+        self.assertEqual(bind_parameters(sql), (sql, {}))
+
+    def test_doubled_quotes_are_unescaped(self):
+        sql, params = bind_parameters("SELECT name FROM t WHERE name = 'Ryan O''Reilly'")
+        self.assertEqual(sql, "SELECT name FROM t WHERE name = %(p1)s")
+        self.assertEqual(params, {"p1": "Ryan O'Reilly"})
+
+    def test_between_and_in_lists_are_bound(self):
+        sql, params = bind_parameters("SELECT name FROM t WHERE season BETWEEN 2018 AND 2022 "
+                                      "AND team IN ('EDM', 'TOR') AND goals >= 10.5")
+        self.assertEqual(sql, "SELECT name FROM t WHERE season BETWEEN %(p1)s AND %(p2)s "
+                              "AND team IN (%(p3)s, %(p4)s) AND goals >= %(p5)s")
+        self.assertEqual(params, {"p1": 2018, "p2": 2022, "p3": "EDM", "p4": "TOR", "p5": 10.5})
+
+    def test_negative_literals_are_bound(self):
+        sql, params = bind_parameters("SELECT name FROM t WHERE plusminus > -5 AND x BETWEEN -3 AND -1 "
+                                      "AND y IN (-2, 4) AND goals - 5 > 0")
+        self.assertEqual(sql, "SELECT name FROM t WHERE plusminus > %(p1)s AND x BETWEEN %(p2)s AND %(p3)s "
+                              "AND y IN (%(p4)s, %(p5)s) AND goals - 5 > %(p6)s")
+        self.assertEqual(params, {"p1": -5, "p2": -3, "p3": -1, "p4": -2, "p5": 4, "p6": 0})
+
+    def test_typed_literals_limit_and_positions_stay_inline(self):
+        sql, params = bind_parameters("SELECT name, goals FROM t WHERE gamedate > DATE '2023-01-01' "
+                                      "AND gamedate < now() - INTERVAL '1 day' AND season = 2022 "
+                                      "ORDER BY 2 DESC LIMIT 10")
+        self.assertEqual(sql, "SELECT name, goals FROM t WHERE gamedate > DATE '2023-01-01' "
+                              "AND gamedate < now() - INTERVAL '1 day' AND season = %(p1)s "
+                              "ORDER BY 2 DESC LIMIT 10")
+        self.assertEqual(params, {"p1": 2022})
+
+
+# psycopg2-style cursor that records statements and can refuse PREPARE
+class StubCursor:
+    def __init__(self, prepare_error=False):
+        self.connection = object()
+        self.prepare_error = prepare_error
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        if sql.startswith("PREPARE") and self.prepare_error:
+            raise psycopg2.ProgrammingError("could not determine data type of parameter $1")
+        self.statements.append((sql, params))
+
+
+class PreparedStatementsTest(unittest.TestCase):
+    sql = "SELECT name FROM t WHERE season = %(p1)s"
+
+    def test_recurring_shape_is_prepared_once_then_reused(self):
+        statements = PreparedStatements(min_uses=2)
+        cursor = StubCursor()
+        name = shape_name(self.sql)
+        for season in (2021, 2022, 2023):
+            statements.execute(cursor, self.sql, {"p1": season})
+
+        self.assertEqual(cursor.statements, [
+            (self.sql, {"p1": 2021}),
+            (f"PREPARE {name} AS SELECT name FROM t WHERE season = $1", None),
+            (f"EXECUTE {name} (%s)", [2022]),
+            (f"EXECUTE {name} (%s)", [2023])
+        ])
+        self.assertEqual(statements.stats()["prepared"], 1)
+        self.assertEqual(statements.stats()["reused"], 1)
+
+    def test_shape_that_cannot_be_prepared_runs_unprepared(self):
+        statements = PreparedStatements(min_uses=1)
+        cursor = StubCursor(prepare_error=True)
+        statements.execute(cursor, self.sql, {"p1": 2022})
+        statements.execute(cursor, self.sql, {"p1": 2023})
+
+        self.assertEqual(cursor.statements, [(self.sql, {"p1": 2022}), (self.sql, {"p1": 2023})])
+        self.assertEqual(statements.stats()["unpreparable"], 1)
+
+    def test_each_connection_prepares_its_own_statement(self):
+        statements = PreparedStatements(min_uses=1)
+        first, second = StubCursor(), StubCursor()
+        statements.execute(first, self.sql, {"p1": 2022})
+        statements.execute(second, self.sql, {"p1": 2022})
+        statements.forget(first.connection)
+
+        self.assertTrue(second.statements[0][0].startswith("PREPARE"))
+        self.assertEqual(statements.stats()["connections"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
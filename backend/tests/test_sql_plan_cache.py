@@ -0,0 +1,48 @@
+import unittest
+
+from sql_plan_cache import SQLPlanCache, canonical_intent
+
+
+def analyzed(expanded_query, **fields):
+    data = {
+        "expanded_query": expanded_query,
+        "required_tables": ["player_stats_regular_season"],
+        "player_names": [],
+        "team_abbreviations": [],
+        "seasons": [2022],
+        "situation": "all"
+    }
+    data.update(fields)
+    return data
+
+
+class SQLPlanCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = SQLPlanCache(max_entries=8)
+        self.cache.record_result(analyzed("Who scored the most goals in the 2022 season?"),
+                                 {"success": True, "executed_sql": "SELECT name, i_f_goals FROM player_stats_regular_season"})
+
+    def test_paraphrase_hits_the_same_entry(self):
+        sql_query = self.cache.get(analyzed("Which players led the league in goals during 2022"))
+        self.assertEqual(sql_query, "SELECT name, i_f_goals FROM player_stats_regular_season")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_different_stat_misses(self):
+        self.assertIsNone(self.cache.get(analyzed("Who had the most assists in the 2022 season?")))
+
+    def test_different_ordering_and_limit_miss(self):
+        self.assertIsNone(self.cache.get(analyzed("Who scored the fewest goals in the 2022 season?")))
+        self.assertIsNone(self.cache.get(analyzed("Top 5 goal scorers in the 2022 season")))
+
+    def test_player_order_does_not_matter(self):
+        first = canonical_intent(analyzed("Compare goals", player_names=["Connor McDavid", "Leon Draisaitl"]))
+        second = canonical_intent(analyzed("compare goals", player_names=["leon draisaitl", "connor  mcdavid"]))
+        self.assertEqual(first, second)
+
+    def test_wording_without_a_known_stat_keeps_its_text(self):
+        self.assertNotEqual(canonical_intent(analyzed("Who has the best corsi for percentage")),
+                            canonical_intent(analyzed("Who has the best fenwick for percentage")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import time
+import unittest
+
+from sql_result_cache import SQLResultCache, make_result_key, reads_final_seasons_only, result_size
+
+
+def result(name, rows=1):
+    return {"column_names": ["name", "goals"], "results": [{"name": name, "goals": index} for index in range(rows)],
+            "row_count": rows, "truncated": False}
+
+
+class ReadsFinalSeasonsOnlyTest(unittest.TestCase):
+    def assertFinal(self, sql, params=None):
+        self.assertTrue(reads_final_seasons_only(sql, params, 2023), sql)
+
+    def assertNotFinal(self, sql, params=None):
+        self.assertFalse(reads_final_seasons_only(sql, params, 2023), sql)
+
+    def test_closed_season_filters_are_final(self):
+        self.assertFinal("SELECT name FROM player_stats_regular_season WHERE season = 2022")
+        self.assertFinal("SELECT name FROM t WHERE season IN (2020, 2021) AND situation = 'all'")
+        self.assertFinal("SELECT name FROM t WHERE season BETWEEN 2018 AND 2022")
+        self.assertFinal("SELECT name FROM t WHERE season <= 2023")
+        self.assertFinal("SELECT name FROM t WHERE season = ANY(%(seasons)s)", {"seasons": [2021, 2022]})
+        self.assertFinal("SELECT name FROM t WHERE season = %(season)s ORDER BY season", {"season": 2022})
+
+    def test_open_or_unknown_season_filters_are_not_final(self):
+        self.assertNotFinal("SELECT name FROM t WHERE season > 2020")
+        self.assertNotFinal("SELECT name FROM t WHERE season >= 2020")
+        self.assertNotFinal("SELECT name FROM t WHERE season NOT IN (2024)")
+        self.assertNotFinal("SELECT name FROM t WHERE season = 2022 OR name = 'Connor McDavid'")
+        self.assertNotFinal("SELECT name FROM t WHERE season = (SELECT max(season) FROM t)")
+        self.assertNotFinal("SELECT name FROM t WHERE season IN (SELECT season FROM u)")
+        self.assertNotFinal("SELECT name FROM t WHERE 2022 = season")
+
+    def test_current_season_or_no_filter_is_not_final(self):
+        self.assertNotFinal("SELECT name FROM t WHERE season = 2024")
+        self.assertNotFinal("SELECT name FROM t WHERE season = ANY(%(seasons)s)", {"seasons": [2022, 2024]})
+        self.assertNotFinal("SELECT name, season FROM t ORDER BY season")
+
+
+class SQLResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = SQLResultCache(current_ttl_seconds=300, last_final_season=2023)
+
+    def store(self, sql, value, generation=None):
+        key = make_result_key(sql)
+        self.cache.set(key, sql, None, value, self.cache.generation if generation is None else generation)
+        return key
+
+    def test_normalized_sql_shares_a_key(self):
+        self.assertEqual(make_result_key("SELECT name FROM t WHERE season = 2022;"),
+                         make_result_key("select  name\nfrom T where SEASON = 2022"))
+        self.assertNotEqual(make_result_key("SELECT name FROM t WHERE name = 'A'"),
+                            make_result_key("SELECT name FROM t WHERE name = 'a'"))
+
+    def test_data_version_change_drops_entries(self):
+        self.cache.set_version("100:9")
+        key = self.store("SELECT name FROM t WHERE season = 2022", result("McDavid"))
+        self.cache.set_version("100:9")
+        self.assertIsNotNone(self.cache.get(key))
+
+        self.cache.set_version("250:9")
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(self.cache.stats()["invalidations"], 1)
+
+    def test_store_from_a_stale_generation_is_ignored(self):
+        generation = self.cache.generation
+        self.cache.clear()
+        key = self.store("SELECT name FROM t WHERE season = 2022", result("McDavid"), generation)
+
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(self.cache.stats()["stores"], 0)
+
+    def test_byte_bound_evicts_least_recently_used(self):
+        size = result_size(result("McDavid", rows=5))
+        self.cache = SQLResultCache(max_bytes=size * 2 + size // 2)
+        first = self.store("SELECT 1", result("McDavid", rows=5))
+        second = self.store("SELECT 2", result("McDavid", rows=5))
+        self.assertIsNotNone(self.cache.get(first))
+        third = self.store("SELECT 3", result("McDavid", rows=5))
+
+        self.assertIsNone(self.cache.get(second))
+        self.assertIsNotNone(self.cache.get(first))
+        self.assertIsNotNone(self.cache.get(third))
+        stats = self.cache.stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertLessEqual(stats["bytes"], stats["max_bytes"])
+
+    def test_result_larger_than_the_cache_is_not_stored(self):
+        self.cache = SQLResultCache(max_bytes=100)
+        key = self.store("SELECT 1", result("McDavid", rows=50))
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(self.cache.stats()["too_large"], 1)
+
+    def test_only_final_season_results_skip_the_ttl(self):
+        self.cache = SQLResultCache(current_ttl_seconds=0.0001, last_final_season=2023)
+        final = self.store("SELECT name FROM t WHERE season = 2022", result("McDavid"))
+        current = self.store("SELECT name FROM t WHERE season = 2024", result("McDavid"))
+        time.sleep(0.01)
+
+        self.assertIsNotNone(self.cache.get(final))
+        self.assertIsNone(self.cache.get(current))
+        self.assertEqual(self.cache.stats()["final_season_stores"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+
+from sql_templates import build_template_sql, display_sql
+
+
+def analyzed(expanded_query, tables, **fields):
+    data = {
+        "hockey_related": True,
+        "query_intent": "stats",
+        "expanded_query": expanded_query,
+        "required_tables": tables,
+        "player_names": [],
+        "team_abbreviations": [],
+        "seasons": [],
+        "situation": "all"
+    }
+    data.update(fields)
+    return data
+
+
+class BuildTemplateSQLTest(unittest.TestCase):
+    def test_player_season_totals(self):
+        plan = build_template_sql(analyzed("How many hits did Connor McDavid have in 2022?",
+                                           ["player_stats_regular_season"], player_names=["Connor  McDavid"],
+                                           seasons=[2022]))
+        self.assertEqual(plan["template"], "player_season_totals")
+        self.assertEqual(plan["sql"],
+                         "SELECT name, team, season, games_played, i_f_goals AS goals, "
+                         "(i_f_primaryassists + i_f_secondaryassists) AS assists, i_f_points AS points, "
+                         "i_f_shotsongoal AS shots, ROUND(icetime / 60.0, 1) AS icetime_minutes, i_f_hits AS hits "
+                         "FROM player_stats_regular_season WHERE situation = %(situation)s AND "
+                         "season = ANY(%(seasons)s) AND lower(name) = ANY(%(player_names)s) "
+                         "ORDER BY name, season LIMIT 50")
+        self.assertEqual(plan["params"], {"player_names": ["connor mcdavid"], "situation": "all", "seasons": [2022]})
+
+    def test_player_leaderboard(self):
+        plan = build_template_sql(analyzed("Top 5 assist leaders for EDM in the 2023 playoffs on 5on4",
+                                           ["player_stats_playoffs"], team_abbreviations=["EDM"],
+                                           seasons=["2023"], situation="5on4"))
+        self.assertEqual(plan["template"], "player_leaderboard")
+        self.assertEqual(plan["sql"],
+                         "SELECT name, team, season, games_played, (i_f_primaryassists + i_f_secondaryassists) AS assists "
+                         "FROM player_stats_playoffs WHERE situation = %(situation)s AND season = ANY(%(seasons)s) "
+                         "AND team = ANY(%(teams)s) ORDER BY assists DESC LIMIT %(limit)s")
+        self.assertEqual(plan["params"], {"limit": 5, "situation": "5on4", "seasons": [2023], "teams": ["EDM"]})
+
+    def test_goalie_save_percentage_for_named_goalies_and_leaders(self):
+        named = build_template_sql(analyzed("What was Igor Shesterkin's save percentage?",
+                                            ["goalie_stats_regular_season"], player_names=["Igor Shesterkin"]))
+        self.assertEqual(named["template"], "goalie_save_percentage")
+        self.assertIn("lower(name) = ANY(%(player_names)s) ORDER BY name, season LIMIT 50", named["sql"])
+        self.assertEqual(named["params"], {"situation": "all", "player_names": ["igor shesterkin"]})
+
+        leaders = build_template_sql(analyzed("Which goalies had the best save percentage in 2022?",
+                                              ["goalie_stats_regular_season"], seasons=[2022]))
+        self.assertTrue(leaders["sql"].endswith("AND ongoal >= %(min_shots)s ORDER BY save_percentage DESC LIMIT %(limit)s"))
+        self.assertEqual(leaders["params"], {"situation": "all", "seasons": [2022], "min_shots": 300, "limit": 10})
+
+    def test_team_record(self):
+        plan = build_template_sql(analyzed("What was the Oilers' playoff record in 2022?", ["team_games"],
+                                           team_abbreviations=["EDM"], seasons=[2022], situation="5on5"))
+        self.assertEqual(plan["template"], "team_record")
+        self.assertIn("FROM team_games WHERE situation = 'all' AND team = ANY(%(teams)s) AND "
+                      "playoffgame = %(playoff_game)s AND season = ANY(%(seasons)s) GROUP BY team, season", plan["sql"])
+        self.assertIn("AS ties", plan["sql"])
+        self.assertEqual(plan["params"], {"teams": ["EDM"], "playoff_game": 1, "seasons": [2022]})
+
+    def test_non_matching_shapes_return_none(self):
+        cases = [
+            analyzed("Who won the Stanley Cup?", [], query_intent="general"),
+            analyzed("How many goals", ["player_stats_regular_season"], hockey_related=False),
+            # Two tables need a join, which no template writes
+            analyzed("Goals by Connor McDavid", ["player_stats_regular_season", "player_stats_playoffs"],
+                     player_names=["Connor McDavid"]),
+            # A leaderboard needs exactly one stat
+            analyzed("Most goals and assists", ["player_stats_regular_season"]),
+            analyzed("Who leads the league?", ["player_stats_regular_season"]),
+            # No named player and no ranking
+            analyzed("Show player goals", ["player_stats_regular_season"]),
+            analyzed("Shesterkin's goals against", ["goalie_stats_regular_season"], player_names=["Igor Shesterkin"]),
+            analyzed("Oilers record", ["team_games"]),
+        ]
+        for case in cases:
+            self.assertIsNone(build_template_sql(case), case["expanded_query"])
+
+    def test_display_sql_fills_in_values(self):
+        self.assertEqual(display_sql("SELECT 1 WHERE name = ANY(%(names)s) AND season = %(season)s",
+                                     {"names": ["o'reilly"], "season": 2022}),
+                         "SELECT 1 WHERE name = ANY(ARRAY['o''reilly']) AND season = 2022")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from sql_validator import SQLValidator
+
+
+class SQLValidatorRewriteTest(unittest.TestCase):
+    def setUp(self):
+        self.validator = SQLValidator(catalog={
+            "goalie_stats_regular_season": {"playerid", "name", "season", "goals", "ongoal", "situation"},
+            "goalie_team_tenures": {"player_id", "name", "team", "games_played"},
+            "ambiguous": {"player_id", "playerid", "name"},
+            "player_stats_regular_season": {"name", "season", "i_f_primaryassists", "i_f_secondaryassists", "i_f_points"}
+        })
+
+    def test_existing_columns_are_left_alone(self):
+        for sql in ('SELECT playerid FROM goalie_stats_regular_season',
+                    'SELECT "playerid", name FROM goalie_stats_regular_season',
+                    'SELECT g.playerid, t.player_id FROM goalie_stats_regular_season g '
+                    'JOIN goalie_team_tenures t ON t.player_id = g.playerid'):
+            report = self.validator.validate(sql)
+            self.assertEqual((report["sql"], report["fixes"], report["errors"]), (sql, [], []))
+
+    def test_missing_column_with_single_match_is_rewritten(self):
+        report = self.validator.validate("SELECT t.playerid FROM goalie_team_tenures t")
+        self.assertEqual(report["sql"], "SELECT t.player_id FROM goalie_team_tenures t")
+        self.assertEqual(report["fixes"][0]["kind"], "underscore")
+
+    def test_ambiguous_underscore_match_is_not_rewritten(self):
+        report = self.validator.validate("SELECT player__id FROM ambiguous")
+        self.assertEqual(report["sql"], "SELECT player__id FROM ambiguous")
+        self.assertEqual(report["fixes"], [])
+        self.assertEqual(len(report["errors"]), 1)
+
+    def test_misspelling_is_rewritten_to_unique_nearest_column(self):
+        report = self.validator.validate("SELECT ongoals FROM goalie_stats_regular_season")
+        self.assertEqual(report["sql"], "SELECT ongoal FROM goalie_stats_regular_season")
+
+    def test_aliased_select_item_keeps_its_column_name(self):
+        report = self.validator.validate("SELECT name, assists FROM player_stats_regular_season ORDER BY assists DESC")
+        self.assertEqual(report["sql"], "SELECT name, (i_f_primaryassists + i_f_secondaryassists) AS assists "
+                                        "FROM player_stats_regular_season "
+                                        "ORDER BY (i_f_primaryassists + i_f_secondaryassists) DESC")
+
+        report = self.validator.validate("SELECT p.name, p.assists FROM player_stats_regular_season p")
+        self.assertEqual(report["sql"], "SELECT p.name, (p.i_f_primaryassists + p.i_f_secondaryassists) AS assists "
+                                        "FROM player_stats_regular_season p")
+
+    def test_alias_inside_an_expression_or_with_its_own_label_gets_no_extra_label(self):
+        report = self.validator.validate("SELECT name, assists AS a, assists * 2 FROM player_stats_regular_season")
+        self.assertEqual(report["sql"], "SELECT name, (i_f_primaryassists + i_f_secondaryassists) AS a, "
+                                        "(i_f_primaryassists + i_f_secondaryassists) * 2 FROM player_stats_regular_season")
+
+    def test_unscannable_sql_is_passed_through(self):
+        sql = "SELECT (name FROM goalie_stats_regular_season"
+        self.assertEqual(self.validator.validate(sql)["sql"], sql)
+
+
+if __name__ == "__main__":
+    unittest.main()
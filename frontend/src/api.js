@@ -19,4 +19,45 @@ export const fetchQuery = async (query) => {
     console.error('Error fetching query:', error);
     throw error;
   }
-};
\ No newline at end of file
+};
+
+// Stream a query over Server-Sent Events, calling onEvent(event, data) as each stage finishes
+export const streamQuery = async (query, onEvent) => {
+  const response = await fetch(`${apiUrl}/api/query/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      'Accept': 'text/event-stream',
+    },
+    body: JSON.stringify({ query }),
+  });
+  if (!response.ok || !response.body) {
+    throw new Error('Network response was not ok');
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = 'message';
+      let data = '';
+      rawEvent.split('\n').forEach((line) => {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      });
+      if (data) onEvent(event, JSON.parse(data));
+
+      boundary = buffer.indexOf('\n\n');
+    }
+  }
+};
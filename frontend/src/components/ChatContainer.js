@@ -1,27 +1,68 @@
 import React, { useState } from 'react';
 import QueryInput from './QueryInput';
-import axios from 'axios';
 import { marked } from 'marked';
-
-// Add this line at the top of your file
-const apiUrl = process.env.REACT_APP_API_URL || 'http://localhost:5000';
+import { streamQuery } from '../api';
 
 function ChatContainer() {
   const [messages, setMessages] = useState([]);
   const [isTyping, setIsTyping] = useState(false);
+  const [status, setStatus] = useState('Analyzing query...');
 
   const addMessage = (sender, content) => {
     setMessages(prevMessages => [...prevMessages, { sender, content }]);
   };
 
+  // Replace the content of the most recent AI message
+  const setLastAiMessage = (updateContent) => {
+    setMessages(prevMessages => {
+      const lastIndex = prevMessages.length - 1;
+      if (lastIndex < 0 || prevMessages[lastIndex].sender !== 'ai') {
+        return [...prevMessages, { sender: 'ai', content: updateContent('') }];
+      }
+      const updated = [...prevMessages];
+      updated[lastIndex] = { ...updated[lastIndex], content: updateContent(updated[lastIndex].content) };
+      return updated;
+    });
+  };
+
   const handleQuery = async (query) => {
     addMessage('user', query);
+    setStatus('Analyzing query...');
     setIsTyping(true);
+    let answerStarted = false;
+    let finished = false;
     try {
-      // Update this line to use the apiUrl
-      const response = await axios.post(`${apiUrl}/api/query`, { query });
+      await streamQuery(query, (event, data) => {
+        if (event === 'intent') {
+          setStatus(data.query_intent === 'stats' ? 'Generating SQL...' : 'Writing answer...');
+        } else if (event === 'sql') {
+          setStatus('Fetching stats...');
+        } else if (event === 'results') {
+          setStatus(`Found ${data.row_count} rows. Writing answer...`);
+        } else if (event === 'answer') {
+          if (!answerStarted) {
+            answerStarted = true;
+            setIsTyping(false);
+            addMessage('ai', data.text);
+          } else {
+            setLastAiMessage(content => content + data.text);
+          }
+        } else if (event === 'done') {
+          finished = true;
+          setIsTyping(false);
+          if (answerStarted) {
+            setLastAiMessage(() => data.natural_language_answer);
+          } else {
+            addMessage('ai', data.natural_language_answer);
+          }
+        } else if (event === 'error') {
+          setStatus('Could not fetch stats. Writing answer...');
+        }
+      });
       setIsTyping(false);
-      addMessage('ai', response.data.natural_language_answer);
+      if (!finished && !answerStarted) {
+        addMessage('ai', 'Sorry, there was an error processing your query.');
+      }
     } catch (error) {
       setIsTyping(false);
       addMessage('ai', `An error occurred: ${error.message}`);
@@ -48,7 +89,7 @@ function ChatContainer() {
         ))}
       </div>
       {isTyping && (
-        <div className="text-sm text-gray-300 mb-2 px-4">Analyzing query...</div>
+        <div className="text-sm text-gray-300 mb-2 px-4">{status}</div>
       )}
       <div className="p-4 bg-gray-800">
         <QueryInput onSubmit={handleQuery} />